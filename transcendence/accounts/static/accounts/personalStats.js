@@ -50,10 +50,13 @@ async function generateTable(navTab, tableHeaders, game) {
 
 	let tbody = document.createElement("tbody");
 
+	showStatsSummary(navTab, game);
 	if (game === "pong")
 		parsePongScores(tbody);
-	else
+	else {
 		parseTetrisScores(tbody);
+		drawRatingChart(navTab);
+	}
 
 	table.appendChild(tbody);
 	navTab.appendChild(table);
@@ -64,6 +67,94 @@ function destroyTable() {
 	if (existingTable) {
 		existingTable.remove();
 	}
+	destroyChart();
+	destroyStatsSummary();
+}
+
+// Shows the user's totals for the game, read from their stats row on the server.
+async function showStatsSummary(navTab, game) {
+	let stats = await apiRequest("/stats", "GET", JWTs, null);
+	// The user may have switched tabs while the request was running.
+	let gameNav = document.getElementById(game === "pong" ? "pongStats" : "tetrisStats");
+	if (!stats || !gameNav.classList.contains("active"))
+		return;
+	stats = stats[game];
+
+	let parts = [
+		"games: " + stats.games,
+		"wins: " + stats.wins,
+		"losses: " + stats.losses,
+		"best score: " + stats.best_score,
+	];
+	if (game === "tetris")
+		parts.push("average lines: " + stats.average_lines, "average level: " + stats.average_level);
+	parts.push("win streak: " + stats.win_streak + " (best " + stats.best_win_streak + ")");
+
+	destroyStatsSummary();
+	let summary = document.createElement("p");
+	summary.id = "statsSummary";
+	summary.classList.add("mt-3");
+	summary.textContent = parts.join(" | ");
+	navTab.prepend(summary);
+}
+
+function destroyStatsSummary() {
+	let existingSummary = document.getElementById("statsSummary");
+	if (existingSummary) {
+		existingSummary.remove();
+	}
+}
+
+// Draws the Tetris rating per day: a bar from the day's low to its high, and a line through the closing ratings.
+async function drawRatingChart(navTab) {
+	let history = await apiRequest("/tetris/rating_history?days=365", "GET", JWTs, null);
+	// The user may have switched tabs while the request was running.
+	let tetrisNav = document.getElementById("tetrisStats");
+	if (!history || !history.points || history.points.length === 0 || !tetrisNav.classList.contains("active"))
+		return;
+	let points = history.points;
+
+	destroyChart();
+	let canvas = document.createElement("canvas");
+	canvas.id = "ratingChart";
+	canvas.width = 600;
+	canvas.height = 200;
+	canvas.classList.add("mt-3");
+	navTab.prepend(canvas);
+
+	let ctx = canvas.getContext("2d");
+	let low = Math.min(...points.map(point => point.low));
+	let high = Math.max(...points.map(point => point.high));
+	let pad = 24;
+	let x = i => pad + (points.length > 1 ? i * (canvas.width - 2 * pad) / (points.length - 1) : (canvas.width - 2 * pad) / 2);
+	let y = rating => canvas.height - pad - (high > low ? (rating - low) / (high - low) : 0.5) * (canvas.height - 2 * pad);
+
+	ctx.strokeStyle = "rgba(255, 255, 255, 0.4)";
+	points.forEach((point, i) => {
+		ctx.beginPath();
+		ctx.moveTo(x(i), y(point.low));
+		ctx.lineTo(x(i), y(point.high));
+		ctx.stroke();
+	});
+
+	ctx.strokeStyle = "#ffffff";
+	ctx.beginPath();
+	points.forEach((point, i) => i ? ctx.lineTo(x(i), y(point.close)) : ctx.moveTo(x(i), y(point.close)));
+	ctx.stroke();
+
+	ctx.fillStyle = "#ffffff";
+	ctx.font = "12px sans-serif";
+	ctx.fillText(high, 0, pad - 8);
+	ctx.fillText(low, 0, canvas.height - 6);
+	ctx.fillText(points[0].day, pad, canvas.height - 6);
+	ctx.fillText(points[points.length - 1].day, canvas.width - pad - 70, canvas.height - 6);
+}
+
+function destroyChart() {
+	let existingChart = document.getElementById("ratingChart");
+	if (existingChart) {
+		existingChart.remove();
+	}
 }
 
 async function parsePongScores(tableBody)
@@ -88,10 +179,14 @@ async function parsePongScores(tableBody)
 	})
 }
 
-async function parseTetrisScores(tableBody) {
-	let scoreObject = await apiRequest("/tetris/get_scores", "GET", JWTs, null);
+// Appends one page of Tetris games to the table, and a button loading the next page if there is one.
+async function parseTetrisScores(tableBody, cursor) {
+	let endpoint = "/tetris/get_scores" + (cursor ? "?cursor=" + encodeURIComponent(cursor) : "");
+	let page = await apiRequest(endpoint, "GET", JWTs, null);
+	if (!page)
+		return;
 
-	scoreObject.forEach(scoreData => {
+	page.scores.forEach(scoreData => {
 		let game = formatTimestamp(scoreData.timestamp);
 		let level = scoreData.level;
 		let linesCleared = scoreData.lines_cleared;
@@ -106,9 +201,23 @@ async function parseTetrisScores(tableBody) {
         });
 
 		tableBody.appendChild(row);
-
-		console.log(scoreData.gameid);
 	})
+
+	if (page.next) {
+		let row = document.createElement("tr");
+		let cell = document.createElement("td");
+		cell.colSpan = 4;
+		let button = document.createElement("button");
+		button.classList.add("btn");
+		button.textContent = "Load more";
+		button.addEventListener("click", () => {
+			row.remove();
+			parseTetrisScores(tableBody, page.next);
+		});
+		cell.appendChild(button);
+		row.appendChild(cell);
+		tableBody.appendChild(row);
+	}
 }
 
 function formatTimestamp(timestamp) {
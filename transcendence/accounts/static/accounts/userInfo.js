@@ -186,15 +186,13 @@ async function fillInCurrentUserInfo() {
 }
 
 async function updateMatchHistory() {
-    const pongScores = await apiRequest('/pong/score', 'GET', JWTs);
-    
-    // Calculate Pong wins and losses
-    let pongWins = pongScores.filter(game => game.my_score > game.their_score).length;
-    let pongLosses = pongScores.filter(game => game.my_score < game.their_score).length;
+    // Pong wins and losses, kept up to date by the server
+    const stats = await apiRequest('/stats', 'GET', JWTs);
+    if (!stats) return;
     
     // Update the existing HTML elements
-    document.getElementById("winsCount").textContent = pongWins;
-    document.getElementById("lossesCount").textContent = pongLosses;
+    document.getElementById("winsCount").textContent = stats.pong.wins;
+    document.getElementById("lossesCount").textContent = stats.pong.losses;
 }
 
 async function updateUserAvatar() {
@@ -0,0 +1,236 @@
+import random
+import time
+import uuid
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from pong.models import PongScore, PongStats
+from pong.stats import get_pong_stats, rebuild_pong_stats, record_pong_score
+from tetris.benchmarks import BenchmarkRollback
+from tetris.models import TetrisPlayer, TetrisStats
+from tetris.scores import get_score_page, save_scores
+from tetris.serializers import TetrisPlayerSerializer
+from tetris.stats import get_tetris_stats, rebuild_tetris_stats
+from .renderers import FastJSONRenderer
+from .serializers import MeSerializer, UserSerializer, pong_score_rows
+
+User = get_user_model()
+
+
+class LegacyUserSerializer(serializers.ModelSerializer):
+    """The user serializer as it was: every field, relations nested ten levels deep."""
+    class Meta:
+        model = User
+        fields = '__all__'
+        depth = 10
+
+
+class LegacyPongScoreSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PongScore
+        fields = '__all__'
+        depth = 10
+
+
+class LegacyTetrisPlayerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TetrisPlayer
+        depth = 10
+        fields = ('user', 'matchmaking_rating')
+
+
+def _legacy_users() -> list:
+    rows = []
+    for user in LegacyUserSerializer(User.objects.all(), many=True).data:
+        user = user.copy()
+        user.pop("totpsecret")
+        user.pop("password")
+        rows.append(user)
+    return rows
+
+
+def _legacy_me(user) -> dict:
+    data = LegacyUserSerializer(user).data
+    data.pop("totpsecret")
+    data.pop("password")
+    return data
+
+
+def _measure(build, renderer, repeat: int) -> dict:
+    """Best of `repeat` runs of building an endpoint's data and rendering it."""
+    build_ms = render_ms = float("inf")
+    for _ in range(repeat):
+        connection.queries_log.clear()  # The log is capped; keep the counts exact.
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            data = build()
+            built = time.perf_counter()
+            body = renderer.render(data)
+            done = time.perf_counter()
+        build_ms = min(build_ms, (built - start) * 1000)
+        render_ms = min(render_ms, (done - built) * 1000)
+    return {"ms": round(build_ms, 2), "render_ms": round(render_ms, 2),
+            "queries": len(ctx.captured_queries), "bytes": len(body)}
+
+
+def bench_serializers(sizes=(100, 1000), blocked=1, repeat=3) -> list:
+    """
+    Builds and renders the responses of the user and score endpoints the
+    old way, through serializers of every field nested ten levels deep
+    rendered by JSONRenderer, and the new way, through the explicit-field
+    serializers and .only()/.values() querysets rendered by
+    FastJSONRenderer. `sizes` is both the number of users listed by /users
+    and the number of Pong games listed by /pong/score; the user the
+    single-object endpoints are built for has `blocked` users blocked.
+    The old way nests the block list back and forth ten levels deep, so
+    its cost grows exponentially with `blocked`, and past 9000 its query
+    count is capped by Django's query log. Runs inside a transaction that
+    is rolled back afterwards.
+
+    Returns:
+        list: One dict per endpoint and size with, for each way, the best
+        time in ms to build the data and to render it, the queries and the
+        size of the body in bytes, and the time JSONRenderer takes to
+        render the new data.
+    """
+    results = []
+    for size in sizes:
+        try:
+            with transaction.atomic():
+                prefix = f"bench_{uuid.uuid4().hex[:8]}"
+                User.objects.bulk_create([User(username=f"{prefix}_{i}", first_name=f"Player {i}") for i in range(size)])
+                users = list(User.objects.filter(username__startswith=f"{prefix}_"))
+                me = users[0]
+                me.blocked.add(*users[1:blocked + 1])
+                TetrisPlayer.objects.create(user=me, matchmaking_rating=1000)
+                PongScore.objects.bulk_create([
+                    PongScore(me=me, them=random.choice(users[1:] + [None]),
+                              my_score=random.randint(0, 11), their_score=random.randint(0, 11))
+                    for _ in range(size)
+                ])
+
+                def new_player():
+                    player = TetrisPlayer.objects.only('user', 'matchmaking_rating').get(user=me)
+                    player.user = me
+                    return TetrisPlayerSerializer(player).data
+
+                endpoints = {
+                    "users": (
+                        _legacy_users,
+                        lambda: UserSerializer(User.objects.only(*UserSerializer.Meta.fields).order_by('id'), many=True).data,
+                    ),
+                    "me": (
+                        lambda: _legacy_me(me),
+                        lambda: MeSerializer(me).data,
+                    ),
+                    "pong-scores": (
+                        lambda: LegacyPongScoreSerializer(PongScore.objects.filter(me=me), many=True).data,
+                        lambda: pong_score_rows(PongScore.objects.filter(me=me).order_by('timestamp', 'id')),
+                    ),
+                    "tetris-player": (
+                        lambda: LegacyTetrisPlayerSerializer(TetrisPlayer.objects.get(user=me)).data,
+                        new_player,
+                    ),
+                }
+                for endpoint, (old, new) in endpoints.items():
+                    before = _measure(old, JSONRenderer(), repeat)
+                    after = _measure(new, FastJSONRenderer(), repeat)
+                    row = {"endpoint": endpoint, "size": size}
+                    row.update({f"old_{key}": value for key, value in before.items()})
+                    row.update({f"new_{key}": value for key, value in after.items()})
+                    row["new_json_render_ms"] = _measure(new, JSONRenderer(), repeat)["render_ms"]
+                    results.append(row)
+                raise BenchmarkRollback()
+        except BenchmarkRollback:
+            pass
+    return results
+
+
+def _client_side_stats(user_id: int) -> None:
+    """What the stats page used to do: fetch every Pong game and every page of Tetris games, then count."""
+    pong = pong_score_rows(PongScore.objects.filter(me_id=user_id).order_by('timestamp', 'id'))
+    sum(row["my_score"] > row["their_score"] for row in pong)
+    page = get_score_page(user_id, limit=100)
+    scores = list(page["scores"])
+    while page["next"]:
+        page = get_score_page(user_id, page["next"], 100)
+        scores.extend(page["scores"])
+
+
+def bench_game_stats(game_counts=(100, 1000), opponents=5) -> list:
+    """
+    Plays `game_counts` Pong and Tetris games for one user against random
+    opponents through the incremental paths, record_pong_score per Pong
+    game and save_scores per Tetris game, then rebuilds both stats tables
+    from scratch: the rows must
+    match. Compares reading the stats rows with fetching the whole history
+    the stats page used to count on the client. Runs inside a transaction
+    that is rolled back afterwards.
+
+    Returns:
+        list: One dict per game count with the time in ms per game of the
+        incremental updates, the time in ms of the rebuild, of the stats
+        read and of the history fetch, and whether the rows matched.
+    """
+    results = []
+    for count in game_counts:
+        try:
+            with transaction.atomic():
+                prefix = f"bench_{uuid.uuid4().hex[:8]}"
+                User.objects.bulk_create([User(username=f"{prefix}_{i}") for i in range(opponents + 1)])
+                users = list(User.objects.filter(username__startswith=f"{prefix}_").order_by('id'))
+                me, others = users[0], users[1:]
+                user_ids = [user.id for user in users]
+
+                start = time.perf_counter()
+                for _ in range(count):
+                    record_pong_score(PongScore.objects.create(
+                        me=me, them=random.choice(others), my_score=random.randint(0, 5), their_score=random.randint(0, 5)
+                    ))
+                    gameid = uuid.uuid4().hex
+                    save_scores(
+                        (user.id, gameid, random.randint(0, 2000), random.randint(0, 40), random.randint(1, 10))
+                        for user in [me] + random.sample(others, random.randint(0, 2))
+                    )
+                incremental_ms = (time.perf_counter() - start) * 1000 / count
+
+                def snapshot():
+                    return (
+                        sorted(PongStats.objects.filter(user_id__in=user_ids).values_list(
+                            'user_id', 'games', 'wins', 'losses', 'best_score', 'win_streak', 'best_win_streak'
+                        )),
+                        sorted(TetrisStats.objects.filter(user_id__in=user_ids).values_list(
+                            'user_id', 'games', 'best_score', 'total_lines', 'total_level',
+                            'wins', 'losses', 'win_streak', 'best_win_streak'
+                        )),
+                    )
+
+                incremental = snapshot()
+                start = time.perf_counter()
+                rebuild_pong_stats()
+                rebuild_tetris_stats()
+                rebuild_ms = (time.perf_counter() - start) * 1000
+                rebuilt = snapshot()
+
+                start = time.perf_counter()
+                get_pong_stats(me.id), get_tetris_stats(me.id)
+                read_ms = (time.perf_counter() - start) * 1000
+
+                start = time.perf_counter()
+                _client_side_stats(me.id)
+                history_ms = (time.perf_counter() - start) * 1000
+
+                results.append({
+                    "games": count,
+                    "incremental_ms_per_game": round(incremental_ms, 3),
+                    "rebuild_ms": round(rebuild_ms, 1),
+                    "stats_read_ms": round(read_ms, 2),
+                    "history_fetch_ms": round(history_ms, 1),
+                    "rebuild_matches": incremental == rebuilt,
+                })
+                raise BenchmarkRollback()
+        except BenchmarkRollback:
+            pass
+    return results
@@ -4,20 +4,58 @@ from pong.models import PongScore
 
 User = get_user_model()
 
+class UserSummarySerializer(serializers.ModelSerializer):
+    """A user as it appears inside other objects: an opponent, a blocked user."""
+    class Meta:
+        model = User
+        fields = ('id', 'username')
+
 class UserSerializer(serializers.ModelSerializer):
+    """
+    The public profile of a user, as listed to every other user. Query
+    with .only(*UserSerializer.Meta.fields) so no other column is read.
+    """
     class Meta:
         model = User
-        fields = '__all__'
-        depth = 10
+        fields = ('id', 'username', 'first_name', 'last_name', 'avatar')
 
-    def update(self, instance, validated_data):
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        return instance
+class MeSerializer(serializers.ModelSerializer):
+    """
+    The profile of the logged in user. Only the name and email can be
+    changed through it; the avatar and block list have their own endpoints.
+    """
+    blocked = UserSummarySerializer(many=True, read_only=True)
+
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'avatar', 'date_joined', 'blocked')
+        read_only_fields = ('id', 'username', 'avatar', 'date_joined')
 
 class PongScoreSerializer(serializers.ModelSerializer):
+    them = UserSummarySerializer(read_only=True)
+
     class Meta:
         model = PongScore
-        fields = '__all__'
-        depth = 10
+        fields = ('id', 'them', 'my_score', 'their_score', 'timestamp')
+
+def pong_score_rows(scores) -> list:
+    """
+    Reads PongScore rows as PongScoreSerializer represents them, straight
+    from .values() in one query, without building a model instance per row.
+
+    Args:
+        scores (QuerySet): The PongScore rows to read.
+
+    Returns:
+        list: One dict per score.
+    """
+    return [
+        {
+            "id": row["id"],
+            "them": {"id": row["them_id"], "username": row["them__username"]} if row["them_id"] else None,
+            "my_score": row["my_score"],
+            "their_score": row["their_score"],
+            "timestamp": row["timestamp"],
+        }
+        for row in scores.values('id', 'them_id', 'them__username', 'my_score', 'their_score', 'timestamp')
+    ]
@@ -1,3 +1,111 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from tetris.leaderboard import Leaderboard
+from tetris.models import TetrisPlayer
+from .renderers import FastJSONRenderer, orjson
 
-# Create your tests here.
+User = get_user_model()
+
+
+class GameStatsTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+        self.client = APIClient(SERVER_NAME='localhost')
+
+    def _as(self, user):
+        self.client.force_authenticate(user)
+        return self.client
+
+    def test_stats_follow_saved_games(self):
+        for my_score, their_score in ((5, 3), (5, 1), (2, 5)):
+            response = self._as(self.alice).post(reverse('PongScore'), {
+                'their_username': 'bob', 'my_score': my_score, 'their_score': their_score
+            }, format='json')
+            self.assertEqual(response.status_code, 200)
+        for gameid, alice_score, bob_score in (('g1', 300, 100), ('g2', 200, 400)):
+            for user, score in ((self.alice, alice_score), (self.bob, bob_score)):
+                response = self._as(user).post(reverse('save_tetris_scores'), {
+                    'gameid': gameid, 'score': score, 'lines_cleared': 4, 'level': 2
+                }, format='json')
+                self.assertEqual(response.status_code, 200)
+
+        response = self._as(self.alice).get(reverse('game_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "pong": {"games": 3, "wins": 2, "losses": 1, "best_score": 5, "win_streak": 0, "best_win_streak": 2},
+            "tetris": {"games": 2, "wins": 1, "losses": 1, "best_score": 300, "average_lines": 4.0,
+                       "average_level": 2.0, "win_streak": 0, "best_win_streak": 1},
+        })
+
+    def test_stats_of_a_new_player_are_zero(self):
+        stats = self._as(self.bob).get(reverse('game_stats')).json()
+        self.assertEqual(set(stats), {"pong", "tetris"})
+        self.assertFalse(any(stats["pong"].values()) or any(stats["tetris"].values()))
+
+
+class ResponseShapeTests(TestCase):
+    PONG_SCORE_FIELDS = {"id", "them", "my_score", "their_score", "timestamp"}
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x', first_name='Alice')
+        self.bob = User.objects.create_user('bob', password='x')
+        self.alice.blocked.add(self.bob)
+        self.client = APIClient(SERVER_NAME='localhost')
+
+    def _as(self, user):
+        self.client.force_authenticate(user)
+        return self.client
+
+    def test_me_lists_the_profile_and_blocked_users_only(self):
+        me = self._as(self.alice).get(reverse('me')).json()
+        self.assertEqual(set(me), {"id", "username", "email", "first_name", "last_name", "avatar",
+                                   "date_joined", "blocked"})
+        self.assertEqual((me["id"], me["username"], me["first_name"]), (self.alice.id, "alice", "Alice"))
+        self.assertEqual(me["blocked"], [{"id": self.bob.id, "username": "bob"}])
+
+    def test_users_lists_the_public_fields_only(self):
+        users = self._as(self.alice).get(reverse('all_users')).json()
+        self.assertEqual(sorted(user["username"] for user in users), ["alice", "bob"])
+        for user in users:
+            self.assertEqual(set(user), {"id", "username", "first_name", "last_name", "avatar"})
+
+    def test_pong_scores_name_the_opponent_but_not_the_player(self):
+        saved = self._as(self.alice).post(reverse('PongScore'), {
+            'their_username': 'bob', 'my_score': 5, 'their_score': 3
+        }, format='json').json()
+        self.assertEqual(set(saved), self.PONG_SCORE_FIELDS)
+        self.assertEqual(saved["them"], {"id": self.bob.id, "username": "bob"})
+        self.assertEqual((saved["my_score"], saved["their_score"]), (5, 3))
+        self.assertTrue(saved["timestamp"].endswith("Z"))
+        anonymous = self._as(self.alice).post(reverse('PongScore'), {
+            'their_username': '', 'my_score': 1, 'their_score': 5
+        }, format='json').json()
+        self.assertIsNone(anonymous["them"])
+
+        # The list is built from rows rather than the serializer, and must read the same.
+        self.assertEqual(self._as(self.alice).get(reverse('PongScore')).json(), [saved, anonymous])
+        self.assertEqual(self._as(self.bob).get(reverse('PongScore')).json(), [])
+
+    def test_leaderboard_pages_rank_username_and_rating(self):
+        for user, mmr in ((self.alice, 1200), (self.bob, 1100)):
+            TetrisPlayer.objects.create(user=user, matchmaking_rating=mmr)
+        with patch('api.views.leaderboard', Leaderboard(refresh_interval=float("inf"))):
+            page = self._as(self.alice).get(reverse('tetris_leaderboard')).json()
+        self.assertEqual(page, {"size": 2, "players": [
+            {"rank": 1, "user": "alice", "mmr": 1200},
+            {"rank": 2, "user": "bob", "mmr": 1100},
+        ]})
+
+    def test_fast_renderer_output_matches_json_renderer(self):
+        data = [{"name": "Zoë", "at": datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+                 "ratio": Decimal("0.25"), "scores": [1, 2.5, None, True]}]
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        if orjson is not None:
+            self.assertIn(b'"2024-05-01T12:30:15.123456Z"', FastJSONRenderer().render(data))
@@ -25,9 +25,16 @@ from .views import (
     Avatar,
     tetris_get_next_match,
     tetris_save_tetris_scores,
+    tetris_save_tetris_scores_batch,
     tetris_add_player,
     tetris_remove_player,
+    tetris_get_head_to_head,
+    tetris_get_matchmaking_metrics,
+    tetris_get_leaderboard,
+    tetris_get_leaderboard_standing,
+    tetris_get_rating_history,
     PongScoreView,
+    GameStatsView,
     AllUsersView,
     Friends,
     ChatMessageView
@@ -44,9 +51,12 @@ urlpatterns = [
     path('me/avatar', Avatar.as_view(), name='avatar'),
     path('me/friends', Friends.as_view(), name='friends'),
     path('pong/score', PongScoreView.as_view(), name='PongScore'),
+    path('stats', GameStatsView.as_view(), name='game_stats'),
 
     path('tetris/save_tetris_scores', tetris_save_tetris_scores.as_view(),
          name='save_tetris_scores'),
+    path('tetris/save_tetris_scores/batch', tetris_save_tetris_scores_batch.as_view(),
+         name='save_tetris_scores_batch'),
 
     path('tetris/next-match', tetris_get_next_match.as_view(), name='tetris_next_match'),
     path('tetris/add-player', tetris_add_player.as_view(), name='tetris_add_player'),
@@ -54,6 +64,13 @@ urlpatterns = [
     path('tetris/remove-player', tetris_remove_player.as_view(), name='tetris_remove_player'),
     path('tetris/get_active_players', tetris_get_active_players.as_view(),
          name='tetris_get_active_players'),
+    path('tetris/head-to-head', tetris_get_head_to_head.as_view(), name='tetris_head_to_head'),
+    path('tetris/matchmaking-metrics', tetris_get_matchmaking_metrics.as_view(),
+         name='tetris_matchmaking_metrics'),
+    path('tetris/leaderboard', tetris_get_leaderboard.as_view(), name='tetris_leaderboard'),
+    path('tetris/leaderboard/me', tetris_get_leaderboard_standing.as_view(),
+         name='tetris_leaderboard_standing'),
+    path('tetris/rating_history', tetris_get_rating_history.as_view(), name='tetris_rating_history'),
     path('get_game_id', get_game_id.as_view(), name='get_game_id'),
     path('tetris/get_scores', tetris_get_scores.as_view(), name='tetris_get_scores'),
 
@@ -22,19 +22,28 @@ from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
 
 import tetris.calculate_mmr
-from tetris.serializers import TetrisPlayerSerializer, TetrisScoreSerializer
+import tetris.head_to_head
+import tetris.rating_history
+import tetris.scores
+import tetris.stats
+from tetris.score_buffer import ScoreBufferFullError, score_buffer
+from tetris.serializers import TetrisPlayerSerializer
 from tournament.tournament import TournamentError, g_tournament, get_game_id_number
 from tetris.active_player_manager import active_player_manager
+from tetris.leaderboard import leaderboard
 from tetris.models import TetrisPlayer, TetrisScore
+from tetris.notifications import match_found
 
-from .serializers import UserSerializer, PongScoreSerializer
+from .renderers import FastJSONRenderer
+from .serializers import MeSerializer, PongScoreSerializer, UserSerializer, pong_score_rows
 from accounts.models import PuppetGrant
 
 import uuid
 from pong.models import PongScore
+from pong.stats import get_pong_stats, record_pong_score
 
 from chat.models import ChatMessage
-from django.db import models
+from django.db import models, transaction
 import pyotp
 User = get_user_model()
 
@@ -164,15 +173,12 @@ class Me(APIView):
 
     def get(self, request):
         user = request.user
-        serializer = UserSerializer(user)
-        userdata = serializer.data
-        userdata.pop("totpsecret") #TODO: Security issues
-        userdata.pop("password")
-        return Response(userdata)
+        serializer = MeSerializer(user)
+        return Response(serializer.data)
 
     def post(self, request):
         user = request.user
-        serializer = UserSerializer(user, data=request.data, partial=True)
+        serializer = MeSerializer(user, data=request.data, partial=True)
 
         if 'avatar' in request.FILES:
             user.avatar = request.FILES['avatar']
@@ -260,7 +266,8 @@ class tetris_get_player(APIView):
 
     def get(self, request):
         # Retrieve the TetrisPlayer instance for the current logged-in user.
-        player = TetrisPlayer.objects.get(user=request.user)
+        player = TetrisPlayer.objects.only('user', 'matchmaking_rating').get(user=request.user)
+        player.user = request.user
         serializer = TetrisPlayerSerializer(player)
         return Response(serializer.data)
 
@@ -312,8 +319,24 @@ class tetris_get_next_match(APIView):
     def get(self, request):
         active_player_manager.refresh_all_players_match_histories
         user = request.user
+        if active_player_manager.tick_interval:
+            # Tick mode: pairings are made for the whole pool at once, the
+            # client only picks up its ticket.
+            active_player_manager.tick_if_due()
+            ticket = active_player_manager.take_match_ticket(user)
+            if ticket:
+                # player3 is only present when the pool is matched in triples.
+                return Response({key: value for key, value in ticket.items() if key.startswith('player')})
+            return Response({'error': 'No match found'}, status=404)
         match = active_player_manager.find_next_match(user)
-        if match:
+        # ("", "") means nobody is inside the player's window yet.
+        if match and match[1]:
+            # The opponent learns of the pairing over their matchmaking
+            # socket, with themselves as player1 as on a tick's tickets.
+            opponent_id = User.objects.filter(username=match[1]).values_list('id', flat=True).first()
+            if opponent_id is not None:
+                match_found.send(sender=self.__class__, user_id=opponent_id,
+                                 ticket={'player1': match[1], 'player2': match[0]})
             return Response({'player1': match[0], 'player2': match[1]})
         else:
             return Response({'error': 'No match found'}, status=404)
@@ -325,29 +348,83 @@ class tetris_save_tetris_scores(APIView):
     def post(self, request):
         print(request)
         print("\n\n")
-        # Define required keys without 'part' and 'total_parts'
-        required_keys = ['gameid', 'score', 'lines_cleared', 'level']
-        player_data = {}
-        for key in required_keys:
-            value = request.data.get(key)
-            if value is None:
-                return Response({'error': f"Missing key '{key}' in player data."}, status=400)
-            player_data[key] = value
-
-        # Add authenticated user's id to the player_data
-        player_data['user_id'] = request.user.id
-
-        # Immediately save or update the Tetris score
-        score_obj, created = TetrisScore.objects.update_or_create(
-            user_id=player_data.get('user_id'),
-            gameid=player_data.get('gameid'),
-            defaults={
-                'score': player_data.get('score'),
-                'lines_cleared': player_data.get('lines_cleared'),
-                'level': player_data.get('level'),
-            }
-        )
-        return Response({'Message': 'Score processed successfully.'}, status=200)
+        try:
+            score = tetris.scores.parse_score(request.data, request.user.id)
+        except tetris.scores.ScoreError as e:
+            return Response({'error': str(e)}, status=400)
+        return _store_tetris_scores([score], 'Score processed successfully.')
+
+class tetris_save_tetris_scores_batch(APIView):
+    """
+    Saves the scores of several players in one request, e.g. everyone in a
+    local game: each record names its player by username, defaulting to the
+    authenticated user, who must hold an unexpired PuppetGrant from every
+    other player named.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    MAX_SCORES = 100
+
+    def post(self, request):
+        records = request.data.get('scores')
+        if not isinstance(records, list) or not 1 <= len(records) <= self.MAX_SCORES:
+            return Response({'error': f'scores must be a list of 1 to {self.MAX_SCORES} records.'}, status=400)
+        if not all(isinstance(record, dict) and isinstance(record.get('username', ''), str) for record in records):
+            return Response({'error': 'Every score record must be an object, with username a string.'}, status=400)
+
+        usernames = {record.get('username', request.user.username) for record in records}
+        user_ids = {request.user.username: request.user.id}
+        others = usernames - {request.user.username}
+        if others:
+            user_ids.update(PuppetGrant.objects.filter(
+                puppeteer=request.user, puppet__username__in=others, expiry__gt=timezone.now()
+            ).values_list('puppet__username', 'puppet_id'))
+        denied = sorted(usernames - user_ids.keys())
+        if denied:
+            return Response({'error': f'No active puppet grant from: {", ".join(denied)}.'}, status=403)
+
+        try:
+            scores = [
+                tetris.scores.parse_score(record, user_ids[record.get('username', request.user.username)])
+                for record in records
+            ]
+        except tetris.scores.ScoreError as e:
+            return Response({'error': str(e)}, status=400)
+        return _store_tetris_scores(scores, f'{len(scores)} scores processed successfully.')
+
+def _store_tetris_scores(scores: list, message: str) -> Response:
+    """
+    Saves scores: right away with one upsert, or, when the write-behind
+    buffer is enabled, by handing them to it and answering 202.
+    """
+    if score_buffer is None:
+        tetris.scores.save_scores(scores)
+        return Response({'Message': message}, status=200)
+    try:
+        score_buffer.submit(scores)
+    except ScoreBufferFullError as e:
+        return Response({'error': str(e)}, status=503, headers={'Retry-After': '1'})
+    return Response({'Message': message}, status=202)
+
+class tetris_get_head_to_head(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        username = request.query_params.get('username')
+        if not username:
+            return Response({'error': 'username is required.'}, status=400)
+        try:
+            opponent = User.objects.get(username=username)
+        except User.DoesNotExist:
+            return Response({'error': 'User not found.'}, status=404)
+
+        pair = tetris.head_to_head.get_pair(request.user.id, opponent.id)
+        return Response({
+            'opponent': opponent.username,
+            'games': pair.games if pair else 0,
+            'last_played': pair.last_played if pair else None,
+        })
 
 # Endpoint to return active player manager users
 class tetris_get_active_players(APIView):
@@ -355,14 +432,68 @@ class tetris_get_active_players(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        # active_player_manager.active_players is a dict where each value is a dict 
-        # with a "player" key that has a user attribute.
-        usernames = [
-            active_player["player"].user.username 
-            for active_player in active_player_manager.active_players.values()
-        ]
+        usernames = active_player_manager.get_active_usernames()
         return Response({"active_players": usernames}, status=200)
 
+# Endpoint to return recent matchmaking quality: queue wait and MMR spread percentiles
+class tetris_get_matchmaking_metrics(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(active_player_manager.get_match_metrics(), status=200)
+
+# Endpoint to return a page of the Tetris leaderboard, highest rating first
+class tetris_get_leaderboard(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer]
+    MAX_LIMIT = 100
+
+    def get(self, request):
+        try:
+            offset = int(request.query_params.get('offset', 0))
+            limit = int(request.query_params.get('limit', 50))
+        except ValueError:
+            return Response({'error': 'offset and limit must be integers.'}, status=400)
+        if offset < 0 or not 1 <= limit <= self.MAX_LIMIT:
+            return Response({'error': f'offset must be >= 0 and limit between 1 and {self.MAX_LIMIT}.'}, status=400)
+        return Response(leaderboard.top(offset, limit), status=200)
+
+# Endpoint to return the current user's rank, percentile and the players around them
+class tetris_get_leaderboard_standing(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    MAX_RADIUS = 50
+
+    def get(self, request):
+        try:
+            radius = int(request.query_params.get('radius', 5))
+        except ValueError:
+            return Response({'error': 'radius must be an integer.'}, status=400)
+        if not 0 <= radius <= self.MAX_RADIUS:
+            return Response({'error': f'radius must be between 0 and {self.MAX_RADIUS}.'}, status=400)
+        standing = leaderboard.standing(request.user.id, radius)
+        if standing is None:
+            return Response({'error': 'Player not found.'}, status=404)
+        return Response(standing, status=200)
+
+# Endpoint to return the current user's rating per day, for the profile chart
+class tetris_get_rating_history(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer]
+    MAX_DAYS = 3650
+
+    def get(self, request):
+        try:
+            days = int(request.query_params.get('days', 365))
+        except ValueError:
+            return Response({'error': 'days must be an integer.'}, status=400)
+        if not 1 <= days <= self.MAX_DAYS:
+            return Response({'error': f'days must be between 1 and {self.MAX_DAYS}.'}, status=400)
+        return Response({'points': tetris.rating_history.get_rating_chart(request.user.id, days)}, status=200)
+
 class tournament_get_participants(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
@@ -562,27 +693,32 @@ class get_game_id(APIView):
 class tetris_get_scores(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer]
+
+    MAX_LIMIT = 100
 
     def get(self, request):
-        # 1. Get all game IDs that the authenticated user played
-        user_game_ids = TetrisScore.objects.filter(user=request.user).values_list('gameid', flat=True).distinct()
-        
-        # 2. Using these game IDs, fetch all scores (for all players) in those games
-        scores = TetrisScore.objects.filter(gameid__in=user_game_ids)
-        
-        # 3. Serialize the data
-        serializer = TetrisScoreSerializer(scores, many=True)
-        return Response(serializer.data)
+        # One page of the user's games with every player's score, in a single query.
+        try:
+            limit = int(request.query_params.get('limit', tetris.scores.SCORE_PAGE_SIZE))
+        except ValueError:
+            return Response({'error': 'limit must be an integer.'}, status=400)
+        if not 1 <= limit <= self.MAX_LIMIT:
+            return Response({'error': f'limit must be between 1 and {self.MAX_LIMIT}.'}, status=400)
+        try:
+            page = tetris.scores.get_score_page(request.user.id, request.query_params.get('cursor'), limit)
+        except tetris.scores.ScoreError as e:
+            return Response({'error': str(e)}, status=400)
+        return Response(page)
 
 class PongScoreView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer]
 
     def get(self, request):
         me = request.user
-        scores = PongScore.objects.filter(me=me)
-        serializer = PongScoreSerializer(scores, many=True)
-        return Response(serializer.data)
+        return Response(pong_score_rows(PongScore.objects.filter(me=me).order_by('timestamp', 'id')))
 
     def post(self, request):
         me = request.user
@@ -600,15 +736,28 @@ class PongScoreView(APIView):
         except:
             raise LookupError("user doesn't exist")
 
-        pong_score = PongScore.objects.create(
-            me=me,
-            them=them,
-            my_score=my_score,
-            their_score=their_score
-        )
+        with transaction.atomic():
+            pong_score = PongScore.objects.create(
+                me=me,
+                them=them,
+                my_score=my_score,
+                their_score=their_score
+            )
+            record_pong_score(pong_score)
         serializer = PongScoreSerializer(pong_score)
         return Response(serializer.data)
 
+class GameStatsView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        # The user's totals per game, one stats row each instead of their whole history.
+        return Response({
+            "pong": get_pong_stats(request.user.id),
+            "tetris": tetris.stats.get_tetris_stats(request.user.id),
+        })
+
 class tournament_get_round(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
@@ -621,22 +770,12 @@ class tournament_get_round(APIView):
 class AllUsersView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer]
 
     def get(self, request):
-        users = User.objects.all()
+        users = User.objects.only(*UserSerializer.Meta.fields).order_by('id')
         serializer = UserSerializer(users, many=True)
-        
-        # Remove sensitive fields from each user
-        user_data = []
-        for user in serializer.data:
-            user_copy = user.copy()
-            if "totpsecret" in user_copy:
-                user_copy.pop("totpsecret")
-            if "password" in user_copy:
-                user_copy.pop("password")
-            user_data.append(user_copy)
-            
-        return Response(user_data)
+        return Response(serializer.data)
 
 class ChatMessageView(APIView):
     authentication_classes = [JWTAuthentication]
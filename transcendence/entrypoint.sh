@@ -10,5 +10,8 @@ if [[ -z "$APPS" ]]; then
 	exit 1
 fi
 python manage.py makemigrations $APPS --noinput
+# The (gameid, user) unique constraint on Tetris scores fails to apply while
+# duplicates remain; a no-op once they are gone or before the table exists.
+python manage.py tetris_dedupe_scores
 python manage.py migrate --noinput
 exec "$@"  # Run the CMD from Dockerfile or docker-compose
@@ -0,0 +1,21 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from pong.stats import rebuild_pong_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the per-player Pong stats from recorded games, e.g. to backfill them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--json", action="store_true", help="Print the raw JSON result.")
+
+    def handle(self, *args, **options):
+        try:
+            players = rebuild_pong_stats()
+        except Exception as e:
+            raise CommandError(str(e)) from e
+
+        if options["json"]:
+            self.stdout.write(json.dumps({"players": players}))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Pong stats rebuilt for {players} players."))
@@ -8,6 +8,24 @@ class PongScore(models.Model):
     their_score = models.IntegerField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+class PongStats(models.Model):
+    """
+    Model to store each player's Pong totals, updated as each game is
+    recorded (see stats.record_pong_score), so their stats are one row
+    instead of their whole game history. A draw is neither a win nor a
+    loss, but ends the streak.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    games = models.IntegerField(default=0)
+    wins = models.IntegerField(default=0)
+    losses = models.IntegerField(default=0)
+    best_score = models.IntegerField(default=0)
+    win_streak = models.IntegerField(default=0)
+    best_win_streak = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user}: {self.games} games, {self.wins} wins, {self.losses} losses"
+
 """
 class PongPlayer(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, default=1)
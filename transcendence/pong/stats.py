@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from .models import PongScore, PongStats
+
+STATS_FIELDS = ('games', 'wins', 'losses', 'best_score', 'win_streak', 'best_win_streak')
+
+def record_pong_score(score: PongScore) -> None:
+    """
+    Adds a newly created game to its player's PongStats with a single
+    UPDATE, so concurrent games of the same player cannot lose an update.
+    Call it in the transaction that creates the score.
+
+    Args:
+        score (PongScore): The game just recorded.
+    """
+    won, lost = score.my_score > score.their_score, score.my_score < score.their_score
+    PongStats.objects.bulk_create([PongStats(user_id=score.me_id)], ignore_conflicts=True)
+    PongStats.objects.filter(user_id=score.me_id).update(
+        games=F('games') + 1,
+        wins=F('wins') + int(won),
+        losses=F('losses') + int(lost),
+        best_score=Greatest('best_score', score.my_score),
+        # Both read the streak from before this update.
+        win_streak=F('win_streak') + 1 if won else 0,
+        best_win_streak=Greatest('best_win_streak', F('win_streak') + 1) if won else F('best_win_streak'),
+    )
+
+def rebuild_pong_stats(chunk_size: int = 10000) -> int:
+    """
+    Recomputes PongStats from every PongScore, replaying each player's
+    games in order. Used to backfill existing data.
+
+    Returns:
+        int: The number of players written.
+    """
+    stats = {}
+    rows = PongScore.objects.order_by('me_id', 'timestamp', 'id').values_list('me_id', 'my_score', 'their_score')
+    with transaction.atomic():
+        for user_id, my_score, their_score in rows.iterator(chunk_size=chunk_size):
+            row = stats.get(user_id)
+            if row is None:
+                row = stats[user_id] = PongStats(user_id=user_id)
+            row.games += 1
+            row.best_score = max(row.best_score, my_score)
+            if my_score > their_score:
+                row.wins += 1
+                row.win_streak += 1
+                row.best_win_streak = max(row.best_win_streak, row.win_streak)
+            else:
+                row.losses += my_score < their_score
+                row.win_streak = 0
+        PongStats.objects.all().delete()
+        PongStats.objects.bulk_create(stats.values(), batch_size=1000)
+    return len(stats)
+
+def get_pong_stats(user_id: int) -> dict:
+    """Returns a player's Pong stats, all zero if they never played."""
+    row = PongStats.objects.filter(user_id=user_id).values(*STATS_FIELDS).first()
+    return row or dict.fromkeys(STATS_FIELDS, 0)
@@ -1,26 +1,160 @@
+import functools
+import heapq
+import itertools
+import logging
 import random
+import threading
 import time
+from collections import deque
 from typing import Optional, Tuple
-from collections import defaultdict
-from .models import TetrisScore
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+from .block_lists import fetch_block_lists
+from .head_to_head import fetch_head_to_head
+from .notifications import match_found, queue_changed
+from .player_pool import MMRIndex, QueuedPlayer, pack_pool, replay_pool_event, unpack_pool
+from transcendence.state_journal import StateJournal
+
+logger = logging.getLogger(__name__)
 
 class ActivePlayerManagerError(Exception):
     """Custom exception for ActivePlayerManager errors."""
     pass
 
+def locked(func):
+    """Runs the method while holding the manager's lock."""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return func(self, *args, **kwargs)
+    return wrapper
+
 class ActivePlayerManager:
     INACTIVITY_THRESHOLD = 300  # In seconds, 5 minutes.
+    MATCH_WINDOW = 50  # MMR window of a player who just joined.
+    WINDOW_GROWTH = 10  # MMR points the window widens by per second of waiting.
+    MAX_WAIT = 120  # Seconds after which the window is UNBOUNDED_WINDOW, so every wait is bounded.
+    UNBOUNDED_WINDOW = 100000
+    REPEAT_COST = 50  # Tick mode: cost of each previous game between two players, in MMR points.
+    GROUP_SIZES = (2, 3)  # Players per match formed by a tick; the game supports up to three.
+    MATCH_METRICS_SIZE = 1000  # Recent matches kept for the wait time and MMR spread metrics.
+    QUEUE_BROADCAST_LIMIT = 50  # Usernames included in a pushed queue update.
 
-    def __init__(self):
-        # The keys in active_players will be the user’s id.
+    def __init__(self, tick_interval: float = 0, group_size: int = 2):
+        if group_size not in self.GROUP_SIZES:
+            raise ActivePlayerManagerError(f"Unsupported match group size '{group_size}'.")
+        # The keys in active_players will be the user’s id, the values QueuedPlayer records.
         self.active_players = {}
+        # Parallel MMR / user id arrays kept sorted, so candidates are found by binary search.
+        self.mmr_index = MMRIndex()
+        self.rng = np.random.default_rng()
+        # Source of timestamps; the simulator swaps in a simulated clock.
+        self.clock = time.time
+        # Tick mode: when tick_interval is set, the whole pool is paired at
+        # most once per interval and results are stored as match tickets.
+        self.tick_interval = tick_interval
+        self.group_size = group_size
+        self.last_tick = 0.0
+        self.match_tickets = {}
+        # Min-heap of (last_seen, user id). A heartbeat pushes a new entry
+        # instead of updating the old one; entries that no longer match the
+        # player's last_seen are discarded when they reach the top.
+        self.expiry_heap = []
+        # (created, user id) in creation order, so expired tickets are at the front.
+        self.ticket_expiry = deque()
+        # Shared by request handlers and the background sweeper.
+        self.lock = threading.RLock()
+        self._sweeper = None
+        # Queue size last pushed to matchmaking sockets.
+        self._broadcast_size = None
+        # Queue waits (one per matched player) and MMR spreads (one per match) of recent matches.
+        self.recent_waits = deque(maxlen=2 * self.MATCH_METRICS_SIZE)
+        self.recent_spreads = deque(maxlen=self.MATCH_METRICS_SIZE)
+        # Snapshot and write-ahead log, once attach_journal() is called.
+        self.journal = None
+        self.snapshot_interval = 0
+        self.last_snapshot = 0.0
+
+    def _log(self, kind: str, **data):
+        """Records a change in the write-ahead log if a journal is attached. The caller must hold the lock."""
+        if self.journal is not None:
+            self.journal.append(kind, **data)
+
+    def _drop_player(self, key):
+        """Remove a player from both the dict and the MMR index."""
+        data = self.active_players.pop(key)
+        self.mmr_index.remove(key, data.mmr)
+        self._log("leave", id=key)
 
     def _cleanup_inactive_players(self):
-        """Remove players not seen within the inactivity threshold."""
-        current_time = time.time()
-        for key in list(self.active_players.keys()):
-            if current_time - self.active_players[key]['last_seen'] > self.INACTIVITY_THRESHOLD:
-                del self.active_players[key]
+        """
+        Remove players not seen within the inactivity threshold. Only the
+        expired entries at the top of the expiry heap are touched.
+
+        Returns:
+            list: The user ids of the removed players.
+        """
+        cutoff = self.clock() - self.INACTIVITY_THRESHOLD
+        heap = self.expiry_heap
+        expired = []
+        while heap and heap[0][0] < cutoff:
+            last_seen, key = heapq.heappop(heap)
+            data = self.active_players.get(key)
+            if data is not None and data.last_seen == last_seen:
+                self._drop_player(key)
+                expired.append(key)
+        # Heartbeats leave stale entries behind; rebuild once they dominate.
+        if len(heap) > 2 * len(self.active_players) + 64:
+            self.expiry_heap = [(data.last_seen, key) for key, data in self.active_players.items()]
+            heapq.heapify(self.expiry_heap)
+        return expired
+
+    def _cleanup_expired_tickets(self):
+        """Drop match tickets nobody picked up within the inactivity threshold."""
+        cutoff = self.clock() - self.INACTIVITY_THRESHOLD
+        while self.ticket_expiry and self.ticket_expiry[0][0] < cutoff:
+            created, key = self.ticket_expiry.popleft()
+            ticket = self.match_tickets.get(key)
+            if ticket is not None and ticket["created"] == created:
+                del self.match_tickets[key]
+
+    @locked
+    def sweep(self):
+        """
+        Expires inactive players and stale tickets, runs a tick when one is
+        due and pushes the queue size to matchmaking sockets if it changed.
+        """
+        self._cleanup_inactive_players()
+        self._cleanup_expired_tickets()
+        self.tick_if_due()
+        if self.journal is not None and self.clock() - self.last_snapshot >= self.snapshot_interval:
+            self.save_snapshot()
+        size, players = self.get_queue_snapshot()
+        if size != self._broadcast_size:
+            self._broadcast_size = size
+            queue_changed.send(sender=self.__class__, size=size, players=players)
+
+    def start_sweeper(self, interval: float):
+        """
+        Starts a daemon thread that calls sweep() every `interval` seconds, so
+        expiry does not have to piggyback on request handlers. Calling it
+        again while the sweeper is running has no effect.
+        """
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except Exception:
+                    logger.exception("Tetris matchmaking sweep failed")
+
+        self._sweeper = threading.Thread(target=run, name="tetris-sweeper", daemon=True)
+        self._sweeper.start()
 
     def add_player(self, player):
         if player is None:
@@ -28,133 +162,577 @@ class ActivePlayerManager:
 
         # Use the user id from the player's related user as key.
         key = player.user.id
-        current_time = time.time()
-        if key in self.active_players:
-            # Update last seen online timestamp
-            self.active_players[key]['last_seen'] = current_time
-            return "already active"
+        with self.lock:
+            if self._heartbeat(key):
+                return "already active"
+
+        match_history, excluded = self._load_player_data(key)
+
+        # The MMR is captured on add so the index entry can always be found
+        # again, even if the player's rating changes while queued.
+        mmr = player.matchmaking_rating
+        with self.lock:
+            # Another request may have added the player while history was loading.
+            if self._heartbeat(key):
+                return "already active"
+            self._insert_player(key, player.user.username, mmr, match_history, excluded)
+        return "player added"
 
+    def _load_player_data(self, key) -> Tuple[dict, set]:
+        """Loads the match history and exclusion set of a player about to be queued."""
         try:
             match_history = self.fetch_match_history_from_db(key)
+            excluded = self.fetch_exclusions_from_db([key]).get(key, set())
         except Exception as e:
             raise ActivePlayerManagerError(
                 f"Failed to fetch match history for user ID '{key}': {str(e)}"
             ) from e
+        return match_history, excluded
 
-        self.active_players[key] = {
-            "player": player,
-            "times_matched_with": match_history,
-            "last_seen": current_time  # Set the last seen timestamp on add.
-        }
-        return "player added"
+    def _insert_player(self, key, username: str, mmr: int, match_history: dict, excluded: set = None,
+                       joined_at: float = None):
+        """Adds a new entry to the pool. The caller must hold the lock."""
+        current_time = self.clock()
+        data = QueuedPlayer(
+            user_id=key,
+            username=username,
+            mmr=mmr,
+            last_seen=current_time,  # Set the last seen timestamp on add.
+            times_matched_with=match_history,
+            joined_at=current_time if joined_at is None else joined_at,
+            excluded=excluded
+        )
+        self.active_players[key] = data
+        self.mmr_index.insert(key, mmr, data.joined_at, bool(data.times_matched_with or data.excluded))
+        heapq.heappush(self.expiry_heap, (current_time, key))
+        self._log(
+            "join", id=key, username=username, mmr=mmr, joined_at=data.joined_at,
+            history=list(data.times_matched_with.items()), excluded=list(data.excluded)
+        )
+
+    def _heartbeat(self, key) -> bool:
+        """Updates last_seen for an active player; returns False if the player is not active."""
+        data = self.active_players.get(key)
+        if data is None:
+            return False
+        data.last_seen = self.clock()
+        heapq.heappush(self.expiry_heap, (data.last_seen, key))
+        return True
 
+    @locked
     def remove_player(self, user):
         key = user.id
         if key not in self.active_players:
             raise ActivePlayerManagerError(f"Player with user ID '{key}' is not an active player.")
-        del self.active_players[key]
+        self._drop_player(key)
 
+    @locked
     def clear_all_players(self):
         self.active_players.clear()
+        self.mmr_index.clear()
+        self.match_tickets.clear()
+        self.expiry_heap.clear()
+        self.ticket_expiry.clear()
+        self._log("clear")
 
     def fetch_match_history_from_db(self, user_id: int) -> dict:
+        """Return {opponent_id: games_played} for a single user."""
+        return self.fetch_match_histories_from_db([user_id]).get(user_id, {})
+
+    def fetch_match_histories_from_db(self, user_ids) -> dict:
+        """
+        Builds the times_matched_with counters for every user in user_ids from
+        the head-to-head counter table, in one query regardless of how many
+        games the players have played.
+
+        Returns:
+            dict: {user_id: {opponent_id: games_played}}, with an empty dict
+            for users that have no history.
+        """
         try:
-            # Query match history using the user's id.
-            player_gameids = TetrisScore.objects.filter(user_id=user_id).values_list('gameid', flat=True)
-            times_matched_with = defaultdict(int)
+            return fetch_head_to_head(user_ids)
+        except Exception as e:
+            raise ActivePlayerManagerError(
+                f"Database error while fetching match histories: {str(e)}"
+            ) from e
 
-            for g_id in player_gameids:
-                participants = TetrisScore.objects.filter(gameid=g_id).values_list('user_id', flat=True)
-                for uid in participants:
-                    if uid != user_id:
-                        times_matched_with[uid] += 1
+    def fetch_exclusions_from_db(self, user_ids) -> dict:
+        """
+        Loads the block lists of every user in user_ids in one query.
 
-            return dict(times_matched_with)
+        Returns:
+            dict: {user_id: set of user ids they must not be matched with}.
+        """
+        try:
+            return fetch_block_lists(user_ids)
         except Exception as e:
             raise ActivePlayerManagerError(
-                f"Database error while fetching match history for user ID '{user_id}': {str(e)}"
+                f"Database error while fetching block lists: {str(e)}"
             ) from e
 
+    @staticmethod
+    def _exclusion_pairs(user_id: int, other_ids) -> list:
+        """Blocking is mutual, so a change touches both sides of every pair."""
+        return [pair for other_id in other_ids for pair in ((user_id, other_id), (other_id, user_id))]
+
+    def _apply_exclusion(self, user_id: int, other_id: int, blocked: bool):
+        """Adds or removes other_id in user_id's exclusion set if user_id is queued. The caller must hold the lock."""
+        data = self.active_players.get(user_id)
+        if data is None:
+            return
+        if blocked:
+            data.excluded.add(other_id)
+            self.mmr_index.mark(user_id, data.mmr)
+        else:
+            data.excluded.discard(other_id)
+        self._log("exclusion", id=user_id, other=other_id, blocked=blocked)
+
+    @locked
+    def update_exclusions(self, user_id: int, other_ids, blocked: bool = True):
+        """
+        Applies a block list change to the queued players it concerns:
+        user_id blocked (or unblocked) every user in other_ids. Players
+        enqueued later read their set from the database instead.
+        """
+        for a, b in self._exclusion_pairs(user_id, other_ids):
+            self._apply_exclusion(a, b, blocked)
+
     def refresh_all_players_match_histories(self):
-        current_time = time.time()
-        for user_id in list(self.active_players.keys()):
-            # Remove player if inactive for longer than the threshold.
-            if current_time - self.active_players[user_id]['last_seen'] > self.INACTIVITY_THRESHOLD:
-                del self.active_players[user_id]
+        # Remove inactive players, then reload every remaining history at once.
+        with self.lock:
+            self._cleanup_inactive_players()
+            user_ids = list(self.active_players.keys())
+        try:
+            histories = self.fetch_match_histories_from_db(user_ids)
+        except Exception as e:
+            raise ActivePlayerManagerError(
+                f"Failed to refresh match histories: {str(e)}"
+            ) from e
+        with self.lock:
+            for user_id, history in histories.items():
+                data = self.active_players.get(user_id)
+                if data is not None:
+                    data.times_matched_with = history
+                    if history:
+                        self.mmr_index.mark(user_id, data.mmr)
+
+    def _pair_score(self, p1_data, p2_data) -> float:
+        """Scores a pairing: close MMR is good, repeat opponents are penalised, plus some noise."""
+        times_faced = p1_data.times_matched_with.get(p2_data.user_id, 0)
+        mmr_diff = abs(p1_data.mmr - p2_data.mmr)
+        base_score = 1.0 / (1.0 + mmr_diff)
+        face_penalty = times_faced * 0.2
+        random_factor = random.uniform(0.0, 0.2)
+        return base_score - face_penalty + random_factor
+
+    @staticmethod
+    def _allowed_candidates(player_data, user_ids: np.ndarray) -> np.ndarray:
+        """Mask of the user_ids player_data may be matched with: not themselves and not excluded."""
+        allowed = user_ids != player_data.user_id
+        if player_data.excluded:
+            allowed &= ~np.isin(user_ids, list(player_data.excluded))
+        return allowed
+
+    def _score_candidates(self, player_data, user_ids: np.ndarray, mmrs: np.ndarray) -> np.ndarray:
+        """_pair_score for a whole array of candidates in one NumPy pass."""
+        base_score = 1.0 / (1.0 + np.abs(mmrs - player_data.mmr))
+        face_penalty = player_data.times_faced(user_ids) * 0.2
+        random_factor = self.rng.uniform(0.0, 0.2, len(user_ids))
+        return base_score - face_penalty + random_factor
+
+    def _allowed_window(self, player_data, now: float) -> float:
+        """
+        MMR distance a player accepts an opponent from. It starts at
+        MATCH_WINDOW and widens with the time spent in the queue, so a
+        player is never paired far off their rating on the first request
+        but is guaranteed a match within MAX_WAIT if anyone is queued.
+        """
+        waited = now - player_data.joined_at
+        if waited >= self.MAX_WAIT:
+            return self.UNBOUNDED_WINDOW
+        return self.MATCH_WINDOW + self.WINDOW_GROWTH * max(waited, 0.0)
+
+    def _record_match(self, group, now: float):
+        """
+        Records the queue waits and MMR spread of a match (two or more
+        entries) for get_match_metrics. Only committed pairings are
+        recorded, i.e. the groups a tick issues tickets to; find_next_match
+        only suggests an opponent, which may be suggested again.
+        """
+        mmrs = [data.mmr for data in group]
+        self.recent_waits.extend(now - data.joined_at for data in group)
+        self.recent_spreads.append(max(mmrs) - min(mmrs))
+
+    def _recent_match_stats(self) -> Tuple[list, list]:
+        return list(self.recent_waits), list(self.recent_spreads)
+
+    def get_match_metrics(self) -> dict:
+        """
+        Returns p50/p95 queue wait (seconds) and MMR spread over the last
+        MATCH_METRICS_SIZE matches made by ticks.
+        """
+        waits, spreads = self._recent_match_stats()
+        metrics = {"matches": len(spreads)}
+        for name, values in (("wait", waits), ("spread", spreads)):
+            if values:
+                p50, p95 = np.percentile(values, [50, 95])
             else:
-                try:
-                    new_history = self.fetch_match_history_from_db(user_id)
-                    self.active_players[user_id]["times_matched_with"] = new_history
-                except Exception as e:
-                    raise ActivePlayerManagerError(
-                        f"Failed to refresh match history for user ID '{user_id}': {str(e)}"
-                    ) from e
+                p50 = p95 = 0.0
+            metrics[f"{name}_p50"] = round(float(p50), 2)
+            metrics[f"{name}_p95"] = round(float(p95), 2)
+        return metrics
+
+    def _best_pair_for(self, player_data, candidates) -> Tuple[str, str]:
+        """Returns the usernames of player_data and the best scoring entry in candidates."""
+        if not candidates:
+            raise ActivePlayerManagerError(
+                f"No valid match found for player with user ID '{player_data.user_id}'."
+            )
+        user_ids = np.fromiter((c.user_id for c in candidates), dtype=np.int64, count=len(candidates))
+        mmrs = np.fromiter((c.mmr for c in candidates), dtype=np.int64, count=len(candidates))
+        best = int(np.argmax(self._score_candidates(player_data, user_ids, mmrs)))
+        return player_data.username, candidates[best].username
+
+    def _best_neighbour_pair(self, entries) -> Tuple[str, str]:
+        """
+        Returns the best scoring pair among entries, which must be sorted by
+        MMR. Only neighbours within the window are scored, so this is
+        O(n * k) instead of scoring every pair in the pool.
+        """
+        window = self.MATCH_WINDOW
+        possible_pairs = []
+        while not possible_pairs:
+            for i in range(len(entries)):
+                p1_data = entries[i]
+                j = i + 1
+                while j < len(entries) and entries[j].mmr - p1_data.mmr <= window:
+                    p2_data = entries[j]
+                    j += 1
+                    if p2_data.user_id in p1_data.excluded:
+                        continue
+                    score = self._pair_score(p1_data, p2_data)
+                    possible_pairs.append((p1_data.username, p2_data.username, score))
+            if window > self.UNBOUNDED_WINDOW:
+                # Everyone left has blocked everyone else.
+                return "", ""
+            window *= 2
 
+        best_pair = max(possible_pairs, key=lambda x: x[2])
+        return best_pair[0], best_pair[1]
+
+    @locked
     def find_next_match(self, user=None) -> Tuple[str, str]:
         # Remove inactive players before proceeding.
         self._cleanup_inactive_players()
 
-        players_list = list(self.active_players.values())
-        n = len(players_list)
+        n = len(self.active_players)
         if n < 2:
             return "", ""
 
         if user is not None:
             user_id = user.id
-            specific_player_data = None
-            for pdata in players_list:
-                if pdata["player"].user.id == user_id:
-                    specific_player_data = pdata
-                    break
-
+            specific_player_data = self.active_players.get(user_id)
             if specific_player_data is None:
                 raise ActivePlayerManagerError(f"Player with user ID '{user_id}' is not an active player.")
 
-            possible_pairs = []
-            for pdata in players_list:
-                if pdata["player"].user.id == user_id:
-                    continue  # Skip pairing the player with themselves.
+            # Score everyone inside the player's current window in one pass,
+            # excluding the player themselves and anyone on their block list.
+            # An empty window means nobody is close enough yet; the window
+            # will be wider on the next poll.
+            now = self.clock()
+            user_ids, mmrs = self.mmr_index.candidates(
+                specific_player_data.mmr, self._allowed_window(specific_player_data, now)
+            )
+            others = self._allowed_candidates(specific_player_data, user_ids)
+            user_ids, mmrs = user_ids[others], mmrs[others]
+            if not len(user_ids):
+                return "", ""
 
-                p1 = specific_player_data["player"]
-                p2 = pdata["player"]
+            best = int(np.argmax(self._score_candidates(specific_player_data, user_ids, mmrs)))
+            opponent = self.active_players[int(user_ids[best])]
+            return specific_player_data.username, opponent.username
+        else:
+            return self._best_neighbour_pair(
+                [self.active_players[user_id] for user_id in self.mmr_index.ids.tolist()]
+            )
 
-                times_faced = specific_player_data["times_matched_with"].get(p2.user.id, 0)
-                mmr_diff = abs(p1.matchmaking_rating - p2.matchmaking_rating)
-                base_score = 1.0 / (1.0 + mmr_diff)
-                face_penalty = times_faced * 0.2
-                random_factor = random.uniform(0.0, 0.2)
-                score = base_score - face_penalty + random_factor
+    @locked
+    def run_matchmaking_tick(self) -> list:
+        """
+        Splits the whole pool into matches of group_size players in one pass
+        (see _optimal_groups) and stores a match ticket for every matched
+        player, removing them from the pool.
 
-                possible_pairs.append((p1.user.username, p2.user.username, score))
+        Returns:
+            list: The tuples of user ids that were matched.
+        """
+        current_time = self.clock()
+        self.last_tick = current_time
+        self._cleanup_inactive_players()
+        self._cleanup_expired_tickets()
 
-            if not possible_pairs:
-                raise ActivePlayerManagerError(f"No valid match found for player with user ID '{user_id}'.")
+        index = self.mmr_index
+        groups = self._optimal_groups(
+            [self.active_players[uid] for uid in index.ids.tolist()], self.group_size, index=index
+        )
+        matched = [data.user_id for group in groups for data in group]
+        for user_id in matched:
+            del self.active_players[user_id]
+        # Rebuild the index in one pass rather than deleting entries one by one.
+        if matched:
+            index.keep(~np.isin(index.ids, np.array(matched, dtype=np.int64)))
+        self._issue_tickets(groups, current_time)
+        return [tuple(data.user_id for data in group) for group in groups]
 
-            best_pair = max(possible_pairs, key=lambda x: x[2])
-            return best_pair[0], best_pair[1]
-        else:
-            possible_pairs = []
-            for i in range(n):
-                for j in range(i + 1, n):
-                    p1_data = players_list[i]
-                    p2_data = players_list[j]
-                    p1 = p1_data["player"]
-                    p2 = p2_data["player"]
-
-                    times_faced = p1_data["times_matched_with"].get(p2.user.id, 0)
-                    mmr_diff = abs(p1.matchmaking_rating - p2.matchmaking_rating)
-                    base_score = 1.0 / (1.0 + mmr_diff)
-                    face_penalty = times_faced * 0.2
-                    random_factor = random.uniform(0.0, 0.2)
-                    score = base_score - face_penalty + random_factor
-
-                    possible_pairs.append((p1.user.username, p2.user.username, score))
-
-            if not possible_pairs:
-                raise ActivePlayerManagerError("No valid match found among active players.")
-
-            best_pair = max(possible_pairs, key=lambda x: x[2])
-            return best_pair[0], best_pair[1]
-
-# Instantiate the global active player manager
-active_player_manager = ActivePlayerManager()
+    @staticmethod
+    def _ticket_for(me, group, current_time: float) -> dict:
+        """The ticket handed to `me`: player1 is always the recipient, then the rest of the group."""
+        players = [me] + [data for data in group if data is not me]
+        ticket = {f"player{number}": data.username for number, data in enumerate(players, start=1)}
+        ticket["created"] = current_time
+        return ticket
+
+    def _issue_tickets(self, groups, current_time: float):
+        """Stores a match ticket for every entry of every group and notifies the players."""
+        for group in groups:
+            self._record_match(group, current_time)
+            for me in group:
+                self.match_tickets[me.user_id] = self._ticket_for(me, group, current_time)
+                self.ticket_expiry.append((current_time, me.user_id))
+                match_found.send(sender=self.__class__, user_id=me.user_id, ticket=self.match_tickets[me.user_id])
+        if groups:
+            self._log("matched", tickets=[
+                [me.user_id, self.match_tickets[me.user_id]] for group in groups for me in group
+            ])
+
+    def _optimal_groups(self, entries, size: int, index: MMRIndex = None) -> list:
+        """
+        Splits entries, which must be sorted by MMR, into groups of `size`
+        consecutive entries with a dynamic programme that minimises the
+        total cost. A group costs its MMR range (for a triple, the summed
+        distance to the median rating) plus REPEAT_COST for every previous
+        game between two of its members, and is only allowed if the range
+        fits in the widest member's window and no member has blocked
+        another. A player left waiting costs half their own window; windows
+        widen with waiting time, so each tick a long-waiting player becomes
+        cheaper to match than to keep, and is matched within MAX_WAIT
+        without special-casing.
+
+        Only runs of neighbours are scored, n - size + 1 candidates instead
+        of every O(n^size) combination, which is exact for the MMR part of
+        the cost when the whole pool is matched. Candidate costs are built
+        with NumPy from the index, reading the history and block list of
+        only the players the index marks as having ties; only the O(n)
+        recurrence is a Python loop.
+
+        Args:
+            entries: QueuedPlayer entries sorted by MMR.
+            size: Players per group.
+            index: Optional MMRIndex aligned with entries, so ratings, ids
+                and enqueue times come from its arrays instead of a read of
+                every entry.
+
+        Returns:
+            list: Tuples of `size` entries.
+        """
+        n = len(entries)
+        if n < size:
+            return []
+        if index is None:
+            index = MMRIndex.from_entries(entries)
+        mmrs = index.mmrs
+        waited = self.clock() - index.joined
+        # _allowed_window for every entry at once.
+        windows = np.where(
+            waited >= self.MAX_WAIT,
+            self.UNBOUNDED_WINDOW,
+            self.MATCH_WINDOW + self.WINDOW_GROWTH * np.maximum(waited, 0.0)
+        )
+
+        # Candidate j is the group entries[j:j + size].
+        starts = n - size + 1
+        ranges = mmrs[size - 1:] - mmrs[:starts]
+        costs = ranges.astype(float)
+        user_ids = index.ids.tolist()
+        user_ids.extend([None] * (size - 1))
+        # Most players have neither a history nor a block list; only those
+        # the index marks as having ties are read.
+        tied = np.flatnonzero(index.ties)
+        tied_list = tied.tolist()
+        histories = [entries[k].times_matched_with for k in tied_list]
+        blockers = [k for k in tied_list if entries[k].excluded]
+        for gap in range(1, size):
+            # Games between entries k and k + gap. History is symmetric, so
+            # one side suffices.
+            penalty = np.array([history.get(user_ids[k + gap], 0) for k, history in zip(tied_list, histories)],
+                               dtype=float) * self.REPEAT_COST
+            # A group holding two players who blocked each other is never
+            # formed. Exclusion is symmetric too.
+            blocked = [k for k in blockers if user_ids[k + gap] in entries[k].excluded]
+            if blocked:
+                penalty[np.searchsorted(tied, blocked)] = np.inf
+            charged = penalty > 0
+            if not charged.any():
+                continue
+            k, penalty = tied[charged], penalty[charged]
+            # Candidate j holds both k and k + gap when k + gap - size < j <= k.
+            # The ks are distinct, so each offset adds to distinct candidates.
+            for offset in range(size - gap):
+                j = k - offset
+                valid = (j >= 0) & (j < starts)
+                costs[j[valid]] += penalty[valid]
+
+        widest = windows[:starts].copy()
+        for offset in range(1, size):
+            np.maximum(widest, windows[offset:offset + starts], out=widest)
+        costs[ranges > widest] = np.inf
+
+        # best[i] is the lowest cost for the first i entries.
+        wait_costs = windows / 2
+        best = [0.0]
+        for wait_cost in wait_costs[:size - 1].tolist():
+            best.append(best[-1] + wait_cost)
+        last = best[-1]
+        append = best.append
+        # Iterating best while appending to it yields best[i - size] when
+        # best[i] is computed: the list stays size entries ahead of the loop.
+        for back, wait_cost, cost in zip(best, wait_costs[size - 1:].tolist(), costs.tolist()):
+            keep = last + wait_cost
+            cost += back
+            last = cost if cost < keep else keep
+            append(last)
+        # Whether the first i entries end with a group, from the same sums.
+        best = np.array(best)
+        grouped = np.zeros(n + 1, dtype=bool)
+        grouped[size:] = best[:starts] + costs < best[size - 1:n] + wait_costs[size - 1:]
+
+        firsts = []
+        i = n
+        grouped = grouped.tolist()
+        while i > 0:
+            if grouped[i]:
+                i -= size
+                firsts.append(i)
+            else:
+                i -= 1
+        groups = [tuple(entries[first:first + size]) for first in firsts]
+        return groups
+
+    @locked
+    def tick_if_due(self):
+        """Runs a matchmaking tick if tick mode is on and the interval has elapsed."""
+        if self.tick_interval and self.clock() - self.last_tick >= self.tick_interval:
+            self.run_matchmaking_tick()
+
+    @locked
+    def take_match_ticket(self, user) -> Optional[dict]:
+        """Returns and consumes the match ticket for user, or None if they have not been paired yet."""
+        ticket = self.match_tickets.pop(user.id, None)
+        if ticket is not None:
+            self._log("ticket", id=user.id)
+        return ticket
+
+    @locked
+    def get_active_usernames(self) -> list:
+        return [data.username for data in self.active_players.values()]
+
+    @locked
+    def get_queue_snapshot(self) -> Tuple[int, list]:
+        """Returns the queue size and up to QUEUE_BROADCAST_LIMIT usernames."""
+        players = [
+            data.username
+            for data in itertools.islice(self.active_players.values(), self.QUEUE_BROADCAST_LIMIT)
+        ]
+        return len(self.active_players), players
+
+    def attach_journal(self, path: str, snapshot_interval: float = 30) -> int:
+        """
+        Restores the pool and pending match tickets from the snapshot and
+        write-ahead log at `path`, then journals every change there, so a
+        restart resumes the queue without reloading histories from the
+        database. sweep() takes a new snapshot, which empties the log, every
+        snapshot_interval seconds.
+
+        Returns:
+            int: The number of players restored.
+        """
+        journal = StateJournal(path)
+        arrays, events = journal.open()
+        now = self.clock()
+        players, tickets = unpack_pool(arrays, now) if arrays is not None else ({}, {})
+        for event in events:
+            replay_pool_event(players, tickets, event, now)
+        with self.lock:
+            self._restore(players, tickets)
+            self._set_journal(journal)
+            self.snapshot_interval = snapshot_interval
+            self.save_snapshot()
+        return len(players)
+
+    def _set_journal(self, journal):
+        self.journal = journal
+
+    def _restore(self, players: dict, tickets: dict):
+        """
+        Replaces the pool with restored QueuedPlayer entries and tickets,
+        building the index and expiry heap in one pass rather than by
+        inserting players one at a time. The caller must hold the lock.
+        """
+        self.clear_all_players()
+        entries = sorted(players.values(), key=lambda data: (data.mmr, data.user_id))
+        self.active_players.update((data.user_id, data) for data in entries)
+        self.mmr_index = MMRIndex.from_entries(entries)
+        self.expiry_heap = [(data.last_seen, data.user_id) for data in entries]
+        heapq.heapify(self.expiry_heap)
+        for key, ticket in sorted(tickets.items(), key=lambda item: item[1]["created"]):
+            self.match_tickets[key] = ticket
+            self.ticket_expiry.append((ticket["created"], key))
+
+    def _snapshot_entries(self) -> list:
+        """Every entry, sorted by MMR. The caller must hold the lock."""
+        return [self.active_players[uid] for uid in self.mmr_index.ids.tolist()]
+
+    @locked
+    def save_snapshot(self):
+        """Writes a snapshot of the pool to the attached journal and empties its log."""
+        if self.journal is None:
+            raise ActivePlayerManagerError("No journal attached.")
+        self.journal.snapshot(pack_pool(self._snapshot_entries(), self.match_tickets))
+        self.last_snapshot = self.clock()
+
+    # Asyncio API for consumers. The pool is safe to use from several threads,
+    # so calls run in the default executor rather than being serialised on
+    # the single thread that thread-sensitive sync_to_async would use.
+    async def aadd_player(self, player):
+        return await sync_to_async(self.add_player, thread_sensitive=False)(player)
+
+    async def aremove_player(self, user):
+        return await sync_to_async(self.remove_player, thread_sensitive=False)(user)
+
+    async def afind_next_match(self, user=None) -> Tuple[str, str]:
+        return await sync_to_async(self.find_next_match, thread_sensitive=False)(user)
+
+    async def atake_match_ticket(self, user) -> Optional[dict]:
+        return await sync_to_async(self.take_match_ticket, thread_sensitive=False)(user)
+
+    async def aget_queue_snapshot(self) -> Tuple[int, list]:
+        return await sync_to_async(self.get_queue_snapshot, thread_sensitive=False)()
+
+# Instantiate the global active player manager with the configured backend.
+active_player_manager = import_string(
+    getattr(settings, "TETRIS_PLAYER_POOL_BACKEND", "tetris.active_player_manager.ActivePlayerManager")
+)(
+    tick_interval=getattr(settings, "TETRIS_MATCHMAKING_TICK", 0),
+    group_size=getattr(settings, "TETRIS_MATCHMAKING_GROUP_SIZE", 2)
+)
+
+def start_sweeper():
+    """
+    Starts the background sweeper of the global pool every
+    TETRIS_SWEEP_INTERVAL seconds, so inactive players expire without
+    piggybacking on requests. Called from the server entry points, so
+    management commands and tests do not start one.
+    """
+    interval = getattr(settings, "TETRIS_SWEEP_INTERVAL", 0)
+    if interval:
+        active_player_manager.start_sweeper(interval)
@@ -1,35 +1,181 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from .active_player_manager import active_player_manager
-
-app = FastAPI()
-
-class Player(BaseModel):
-    name: str
-    matchmaking_rating: float
-
-@app.post("/players/")
-def add_player(player: Player):
-    active_player_manager.add_player(player)
-    return {"message": f"Player {player.name} added successfully."}
-
-@app.delete("/players/{player_name}")
-def remove_player(player_name: str):
-    if player_name in active_player_manager.active_players:
-        active_player_manager.remove_player(player_name)
-        return {"message": f"Player {player_name} removed successfully."}
-    else:
-        raise HTTPException(status_code=404, detail="Player not found")
-
-@app.get("/players/next_match")
-def find_next_match():
-    match = active_player_manager.find_next_match()
-    if match:
-        return {"player1": match[0], "player2": match[1]}
-    else:
-        raise HTTPException(status_code=404, detail="No match found")
-
-@app.post("/players/refresh_histories")
-def refresh_all_players():
-    active_player_manager.refresh_all_players_match_histories()
-    return {"message": "All player match histories refreshed successfully."}
+import json
+import logging
+import re
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from django.db import connections
+from .active_player_manager import ActivePlayerManagerError
+from .entrypoint import SimplePlayer
+
+logger = logging.getLogger(__name__)
+
+class MatchmakingRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of the standalone matchmaking service. Every route maps onto one
+    ActivePlayerManager call on the server's manager:
+
+        POST   /players                 add_player; body {"user_id", "username", "mmr"}
+        GET    /players                 get_active_usernames
+        DELETE /players                 clear_all_players
+        DELETE /players/<id>            remove_player
+        GET    /players/<id>/match      find_next_match for that player
+        POST   /players/<id>/ticket     take_match_ticket (consumes the ticket)
+        POST   /players/<id>/exclusions update_exclusions; body {"user_ids", "blocked"}
+        GET    /match                   find_next_match over the whole pool
+        POST   /tick                    run_matchmaking_tick
+        POST   /histories/refresh       refresh_all_players_match_histories
+        GET    /queue                   get_queue_snapshot
+        GET    /metrics                 get_match_metrics
+
+    Manager errors are returned as 400 {"error": message}. HTTP/1.1 keeps
+    connections open, so a pooled client pays the TCP handshake once.
+    """
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, the body
+    # waits for the client's delayed ACK (~40 ms) on a kept-alive connection.
+    disable_nagle_algorithm = True
+
+    ROUTES = [
+        ("POST", re.compile(r"^/players$"), "add_player"),
+        ("GET", re.compile(r"^/players$"), "active_players"),
+        ("DELETE", re.compile(r"^/players$"), "clear_players"),
+        ("DELETE", re.compile(r"^/players/(\d+)$"), "remove_player"),
+        ("GET", re.compile(r"^/players/(\d+)/match$"), "find_match"),
+        ("POST", re.compile(r"^/players/(\d+)/ticket$"), "take_ticket"),
+        ("POST", re.compile(r"^/players/(\d+)/exclusions$"), "update_exclusions"),
+        ("GET", re.compile(r"^/match$"), "find_match"),
+        ("POST", re.compile(r"^/tick$"), "tick"),
+        ("POST", re.compile(r"^/histories/refresh$"), "refresh_histories"),
+        ("GET", re.compile(r"^/queue$"), "queue"),
+        ("GET", re.compile(r"^/metrics$"), "metrics"),
+    ]
+
+    @property
+    def manager(self):
+        return self.server.manager
+
+    def handle(self):
+        try:
+            super().handle()
+        finally:
+            # Each client connection gets its own thread, and with it its own
+            # database connection for history lookups.
+            connections.close_all()
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method: str):
+        path = self.path.split("?", 1)[0]
+        for route_method, pattern, name in self.ROUTES:
+            match = pattern.match(path)
+            if match and route_method == method:
+                break
+        else:
+            self._send(HTTPStatus.NOT_FOUND, {"error": f"No route for {method} {path}."})
+            return
+
+        try:
+            body = self._read_body()
+            user_ids = [int(group) for group in match.groups()]
+            self._send(HTTPStatus.OK, getattr(self, f"_{name}")(body, *user_ids))
+        except ValueError as e:
+            self._send(HTTPStatus.BAD_REQUEST, {"error": f"Malformed request: {str(e)}"})
+        except ActivePlayerManagerError as e:
+            self._send(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+        except Exception as e:
+            logger.exception("Matchmaking service request %s %s failed", method, path)
+            self._send(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)})
+
+    def _read_body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _send(self, status: HTTPStatus, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    @staticmethod
+    def _user(user_id: int):
+        return SimpleNamespace(id=user_id)
+
+    def _add_player(self, body: dict) -> dict:
+        try:
+            player = SimplePlayer(body["username"], int(body["mmr"]), user_id=int(body["user_id"]))
+        except KeyError as e:
+            raise ValueError(f"missing key {e}") from e
+        return {"status": self.manager.add_player(player)}
+
+    def _active_players(self, body: dict) -> dict:
+        return {"active_players": self.manager.get_active_usernames()}
+
+    def _clear_players(self, body: dict) -> dict:
+        self.manager.clear_all_players()
+        return {}
+
+    def _remove_player(self, body: dict, user_id: int) -> dict:
+        self.manager.remove_player(self._user(user_id))
+        return {}
+
+    def _find_match(self, body: dict, user_id: int = None) -> dict:
+        user = self._user(user_id) if user_id is not None else None
+        player1, player2 = self.manager.find_next_match(user)
+        return {"player1": player1, "player2": player2}
+
+    def _take_ticket(self, body: dict, user_id: int) -> dict:
+        return {"ticket": self.manager.take_match_ticket(self._user(user_id))}
+
+    def _update_exclusions(self, body: dict, user_id: int) -> dict:
+        try:
+            other_ids = [int(other_id) for other_id in body["user_ids"]]
+        except KeyError as e:
+            raise ValueError(f"missing key {e}") from e
+        self.manager.update_exclusions(user_id, other_ids, bool(body.get("blocked", True)))
+        return {}
+
+    def _tick(self, body: dict) -> dict:
+        return {"groups": self.manager.run_matchmaking_tick()}
+
+    def _refresh_histories(self, body: dict) -> dict:
+        self.manager.refresh_all_players_match_histories()
+        return {}
+
+    def _queue(self, body: dict) -> dict:
+        size, players = self.manager.get_queue_snapshot()
+        return {"size": size, "players": players}
+
+    def _metrics(self, body: dict) -> dict:
+        return self.manager.get_match_metrics()
+
+
+class MatchmakingServer(ThreadingHTTPServer):
+    """
+    Standalone matchmaking process: owns the queue in `manager` and serves it
+    to Django workers through RemoteActivePlayerManager. Run it with the
+    tetris_matchmaker management command.
+    """
+
+    def __init__(self, manager, host: str = "127.0.0.1", port: int = 8765):
+        super().__init__((host, port), MatchmakingRequestHandler)
+        self.manager = manager
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
@@ -0,0 +1,726 @@
+import multiprocessing
+import threading
+import time
+import uuid
+import random
+import numpy as np
+from types import SimpleNamespace
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from .models import TetrisPlayer, TetrisScore
+from .active_player_manager import ActivePlayerManager, ActivePlayerManagerError
+from .calculate_mmr import INITIAL_RATING, apply_match_results, calculate_new_ratings, update_player_ratings
+from .head_to_head import rebuild_head_to_head
+from .leaderboard import Leaderboard
+from .notifications import match_found, queue_changed, sockets_muted
+from .rating_engines import ENGINES, INITIAL_DEVIATION, INITIAL_VOLATILITY
+from .rating_rebuild import replay_periods
+from .scores import get_score_page, upsert_scores
+from .serializers import TetrisScoreSerializer
+from .remote_player_pool import RemoteActivePlayerManager
+from .testing import OfflineActivePlayerManager, OfflineRedisActivePlayerManager, make_fake_player, start_matchmaker
+
+User = get_user_model()
+
+
+class BenchmarkRollback(Exception):
+    """Raised to roll back the synthetic data a benchmark created."""
+    pass
+
+
+def _make_players(count: int, prefix: str) -> list:
+    """Creates `count` users with a TetrisPlayer each and returns the players."""
+    users = User.objects.bulk_create(
+        [User(username=f"{prefix}_{i}") for i in range(count)]
+    )
+    # bulk_create only sets primary keys on some backends, so reload them.
+    users = list(User.objects.filter(username__startswith=f"{prefix}_"))
+    return TetrisPlayer.objects.bulk_create(
+        [TetrisPlayer(user=u, matchmaking_rating=random.randint(800, 2400)) for u in users]
+    )
+
+
+def _make_history(player, opponents: list, games: int) -> None:
+    """Records `games` two-player games between `player` and random opponents."""
+    scores = []
+    for _ in range(games):
+        gameid = uuid.uuid4().hex
+        opponent = random.choice(opponents)
+        for p in (player, opponent):
+            scores.append(TetrisScore(
+                gameid=gameid, user=p.user,
+                score=random.randint(0, 10000), lines_cleared=0, level=1,
+            ))
+    TetrisScore.objects.bulk_create(scores, batch_size=1000)
+    rebuild_head_to_head()
+
+
+def bench_queue_join(history_sizes=(10, 100, 1000, 5000), opponents=50, repeat=5) -> list:
+    """
+    Measures ActivePlayerManager.add_player for a player with a growing number
+    of recorded games. Every size runs inside a transaction that is rolled
+    back afterwards, so the database is left untouched.
+
+    Returns:
+        list: One dict per history size with the mean latency in ms and the
+        number of queries issued per join.
+    """
+    results = []
+    for size in history_sizes:
+        try:
+            with transaction.atomic():
+                prefix = f"bench_{uuid.uuid4().hex[:8]}"
+                players = _make_players(opponents + 1, prefix)
+                veteran, pool = players[0], players[1:]
+                _make_history(veteran, pool, size)
+
+                elapsed = 0.0
+                queries = 0
+                for _ in range(repeat):
+                    manager = ActivePlayerManager()
+                    with CaptureQueriesContext(connection) as ctx:
+                        start = time.perf_counter()
+                        manager.add_player(veteran)
+                        elapsed += time.perf_counter() - start
+                    queries = len(ctx.captured_queries)
+
+                results.append({
+                    "games": size,
+                    "join_ms": round(elapsed / repeat * 1000, 3),
+                    "queries": queries,
+                })
+                raise BenchmarkRollback()
+        except BenchmarkRollback:
+            pass
+    return results
+
+
+def bench_pairing(pool_sizes=(100, 1000, 10000), repeat=200) -> list:
+    """
+    Measures find_next_match for a single user against pools of growing size.
+    Runs entirely in memory.
+
+    Returns:
+        list: One dict per pool size with the mean pairing latency in ms.
+    """
+    results = []
+    for size in pool_sizes:
+        manager = OfflineActivePlayerManager()
+        for user_id in range(1, size + 1):
+            manager.add_player(make_fake_player(user_id, int(random.gauss(1200, 300))))
+
+        users = [make_fake_player(random.randint(1, size), 0).user for _ in range(repeat)]
+        start = time.perf_counter()
+        for user in users:
+            manager.find_next_match(user)
+        elapsed = time.perf_counter() - start
+        results.append({
+            "players": size,
+            "pair_ms": round(elapsed / repeat * 1000, 4),
+        })
+    return results
+
+
+def bench_tick(pool_sizes=(1000, 10000, 50000), repeat_rate=0.2) -> list:
+    """
+    Measures one global matchmaking tick over pools of growing size. A share
+    of players (repeat_rate) is given a previous game against their nearest
+    MMR neighbour, so the repeat penalty is exercised.
+
+    Returns:
+        list: One dict per pool size with the tick duration in ms, the number
+        of pairs formed, their mean MMR difference and how many were repeats.
+    """
+    results = []
+    for size in pool_sizes:
+        manager = OfflineActivePlayerManager()
+        for user_id in range(1, size + 1):
+            manager.add_player(make_fake_player(user_id, int(random.gauss(1200, 300))))
+        ids = manager.mmr_index.ids.tolist()
+        history = {uid: {} for uid in ids}
+        for a, b in zip(ids, ids[1:]):
+            if random.random() < repeat_rate:
+                history[a][b] = history[b][a] = 1
+        for uid, data in manager.active_players.items():
+            data.times_matched_with = history[uid]
+            if history[uid]:
+                manager.mmr_index.mark(uid, data.mmr)
+        mmr = {uid: data.mmr for uid, data in manager.active_players.items()}
+
+        with sockets_muted():
+            start = time.perf_counter()
+            pairs = manager.run_matchmaking_tick()
+            elapsed = time.perf_counter() - start
+
+        diffs = [abs(mmr[a] - mmr[b]) for a, b in pairs]
+        repeats = sum(1 for a, b in pairs if history[a].get(b))
+        results.append({
+            "players": size,
+            "tick_ms": round(elapsed * 1000, 2),
+            "pairs": len(pairs),
+            "mean_mmr_diff": round(sum(diffs) / len(diffs), 2) if diffs else 0,
+            "repeat_pairs": repeats,
+        })
+    return results
+
+
+def _redis_worker(worker: int, players: int, pairings: int, prefix: str, results) -> None:
+    """One benchmark process: enqueue `players` players, then run `pairings` searches."""
+    manager = OfflineRedisActivePlayerManager(prefix=prefix)
+    first_id = worker * players + 1
+    fake_players = [
+        make_fake_player(user_id, int(random.gauss(1200, 300)))
+        for user_id in range(first_id, first_id + players)
+    ]
+
+    start = time.perf_counter()
+    for player in fake_players:
+        manager.add_player(player)
+    enqueue_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(pairings):
+        manager.find_next_match(random.choice(fake_players).user)
+    pair_time = time.perf_counter() - start
+    results.put((enqueue_time, pair_time))
+
+
+def bench_redis_pool(worker_counts=(1, 2, 4, 8), players=2000, pairings=500) -> list:
+    """
+    Measures enqueue and pairing throughput of the Redis-backed pool with N
+    worker processes sharing one queue. Needs the Redis server configured in
+    TETRIS_REDIS_URL; the benchmark keys are deleted afterwards.
+
+    Returns:
+        list: One dict per worker count with aggregate operations per second.
+    """
+    results = []
+    for workers in worker_counts:
+        prefix = f"tetris_bench_{uuid.uuid4().hex[:8]}"
+        queue = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=_redis_worker, args=(w, players, pairings, prefix, queue))
+            for w in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        timings = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+        OfflineRedisActivePlayerManager(prefix=prefix).clear_all_players()
+
+        # Workers run concurrently, so throughput is total work over the slowest worker.
+        results.append({
+            "workers": workers,
+            "enqueue_per_s": round(workers * players / max(t[0] for t in timings)),
+            "pairings_per_s": round(workers * pairings / max(t[1] for t in timings)),
+        })
+    return results
+
+
+def bench_scoring(candidate_counts=(100, 1000, 10000, 50000), history=200, repeat=20) -> list:
+    """
+    Compares scoring a candidate set with the per-candidate Python loop
+    (_pair_score) against the single NumPy pass (_score_candidates) over the
+    pool's arrays. The scored player has `history` previous opponents.
+
+    Returns:
+        list: One dict per candidate count with both timings in ms.
+    """
+    results = []
+    for count in candidate_counts:
+        manager = OfflineActivePlayerManager()
+        for user_id in range(1, count + 2):
+            manager.add_player(make_fake_player(user_id, int(random.gauss(1200, 300))))
+        player = manager.active_players[1]
+        player.times_matched_with = {
+            uid: random.randint(1, 5) for uid in random.sample(range(2, count + 2), min(history, count))
+        }
+        candidates = [data for uid, data in manager.active_players.items() if uid != 1]
+        ids = manager.mmr_index.ids
+        mmrs = manager.mmr_index.mmrs
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            max(candidates, key=lambda c: manager._pair_score(player, c))
+        loop_time = (time.perf_counter() - start) / repeat
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            manager._score_candidates(player, ids, mmrs).argmax()
+        numpy_time = (time.perf_counter() - start) / repeat
+
+        results.append({
+            "candidates": count,
+            "loop_ms": round(loop_time * 1000, 3),
+            "numpy_ms": round(numpy_time * 1000, 3),
+        })
+    return results
+
+
+def bench_push_load(queue_sizes=(100, 1000, 5000), steps=60, step_seconds=5.0,
+                    active_players_poll=5.0, next_match_poll=2.0, heartbeat=60.0) -> list:
+    """
+    Compares the HTTP load of a queued player before and after the
+    matchmaking socket. The run covers `steps` sweeps of `step_seconds` each.
+    Every step, a tick pairs the pool and the same number of new players
+    join. The queue therefore stays at its target size.
+
+    Both sides pay one add-player request per join, and another every
+    `heartbeat` seconds a player stays queued to keep them active. Before:
+    every queued player also polls get_active_players every
+    `active_players_poll` seconds and next-match every `next_match_poll`
+    seconds. After: the queue is pushed, and a matched player makes a
+    single next-match request for the ticket they were pushed. The
+    messages sent through the match_found and queue_changed signals are
+    counted separately, with a queue update counting once per open socket.
+
+    Returns:
+        list: One dict per queue size with requests (or pushed messages) per
+        second per queued player, the "after" requests also broken down.
+    """
+    results = []
+    for size in queue_sizes:
+        manager = OfflineActivePlayerManager(tick_interval=step_seconds)
+        pushed = {"matches": 0, "messages": 0}
+
+        def on_match(sender, **kwargs):
+            pushed["matches"] += 1
+            pushed["messages"] += 1
+
+        def on_queue(sender, size, **kwargs):
+            pushed["messages"] += size
+
+        # Count messages instead of sending them through the channel layer.
+        match_found.connect(on_match, dispatch_uid="bench_push_load_match")
+        queue_changed.connect(on_queue, dispatch_uid="bench_push_load_queue")
+        try:
+            with sockets_muted():
+                next_id = 1
+                joins = 0
+                player_seconds = 0.0
+                for _ in range(steps):
+                    while len(manager.active_players) < size:
+                        manager.add_player(make_fake_player(next_id, int(random.gauss(1200, 300))))
+                        next_id += 1
+                        joins += 1
+                    player_seconds += len(manager.active_players) * step_seconds
+                    manager.last_tick = 0.0
+                    manager.sweep()
+        finally:
+            match_found.disconnect(dispatch_uid="bench_push_load_match")
+            queue_changed.disconnect(dispatch_uid="bench_push_load_queue")
+
+        join_rate = joins / player_seconds
+        heartbeat_rate = 1.0 / heartbeat
+        next_match_rate = pushed["matches"] / player_seconds
+        before = join_rate + heartbeat_rate + 1.0 / active_players_poll + 1.0 / next_match_poll
+        after = join_rate + heartbeat_rate + next_match_rate
+        results.append({
+            "queued": size,
+            "before_req_per_s_per_player": round(before, 4),
+            "after_req_per_s_per_player": round(after, 4),
+            "after_joins_per_s_per_player": round(join_rate, 4),
+            "after_heartbeats_per_s_per_player": round(heartbeat_rate, 4),
+            "after_next_match_per_s_per_player": round(next_match_rate, 4),
+            "after_pushed_per_s_per_player": round(pushed["messages"] / player_seconds, 4),
+        })
+    return results
+
+
+def bench_groups(pool_sizes=(1000, 10000), repeat=20, repeat_rate=0.2) -> list:
+    """
+    Measures _optimal_groups forming pairs and triples over pools of growing
+    size, on the same kind of pool as bench_tick. Only the grouping pass is
+    timed, not ticket issuing.
+
+    Returns:
+        list: One dict per pool and group size with the median and the
+        slowest grouping time in ms, the number of groups and their mean
+        MMR range.
+    """
+    results = []
+    for size in pool_sizes:
+        manager = OfflineActivePlayerManager()
+        for user_id in range(1, size + 1):
+            manager.add_player(make_fake_player(user_id, int(random.gauss(1200, 300))))
+        ids = manager.mmr_index.ids.tolist()
+        for a, b in zip(ids, ids[1:]):
+            if random.random() < repeat_rate:
+                manager.active_players[a].times_matched_with = {b: 1}
+                manager.mmr_index.mark(a, manager.active_players[a].mmr)
+        entries = [manager.active_players[uid] for uid in ids]
+
+        for group_size in manager.GROUP_SIZES:
+            elapsed = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                groups = manager._optimal_groups(entries, group_size, index=manager.mmr_index)
+                elapsed.append(time.perf_counter() - start)
+            ranges = [group[-1].mmr - group[0].mmr for group in groups]
+            results.append({
+                "players": size,
+                "group_size": group_size,
+                "group_ms": round(float(np.median(elapsed)) * 1000, 2),
+                "group_max_ms": round(max(elapsed) * 1000, 2),
+                "groups": len(groups),
+                "mean_mmr_range": round(sum(ranges) / len(ranges), 2) if ranges else 0,
+            })
+    return results
+
+
+def bench_matchmaker(players=500, pairings=500, thread_counts=(1, 4, 16)) -> list:
+    """
+    Integration check of the standalone matchmaking service: starts
+    tetris_matchmaker in a child process and drives it through
+    RemoteActivePlayerManager, next to the same calls on an in-process pool.
+    It verifies that joins, searches, a tick and the tickets it issues all
+    go through, and that manager errors come back as ActivePlayerManagerError.
+
+    Returns:
+        list: One dict per operation with the mean latency in microseconds
+        in-process and over IPC, then one per thread count with the pairing
+        throughput through the shared connection pool.
+    """
+    process, url = start_matchmaker()
+    try:
+        remote = RemoteActivePlayerManager(url=url)
+        local = OfflineActivePlayerManager()
+        pool = [make_fake_player(user_id, int(random.gauss(1200, 300))) for user_id in range(1, players + 1)]
+        rng = random.Random(0)
+        searches = [rng.choice(pool).user for _ in range(pairings)]
+
+        def timed(manager, call, args) -> float:
+            start = time.perf_counter()
+            for arg in args:
+                call(manager, arg)
+            return (time.perf_counter() - start) / len(args) * 1e6
+
+        operations = [
+            ("add_player", lambda manager, player: manager.add_player(player), pool),
+            ("heartbeat", lambda manager, player: manager.add_player(player), pool),
+            ("find_next_match", lambda manager, user: manager.find_next_match(user), searches),
+        ]
+        results = []
+        for name, call, args in operations:
+            results.append({
+                "operation": name,
+                "in_process_us": round(timed(local, call, args), 1),
+                "remote_us": round(timed(remote, call, args), 1),
+            })
+        if sorted(remote.get_active_usernames()) != sorted(local.get_active_usernames()):
+            raise ActivePlayerManagerError("Remote pool lost players.")
+
+        for concurrency in thread_counts:
+            def hammer(seed):
+                thread_rng = random.Random(seed)
+                for _ in range(pairings // concurrency):
+                    remote.find_next_match(thread_rng.choice(pool).user)
+
+            threads = [threading.Thread(target=hammer, args=(i,)) for i in range(concurrency)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            results.append({
+                "operation": "find_next_match",
+                "threads": concurrency,
+                "pairings_per_s": round(concurrency * (pairings // concurrency) / elapsed),
+            })
+
+        groups = remote.run_matchmaking_tick()
+        matched = [user_id for group in groups for user_id in group]
+        tickets = [remote.take_match_ticket(SimpleNamespace(id=user_id)) for user_id in matched]
+        size, _ = remote.get_queue_snapshot()
+        if not groups or not all(tickets) or size != players - len(matched):
+            raise ActivePlayerManagerError("Remote tick did not hand out a ticket to every matched player.")
+        try:
+            remote.remove_player(SimpleNamespace(id=players + 1))
+        except ActivePlayerManagerError:
+            pass
+        else:
+            raise ActivePlayerManagerError("Removing an unknown player did not fail.")
+        results.append({"operation": "tick", "matched": len(matched), "queued": size})
+    finally:
+        process.terminate()
+        process.wait()
+    return results
+
+
+def bench_ratings(round_sizes=(1, 4, 16, 64)) -> list:
+    """
+    Applies a round of two-player results once result by result through
+    update_player_ratings and once as a single apply_match_results batch,
+    inside a transaction that is rolled back afterwards.
+
+    Returns:
+        list: One dict per round size with the queries and time in ms each
+        path needed for the whole round.
+    """
+    results = []
+    for size in round_sizes:
+        try:
+            with transaction.atomic():
+                players = _make_players(2 * size, f"bench_{uuid.uuid4().hex[:8]}")
+                games = [
+                    (players[2 * i].user, players[2 * i + 1].user, random.randint(1, 1000), 0)
+                    for i in range(size)
+                ]
+                row = {"results": size}
+                for name, apply in (
+                    ("single", lambda: [update_player_ratings(*game) for game in games]),
+                    ("batch", lambda: apply_match_results([(u1.id, u2.id, s1, s2) for u1, u2, s1, s2 in games])),
+                ):
+                    with CaptureQueriesContext(connection) as ctx:
+                        start = time.perf_counter()
+                        apply()
+                        elapsed = time.perf_counter() - start
+                    row[f"{name}_queries"] = len(ctx.captured_queries)
+                    row[f"{name}_ms"] = round(elapsed * 1000, 2)
+                results.append(row)
+                raise BenchmarkRollback()
+        except BenchmarkRollback:
+            pass
+    return results
+
+
+def bench_rating_rebuild(game_count=1_000_000, player_counts=(1000, 10000), period_size=10000) -> list:
+    """
+    Replays a synthetic history of random two- and three-player games,
+    `period_size` games per rating period, through replay_periods as
+    rebuild_ratings does, on TetrisPlayer instances that are never saved.
+
+    Returns:
+        list: One dict per history with the time in seconds the replay took.
+    """
+    rng = np.random.default_rng()
+    results = []
+    for count in player_counts:
+        periods, games = [], 0
+        for period_id in range(1, game_count // period_size + 1):
+            sizes = np.where(rng.random(period_size) < 0.8, 2, 3)
+            user_ids = rng.integers(1, count + 1, int(sizes.sum())).tolist()
+            scores = rng.integers(0, 1000, len(user_ids)).tolist()
+            period, position = [], 0
+            for size in sizes.tolist():
+                game = dict(zip(user_ids[position:position + size], scores[position:position + size]))
+                position += size
+                if len(game) == size:
+                    period.append(game)
+            periods.append((period_id, period))
+            games += len(period)
+        players = {user_id: TetrisPlayer(user_id=user_id, matchmaking_rating=INITIAL_RATING)
+                   for _, period in periods for game in period for user_id in game}
+
+        start = time.perf_counter()
+        replay_periods(players, periods)
+        elapsed = time.perf_counter() - start
+        results.append({
+            "games": games,
+            "players": len(players),
+            "periods": len(periods),
+            "replay_s": round(elapsed, 2),
+            "games_per_s": int(games / elapsed),
+        })
+    return results
+
+
+def bench_rating_engines(batch_sizes=(1000, 10000, 100000), player_count=20000) -> list:
+    """
+    Rates one rating period of random games with every engine, for duels
+    and three-player games, and for duels also game by game through
+    calculate_new_ratings for comparison. Players start with random
+    ratings and deviations; nothing touches the database.
+
+    Returns:
+        list: One dict per engine, game size and batch size with the time
+        in ms and the throughput in games per second.
+    """
+    rng = np.random.default_rng()
+    ratings = rng.normal(INITIAL_RATING, 300, player_count)
+    deviations = rng.uniform(50, INITIAL_DEVIATION, player_count)
+    volatilities = np.full(player_count, INITIAL_VOLATILITY)
+    idle_periods = rng.integers(0, 5, player_count)
+
+    def row(engine, size, games, elapsed):
+        return {"engine": engine, "players_per_game": size, "games": games,
+                "ms": round(elapsed * 1000, 2), "games_per_s": int(games / elapsed)}
+
+    results = []
+    for games in batch_sizes:
+        for size in (2, 3):
+            # Distinct players per game: a random first one, the others at random offsets from it.
+            first = rng.integers(0, player_count, (games, 1))
+            step = rng.integers(1, player_count // size, (games, 1))
+            players = (first + step * np.arange(size)) % player_count
+            scores = rng.integers(0, 1000, (games, size)).astype(float)
+            for name, engine in ENGINES.items():
+                start = time.perf_counter()
+                engine().rate(ratings, deviations, volatilities, idle_periods, players, scores)
+                results.append(row(name, size, games, time.perf_counter() - start))
+            if size == 2:
+                start = time.perf_counter()
+                for (a, b), (score1, score2) in zip(players.tolist(), scores.tolist()):
+                    if score1 != score2:
+                        calculate_new_ratings(int(ratings[a]), int(ratings[b]), 1 if score1 > score2 else 2)
+                results.append(row("elo-loop", size, games, time.perf_counter() - start))
+    return results
+
+
+def bench_leaderboard(sizes=(1000, 10000), lookups=200) -> list:
+    """
+    Looks up the rank of random players by counting the players rated
+    above them, as a request would without the leaderboard, and through a
+    loaded Leaderboard; then moves random players to new ratings one by
+    one. Runs inside a transaction that is rolled back afterwards.
+
+    Returns:
+        list: One dict per number of players with the time in ms per
+        lookup for each path, per incremental update, and for a full load.
+    """
+    results = []
+    for size in sizes:
+        try:
+            with transaction.atomic():
+                players = _make_players(size, f"bench_{uuid.uuid4().hex[:8]}")
+                sample = random.sample(players, min(lookups, size))
+
+                start = time.perf_counter()
+                for player in sample:
+                    TetrisPlayer.objects.filter(matchmaking_rating__gt=player.matchmaking_rating).count()
+                count_ms = (time.perf_counter() - start) * 1000 / len(sample)
+
+                board = Leaderboard(refresh_interval=float("inf"))
+                start = time.perf_counter()
+                board.load()
+                load_ms = (time.perf_counter() - start) * 1000
+
+                start = time.perf_counter()
+                for player in sample:
+                    board.standing(player.user_id, radius=5)
+                standing_ms = (time.perf_counter() - start) * 1000 / len(sample)
+
+                start = time.perf_counter()
+                for player in sample:
+                    board.update({player.user_id: random.randint(800, 2400)})
+                update_ms = (time.perf_counter() - start) * 1000 / len(sample)
+
+                results.append({
+                    "players": size,
+                    "count_query_ms": round(count_ms, 3),
+                    "standing_ms": round(standing_ms, 3),
+                    "update_ms": round(update_ms, 3),
+                    "load_ms": round(load_ms, 1),
+                })
+                raise BenchmarkRollback()
+        except BenchmarkRollback:
+            pass
+    return results
+
+
+def bench_score_writes(score_counts=(100, 1000)) -> list:
+    """
+    Saves a burst of new scores, then saves them all again as a resubmit
+    would, three ways: update_or_create per score (a SELECT, then an INSERT
+    or UPDATE), upsert_scores per score (one statement) and one
+    upsert_scores call for the whole burst. Runs inside a transaction that
+    is rolled back afterwards.
+
+    Returns:
+        list: One dict per path, burst size and phase with the queries
+        issued and the throughput in scores per second.
+    """
+    def update_or_create(scores):
+        for user_id, gameid, score, lines_cleared, level in scores:
+            TetrisScore.objects.update_or_create(
+                user_id=user_id, gameid=gameid,
+                defaults={'score': score, 'lines_cleared': lines_cleared, 'level': level}
+            )
+
+    paths = (
+        ("update_or_create", update_or_create),
+        ("upsert", lambda scores: [upsert_scores([row]) for row in scores]),
+        ("upsert_batch", upsert_scores),
+    )
+    results = []
+    for count in score_counts:
+        try:
+            with transaction.atomic():
+                players = _make_players(2, f"bench_{uuid.uuid4().hex[:8]}")
+                for name, save in paths:
+                    scores = [
+                        (players[i % 2].user_id, f"{name}_{i // 2}", random.randint(0, 10000), 0, 1)
+                        for i in range(count)
+                    ]
+                    for phase in ("insert", "update"):
+                        connection.queries_log.clear()  # The log is capped; keep the counts exact.
+                        with CaptureQueriesContext(connection) as ctx:
+                            start = time.perf_counter()
+                            save(scores)
+                            elapsed = time.perf_counter() - start
+                        results.append({
+                            "path": name, "scores": count, "phase": phase,
+                            "queries": len(ctx.captured_queries),
+                            "scores_per_s": int(count / elapsed),
+                        })
+                raise BenchmarkRollback()
+        except BenchmarkRollback:
+            pass
+    return results
+
+
+def bench_score_history(history_sizes=(10, 100, 500), page_size=20) -> list:
+    """
+    Lists a player's score history the old way, every score of every game
+    they played through TetrisScoreSerializer, and a page at a time through
+    get_score_page, walking every page. The queries per page must stay at
+    one however long the history is; the walk must return every game
+    exactly once. Runs inside a transaction that is rolled back afterwards.
+
+    Returns:
+        list: One dict per history size with the queries and time in ms of
+        the full dump and of one page, and the games the page walk found.
+    """
+    results = []
+    for size in history_sizes:
+        try:
+            with transaction.atomic():
+                players = _make_players(3, f"bench_{uuid.uuid4().hex[:8]}")
+                upsert_scores(
+                    (player.user_id, f"game_{i}", random.randint(0, 10000), 0, 1)
+                    for i in range(size) for player in random.sample(players, 2) + players[:1]
+                )
+                user_id = players[0].user_id
+                row = {"games": size}
+
+                connection.queries_log.clear()  # The log is capped; keep the counts exact.
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    games = TetrisScore.objects.filter(user_id=user_id).values_list('gameid', flat=True)
+                    TetrisScoreSerializer(TetrisScore.objects.filter(gameid__in=games), many=True).data
+                    row["dump_ms"] = round((time.perf_counter() - start) * 1000, 2)
+                row["dump_queries"] = len(ctx.captured_queries)
+
+                connection.queries_log.clear()
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    page = get_score_page(user_id, limit=page_size)
+                    row["page_ms"] = round((time.perf_counter() - start) * 1000, 2)
+                row["page_queries"] = len(ctx.captured_queries)
+
+                seen = {score["gameid"] for score in page["scores"]}
+                pages = 1
+                while page["next"]:
+                    page = get_score_page(user_id, page["next"], page_size)
+                    seen.update(score["gameid"] for score in page["scores"])
+                    pages += 1
+                row["pages"] = pages
+                row["games_found"] = len(seen)
+                results.append(row)
+                raise BenchmarkRollback()
+        except BenchmarkRollback:
+            pass
+    return results
@@ -0,0 +1,21 @@
+from django.contrib.auth import get_user_model
+
+
+def fetch_block_lists(user_ids) -> dict:
+    """
+    Returns {user_id: set of excluded user ids} for every user in user_ids,
+    in one query. CustomUser.blocked is symmetrical, so a user's set holds
+    both the users they blocked and the users who blocked them.
+    """
+    user_ids = list(user_ids)
+    block_lists = {uid: set() for uid in user_ids}
+    if not user_ids:
+        return block_lists
+
+    Blocked = get_user_model().blocked.through
+    rows = Blocked.objects.filter(
+        from_customuser_id__in=user_ids
+    ).values_list('from_customuser_id', 'to_customuser_id')
+    for user_id, blocked_id in rows:
+        block_lists[user_id].add(blocked_id)
+    return block_lists
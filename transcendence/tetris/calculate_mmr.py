@@ -1,13 +1,19 @@
-from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.models import User
+from django.db import transaction
+from .leaderboard import ratings_changed
 from .models import TetrisPlayer
+from .rating_history import record_ratings
+
+K_FACTOR = 32  # Rating points at stake in a game.
+RATING_SCALE = 400  # A rating difference of RATING_SCALE means 10 to 1 odds.
+INITIAL_RATING = 1200  # Rating of a new player.
 
 def update_player_ratings(user1: User, user2: User, player1_score: int, player2_score: int):
     """
-    Determines the winner between two players based on their scores, retrieves
-    the players' current MMR from the TetrisPlayer database, calls
-    calculate_new_ratings to update their ratings, and saves the updated ratings
-    back to the database.
+    Determines the winner between two players based on their scores and
+    applies the Elo change to both players' TetrisPlayer rows atomically
+    (see apply_match_results), so concurrent results for the same player
+    cannot overwrite each other.
     
     Args:
         user1 (User): Django User instance for player 1.
@@ -18,34 +24,63 @@ def update_player_ratings(user1: User, user2: User, player1_score: int, player2_
     Returns:
         tuple: Updated TetrisPlayer objects for user1 and user2.
     """
-    try:
-        player1 = TetrisPlayer.objects.get(user=user1)
-        player2 = TetrisPlayer.objects.get(user=user2)
-    except ObjectDoesNotExist:
-        raise ValueError("One or both players do not exist in the database.")
+    players = apply_match_results([(user1.id, user2.id, player1_score, player2_score)])
+    return players[user1.id], players[user2.id]
 
-    # Determine the winner by comparing scores.
-    if player1_score > player2_score:
-        result = 1  # user1 is the winner.
-    elif player2_score > player1_score:
-        result = 2  # user2 is the winner.
-    else:
-        raise ValueError("Scores are tied. No winner could be determined.")
+def apply_match_results(results) -> dict:
+    """
+    Applies the Elo changes of a list of two-player results, e.g. a whole
+    tournament round, in one transaction: every player's row is locked with
+    a single SELECT ... FOR UPDATE, in primary key order so concurrent
+    batches cannot deadlock, and all new ratings are written back with a
+    single UPDATE and appended to the rating history with a single INSERT.
+    Results are applied in order, so a player who appears in several of
+    them gets each change on top of the previous one.
+
+    Args:
+        results: Iterable of (user1_id, user2_id, player1_score, player2_score).
+
+    Returns:
+        dict: {user_id: TetrisPlayer} with the updated ratings.
+    """
+    # Validate every result before touching the database.
+    outcomes = [
+        (user1_id, user2_id, _result_from_scores(player1_score, player2_score))
+        for user1_id, user2_id, player1_score, player2_score in results
+    ]
+    user_ids = {user_id for user1_id, user2_id, _ in outcomes for user_id in (user1_id, user2_id)}
+    if not user_ids:
+        return {}
 
-    # Calculate new ratings using the provided function.
-    new_rating1, new_rating2 = calculate_new_ratings(
-        player1_rating=player1.matchmaking_rating,
-        player2_rating=player2.matchmaking_rating,
-        result=result
-    )
+    with transaction.atomic():
+        players = {
+            player.user_id: player
+            for player in TetrisPlayer.objects.select_for_update().filter(user_id__in=user_ids).order_by('pk')
+        }
+        if len(players) != len(user_ids):
+            raise ValueError("One or both players do not exist in the database.")
 
-    # Update the player objects with the new ratings and save.
-    player1.matchmaking_rating = new_rating1
-    player2.matchmaking_rating = new_rating2
-    player1.save()
-    player2.save()
+        for user1_id, user2_id, result in outcomes:
+            player1, player2 = players[user1_id], players[user2_id]
+            player1.matchmaking_rating, player2.matchmaking_rating = calculate_new_ratings(
+                player1_rating=player1.matchmaking_rating,
+                player2_rating=player2.matchmaking_rating,
+                result=result
+            )
+        # One UPDATE ... SET matchmaking_rating = CASE id WHEN ... END for every row.
+        TetrisPlayer.objects.bulk_update(players.values(), ['matchmaking_rating'])
+        changes = {user_id: player.matchmaking_rating for user_id, player in players.items()}
+        record_ratings(changes)
+        ratings_changed(changes)
+    return players
 
-    return player1, player2
+def _result_from_scores(player1_score: int, player2_score: int) -> int:
+    """Returns 1 if player 1 won, 2 if player 2 won; ties have no winner."""
+    if player1_score > player2_score:
+        return 1  # user1 is the winner.
+    elif player2_score > player1_score:
+        return 2  # user2 is the winner.
+    raise ValueError("Scores are tied. No winner could be determined.")
 
 def calculate_new_ratings(player1_rating: int, player2_rating: int, result: int):
     """
@@ -60,11 +95,11 @@ def calculate_new_ratings(player1_rating: int, player2_rating: int, result: int)
         tuple: Updated ratings for player 1 and player 2.
     """
     # Define the K-factor (adjustment factor).
-    K = 32
+    K = K_FACTOR
 
     # Calculate expected outcomes.
-    expected1 = 1 / (1 + 10 ** ((player2_rating - player1_rating) / 400))
-    expected2 = 1 / (1 + 10 ** ((player1_rating - player2_rating) / 400))
+    expected1 = 1 / (1 + 10 ** ((player2_rating - player1_rating) / RATING_SCALE))
+    expected2 = 1 / (1 + 10 ** ((player1_rating - player2_rating) / RATING_SCALE))
 
     # Determine the actual outcomes based on the result.
     if result == 1:  # user1 won.
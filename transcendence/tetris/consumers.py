@@ -0,0 +1,57 @@
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+from .active_player_manager import active_player_manager
+from .notifications import QUEUE_GROUP, user_group
+
+
+@database_sync_to_async
+def get_user_from_token(token: str):
+    """Returns the user for a JWT access token, or None if it is not valid."""
+    auth = JWTAuthentication()
+    try:
+        return auth.get_user(auth.get_validated_token(token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+class MatchmakingConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes matchmaking events to a queued player, replacing the polling of
+    tetris/get_active_players and tetris/next-match:
+        {"type": "queue", "size": int, "players": [username, ...]}
+        {"type": "match", "player1": username, "player2": username[, "player3": username]}
+
+    Browsers cannot set headers on a WebSocket, so the JWT access token is
+    passed as the `token` query parameter.
+    """
+
+    async def connect(self):
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        token = query.get("token", [None])[0]
+        self.user = await get_user_from_token(token) if token else None
+        if self.user is None:
+            await self.close(code=4001)
+            return
+
+        await self.channel_layer.group_add(QUEUE_GROUP, self.channel_name)
+        await self.channel_layer.group_add(user_group(self.user.id), self.channel_name)
+        await self.accept()
+
+        size, players = await active_player_manager.aget_queue_snapshot()
+        await self.send_json({"type": "queue", "size": size, "players": players})
+
+    async def disconnect(self, code):
+        if getattr(self, "user", None) is None:
+            return
+        await self.channel_layer.group_discard(QUEUE_GROUP, self.channel_name)
+        await self.channel_layer.group_discard(user_group(self.user.id), self.channel_name)
+
+    async def queue_update(self, event):
+        await self.send_json({"type": "queue", "size": event["size"], "players": event["players"]})
+
+    async def match_found(self, event):
+        players = {key: value for key, value in event.items() if key.startswith("player")}
+        await self.send_json({"type": "match", **players})
@@ -1,18 +1,211 @@
 import sys
 import random
 import locale
+import time
 from collections import defaultdict
+from types import SimpleNamespace
 from typing import Optional, Tuple
-from .active_player_manager import active_player_manager
+import numpy as np
+from .active_player_manager import ActivePlayerManager, active_player_manager
+from .notifications import sockets_muted
 
 class SimplePlayer:
-    def __init__(self, name, matchmaking_rating=1500):
+    def __init__(self, name, matchmaking_rating=1500, user_id=None):
         self.name = name
         self.matchmaking_rating = matchmaking_rating
+        # ActivePlayerManager reads player.user.id and player.user.username.
+        self.user = SimpleNamespace(id=user_id, username=name)
 
     def __repr__(self):
         return f"<SimplePlayer {self.name} (MMR: {self.matchmaking_rating})>"
 
+# -------------------------------
+# Matchmaking Simulator
+# -------------------------------
+MMR_DISTRIBUTIONS = {
+    "normal": lambda rng, n: rng.normal(1200, 300, n),
+    "uniform": lambda rng, n: rng.uniform(400, 2400, n),
+    # Two skill clusters, e.g. a casual majority and a competitive core.
+    "bimodal": lambda rng, n: np.where(
+        rng.random(n) < 0.7, rng.normal(1000, 150, n), rng.normal(1800, 150, n)
+    ),
+}
+
+class SimulatedActivePlayerManager(ActivePlayerManager):
+    """ActivePlayerManager whose match histories come from the simulation instead of the database."""
+    # Leaving is modelled by the simulation's leave rate, not by missed heartbeats.
+    INACTIVITY_THRESHOLD = float("inf")
+
+    def __init__(self, history: dict, tick_interval: float = 0, group_size: int = 2):
+        super().__init__(tick_interval=tick_interval, group_size=group_size)
+        self.history = history
+
+    def fetch_match_histories_from_db(self, user_ids) -> dict:
+        return {uid: dict(self.history[uid]) for uid in user_ids}
+
+    def fetch_exclusions_from_db(self, user_ids) -> dict:
+        return {uid: set() for uid in user_ids}
+
+def _summary(values, scale: float = 1.0) -> dict:
+    """Percentiles of values, multiplied by scale and rounded for reporting."""
+    if not values:
+        return {"count": 0}
+    data = np.asarray(values, dtype=float) * scale
+    p50, p90, p95, p99 = np.percentile(data, [50, 90, 95, 99])
+    return {
+        "count": len(data),
+        "mean": round(float(data.mean()), 3),
+        "p50": round(float(p50), 3),
+        "p90": round(float(p90), 3),
+        "p95": round(float(p95), 3),
+        "p99": round(float(p99), 3),
+        "max": round(float(data.max()), 3),
+    }
+
+def simulate(population: int = 2000, duration: float = 600.0, step: float = 1.0,
+             join_rate: float = 10.0, leave_rate: float = 0.005, distribution: str = "normal",
+             mode: str = "request", poll_interval: float = 2.0, tick_interval: float = 5.0,
+             group_size: int = 2, seed: Optional[int] = None) -> dict:
+    """
+    Drives an ActivePlayerManager with a synthetic population, entirely in
+    memory and on a simulated clock, and reports how well it matches.
+
+    Every step, idle players join the queue at `join_rate` per second and
+    queued players abandon it with a hazard of `leave_rate` per second. In
+    "request" mode each queued player calls find_next_match every
+    `poll_interval` seconds, as the front end does, and a returned pair
+    starts a game. In "tick" mode a matchmaking tick pairs the pool every
+    `tick_interval` seconds, in groups of `group_size`. Matched players go back to the idle population
+    with the game added to their history, so repeat opponents can occur.
+
+    Args:
+        population: Number of distinct players.
+        duration: Simulated seconds to run for.
+        step: Simulated seconds per step.
+        join_rate: Mean number of idle players joining per second.
+        leave_rate: Per-second probability that a queued player gives up.
+        distribution: Name of the MMR distribution, see MMR_DISTRIBUTIONS.
+        mode: "request" or "tick".
+        poll_interval: Request mode: seconds between a player's match requests.
+        tick_interval: Tick mode: seconds between matchmaking ticks.
+        group_size: Tick mode: players per match, 2 or 3.
+        seed: Seed for the population and the simulation, for repeatable runs.
+
+    Returns:
+        dict: The configuration and the results: pairing latency
+        percentiles in ms (per request or per tick), queue wait percentiles
+        in simulated seconds, MMR spread per match and the share of matches
+        between players who had already met.
+    """
+    if distribution not in MMR_DISTRIBUTIONS:
+        raise ValueError(f"Unknown MMR distribution '{distribution}'.")
+    if mode not in ("request", "tick"):
+        raise ValueError(f"Unknown matchmaking mode '{mode}'.")
+    if mode == "request" and group_size != 2:
+        raise ValueError("Groups of three are only formed in tick mode.")
+
+    config = {
+        "population": population, "duration": duration, "step": step,
+        "join_rate": join_rate, "leave_rate": leave_rate, "distribution": distribution,
+        "mode": mode, "poll_interval": poll_interval, "tick_interval": tick_interval,
+        "group_size": group_size, "seed": seed,
+    }
+    rng = np.random.default_rng(seed)
+    mmrs = np.clip(MMR_DISTRIBUTIONS[distribution](rng, population), 0, None).astype(int)
+    players = {
+        user_id: SimplePlayer(f"sim_{user_id}", int(mmr), user_id=user_id)
+        for user_id, mmr in enumerate(mmrs.tolist(), start=1)
+    }
+    ids_by_name = {player.name: user_id for user_id, player in players.items()}
+    history = defaultdict(lambda: defaultdict(int))
+
+    clock = {"now": 0.0}
+    manager = SimulatedActivePlayerManager(history, group_size=group_size)
+    manager.rng = np.random.default_rng(rng.integers(2 ** 32))
+    manager.clock = lambda: clock["now"]
+
+    idle = list(players)
+    joined_at = {}
+    latencies = []
+    waits = []
+    spreads = []
+    repeats = 0
+    abandoned = 0
+    last_tick = 0.0
+
+    def start_game(now, user_ids):
+        nonlocal repeats
+        for user_id in user_ids:
+            waits.append(now - joined_at.pop(user_id))
+            idle.append(user_id)
+        ratings = [players[user_id].matchmaking_rating for user_id in user_ids]
+        spreads.append(max(ratings) - min(ratings))
+        # A match is a repeat if any two of its players have met before.
+        if any(history[a][b] for a in user_ids for b in user_ids if a != b):
+            repeats += 1
+        for a in user_ids:
+            for b in user_ids:
+                if a != b:
+                    history[a][b] += 1
+
+    with sockets_muted():
+        for now in np.arange(0.0, duration, step).tolist():
+            clock["now"] = now
+            # Joins: a Poisson number of random idle players.
+            joins = min(len(idle), int(rng.poisson(join_rate * step)))
+            for _ in range(joins):
+                user_id = idle.pop(int(rng.integers(len(idle))))
+                manager.add_player(players[user_id])
+                joined_at[user_id] = now
+
+            # Leaves: each queued player gives up with the per-step hazard.
+            queued = list(joined_at)
+            quitting = rng.random(len(queued)) < 1 - np.exp(-leave_rate * step)
+            for user_id in np.asarray(queued)[quitting].tolist():
+                manager.remove_player(players[user_id].user)
+                del joined_at[user_id]
+                idle.append(user_id)
+                abandoned += 1
+
+            if mode == "tick":
+                if now - last_tick < tick_interval:
+                    continue
+                last_tick = now
+                start = time.perf_counter()
+                groups = manager.run_matchmaking_tick()
+                latencies.append(time.perf_counter() - start)
+                for user_ids in groups:
+                    for user_id in user_ids:
+                        manager.take_match_ticket(players[user_id].user)
+                    start_game(now, user_ids)
+                continue
+
+            # Request mode: a random share of the queue polls this step.
+            polling = [uid for uid in joined_at if rng.random() < step / poll_interval]
+            for user_id in polling:
+                if user_id not in joined_at:
+                    continue  # Matched earlier in this step.
+                start = time.perf_counter()
+                _, opponent = manager.find_next_match(players[user_id].user)
+                latencies.append(time.perf_counter() - start)
+                if not opponent:
+                    continue
+                opponent_id = ids_by_name[opponent]
+                manager.remove_player(players[user_id].user)
+                manager.remove_player(players[opponent_id].user)
+                start_game(now, (user_id, opponent_id))
+
+    return {
+        "config": config,
+        "matches": len(spreads),
+        "abandoned": abandoned,
+        "queued_at_end": len(joined_at),
+        "pairing_latency_ms": _summary(latencies, scale=1000),
+        "wait_s": _summary(waits),
+        "mmr_spread": _summary(spreads),
+        "repeat_rate": round(repeats / len(spreads), 4) if spreads else 0.0,
+    }
+
 def detect_keyboard_layout() -> str:
     """
     Detects the keyboard layout based on the system locale.
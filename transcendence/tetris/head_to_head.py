@@ -0,0 +1,121 @@
+import datetime
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import TetrisHeadToHead, TetrisScore
+
+
+def _ordered_pair(user1_id: int, user2_id: int) -> tuple:
+    """Returns the pair with the lower user id first, as stored in TetrisHeadToHead."""
+    return (user1_id, user2_id) if user1_id < user2_id else (user2_id, user1_id)
+
+
+def lock_game(gameid: str) -> None:
+    """
+    Takes a lock on gameid, held until the transaction ends. Two players'
+    first scores for a game may be saved at the same time; under READ
+    COMMITTED neither would see the other's row, and the pair would never
+    be counted nor the game given a result. With the lock, whichever takes
+    it second reads the other's committed row. Transactions locking
+    several games lock them in gameid order. SQLite serialises writers
+    anyway.
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [gameid])
+
+
+def record_game(gameid: str, user_ids, played_at=None) -> None:
+    """
+    Counts a new game between each of user_ids and every other player with
+    a score for gameid, each pair once. Call this once per game, when the
+    users' score rows for it are first created, and inside the same
+    transaction. Transactions recording several games must record them in
+    gameid order, so the locks are taken in the same order everywhere.
+
+    Args:
+        gameid (str): The game the scores belong to.
+        user_ids: The users whose scores for the game were just created.
+        played_at (datetime, optional): Defaults to now.
+    """
+    played_at = played_at or timezone.now()
+    lock_game(gameid)
+    new = set(user_ids)
+    players = set(TetrisScore.objects.filter(gameid=gameid).values_list('user_id', flat=True))
+    pairs = sorted({_ordered_pair(user_id, other_id) for user_id in new for other_id in players if other_id != user_id})
+    for user_a_id, user_b_id in pairs:
+        pair, created = TetrisHeadToHead.objects.get_or_create(
+            user_a_id=user_a_id,
+            user_b_id=user_b_id,
+            defaults={'games': 1, 'last_played': played_at},
+        )
+        if not created:
+            TetrisHeadToHead.objects.filter(pk=pair.pk).update(
+                games=F('games') + 1,
+                last_played=played_at,
+            )
+
+
+def fetch_head_to_head(user_ids) -> dict:
+    """
+    Returns {user_id: {opponent_id: games}} for every user in user_ids,
+    read straight from the counter table.
+    """
+    user_ids = list(user_ids)
+    histories = {uid: {} for uid in user_ids}
+    if not user_ids:
+        return histories
+
+    rows = TetrisHeadToHead.objects.filter(
+        Q(user_a_id__in=user_ids) | Q(user_b_id__in=user_ids)
+    ).values_list('user_a_id', 'user_b_id', 'games')
+    for user_a_id, user_b_id, games in rows:
+        if user_a_id in histories:
+            histories[user_a_id][user_b_id] = games
+        if user_b_id in histories:
+            histories[user_b_id][user_a_id] = games
+    return histories
+
+
+def get_pair(user1_id: int, user2_id: int):
+    """Returns the TetrisHeadToHead row for two users, or None if they never met."""
+    user_a_id, user_b_id = _ordered_pair(user1_id, user2_id)
+    return TetrisHeadToHead.objects.filter(user_a_id=user_a_id, user_b_id=user_b_id).first()
+
+
+def _to_datetime(value):
+    """Raw queries return strings on some backends (SQLite); normalise to an aware datetime."""
+    value = TetrisHeadToHead._meta.get_field('last_played').to_python(value)
+    if value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value, datetime.timezone.utc)
+    return value
+
+
+def rebuild_head_to_head() -> int:
+    """
+    Recomputes the whole counter table from TetrisScore with one self-join
+    on gameid. Used to backfill existing data.
+
+    Returns:
+        int: The number of pairs written.
+    """
+    table = connection.ops.quote_name(TetrisScore._meta.db_table)
+    query = (
+        f"SELECT a.user_id, b.user_id, COUNT(*), MAX(b.timestamp) "
+        f"FROM {table} a JOIN {table} b "
+        f"ON a.gameid = b.gameid AND a.user_id < b.user_id "
+        f"GROUP BY a.user_id, b.user_id"
+    )
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(query)
+            rows = cursor.fetchall()
+        TetrisHeadToHead.objects.all().delete()
+        TetrisHeadToHead.objects.bulk_create(
+            [
+                TetrisHeadToHead(user_a_id=a, user_b_id=b, games=games, last_played=_to_datetime(last_played))
+                for a, b, games, last_played in rows
+            ],
+            batch_size=1000,
+        )
+    return len(rows)
@@ -0,0 +1,173 @@
+import threading
+import time
+from typing import Optional
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from sortedcontainers import SortedList
+from .models import TetrisPlayer
+
+class Leaderboard:
+    """
+    Every TetrisPlayer ranked by rating, held in memory: a SortedList of
+    (negated rating, user id), i.e. by rating descending with ties broken
+    by user id. A player's rank, percentile and the neighbours around them
+    are a few O(log n) binary searches, a page of the leaderboard is a
+    slice, and moving a player is an O(log n) removal and insertion,
+    instead of a COUNT over TetrisPlayer per request.
+
+    Ranks are competition ranks: players with the same rating share a rank
+    and the next rank skips accordingly (1, 2, 2, 4).
+
+    The code that writes ratings reports the new values through
+    ratings_changed, which applies them in place once the transaction
+    commits. Those reports only reach the process that made the change, so
+    each process also reloads the whole ranking from the database every
+    refresh_interval seconds (TETRIS_LEADERBOARD_REFRESH), which bounds how
+    stale a ranking can be after e.g. a rating period run from cron.
+    """
+    def __init__(self, refresh_interval: float = 60):
+        self.refresh_interval = refresh_interval
+        self.clock = time.monotonic
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()  # One reload at a time; readers keep the old ranking meanwhile.
+        self.ranking = SortedList()  # (-rating, user_id)
+        self.ratings = {}  # user_id -> rating, to find a player's current position.
+        self.usernames = {}
+        self.loaded_at = None
+        self._pending = None  # Changes reported while a reload is reading the database.
+
+    def load(self):
+        """Reloads the ranking from the database, using the rating index for the ordering."""
+        with self.lock:
+            self._pending = {}
+        try:
+            rows = list(
+                TetrisPlayer.objects.order_by('-matchmaking_rating', 'user_id')
+                .values_list('user_id', 'matchmaking_rating', 'user__username')
+            )
+        except Exception:
+            with self.lock:
+                self._pending = None
+            raise
+        with self.lock:
+            self.ranking = SortedList((-rating, user_id) for user_id, rating, _ in rows)
+            self.ratings = {user_id: rating for user_id, rating, _ in rows}
+            self.usernames = {user_id: username for user_id, _, username in rows}
+            self.loaded_at = self.clock()
+            # Changes committed while the query ran may be missing from it.
+            pending, self._pending = self._pending, None
+            self._apply(pending)
+
+    def _stale(self) -> bool:
+        return self.loaded_at is None or self.clock() - self.loaded_at >= self.refresh_interval
+
+    def _ensure_loaded(self):
+        if self._stale() and self.load_lock.acquire(blocking=self.loaded_at is None):
+            try:
+                if self._stale():
+                    self.load()
+            finally:
+                self.load_lock.release()
+
+    def _rank(self, rating: int) -> int:
+        """The competition rank of a rating: one more than the players rated above it."""
+        return self.ranking.bisect_left((-rating,)) + 1
+
+    def update(self, changes: dict, usernames: Optional[dict] = None):
+        """
+        Moves players to their new rating, adding those not ranked yet.
+        Does nothing until the ranking is first loaded, which reads every
+        rating anyway.
+
+        Args:
+            changes (dict): {user_id: new rating}; a rating of None removes the player.
+            usernames (dict, optional): {user_id: username} for players not ranked yet.
+        """
+        with self.lock:
+            if usernames:
+                self.usernames.update(usernames)
+            if self._pending is not None:
+                self._pending.update(changes)
+            if self.loaded_at is not None:
+                self._apply(changes)
+
+    def _apply(self, changes: dict):
+        """Applies changes to the ranking, O(log n) each. The caller holds the lock."""
+        for user_id, rating in changes.items():
+            old = self.ratings.pop(user_id, None)
+            if old is not None:
+                self.ranking.remove((-old, user_id))
+            if rating is not None:
+                self.ranking.add((-rating, user_id))
+                self.ratings[user_id] = rating
+
+    def _rows(self, lo: int, hi: int) -> list:
+        """The ranking entries at positions [lo, hi). The caller holds the lock."""
+        return [
+            {"rank": self._rank(-key), "user": self.usernames.get(user_id, user_id), "mmr": -key}
+            for key, user_id in self.ranking.islice(lo, hi)
+        ]
+
+    def top(self, offset: int = 0, limit: int = 50) -> dict:
+        """
+        Returns a page of the leaderboard.
+
+        Returns:
+            dict: The number of ranked players and the page, highest rating first.
+        """
+        self._ensure_loaded()
+        with self.lock:
+            size = len(self.ranking)
+            return {"size": size, "players": self._rows(offset, min(offset + limit, size))}
+
+    def standing(self, user_id: int, radius: int = 5) -> Optional[dict]:
+        """
+        Returns a player's rank, their percentile (the share of the other
+        players rated below them) and the `radius` players either side.
+
+        Returns:
+            dict: The standing, or None if the player is not ranked.
+        """
+        self._ensure_loaded()
+        with self.lock:
+            rating = self.ratings.get(user_id)
+            if rating is None:
+                return None
+            size = len(self.ranking)
+            pos = self.ranking.index((-rating, user_id))
+            below = size - self.ranking.bisect_left((-rating + 1,))
+            return {
+                "rank": self._rank(rating),
+                "mmr": rating,
+                "percentile": round(100 * below / (size - 1), 1) if size > 1 else 100.0,
+                "size": size,
+                "around": self._rows(max(pos - radius, 0), min(pos + radius + 1, size)),
+            }
+
+leaderboard = Leaderboard(refresh_interval=getattr(settings, "TETRIS_LEADERBOARD_REFRESH", 60))
+
+def ratings_changed(changes: dict):
+    """
+    Reports new ratings to the leaderboard once the current transaction
+    commits, so a rolled back update never shows. Every write of
+    TetrisPlayer.matchmaking_rating that bypasses save(), e.g.
+    bulk_update, must call this; save() and delete() are covered by the
+    signal handlers.
+
+    Args:
+        changes (dict): {user_id: new rating}; None for a removed player.
+    """
+    if not changes:
+        return
+    changes = dict(changes)
+
+    def apply():
+        unknown = [user_id for user_id, rating in changes.items()
+                   if rating is not None and user_id not in leaderboard.usernames]
+        usernames = dict(
+            get_user_model().objects.filter(id__in=unknown).values_list('id', 'username')
+        ) if unknown and leaderboard.loaded_at is not None else None
+        leaderboard.update(changes, usernames)
+
+    transaction.on_commit(apply)
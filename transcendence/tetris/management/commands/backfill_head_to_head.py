@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from tetris.head_to_head import rebuild_head_to_head
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the Tetris head-to-head counter table from recorded scores."
+
+    def handle(self, *args, **options):
+        pairs = rebuild_head_to_head()
+        self.stdout.write(self.style.SUCCESS(f"Head-to-head table rebuilt with {pairs} pairs."))
@@ -0,0 +1,43 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from api import benchmarks as api_benchmarks
+from tetris import benchmarks
+
+
+class Command(BaseCommand):
+    help = "Runs Tetris matchmaking benchmarks against the configured database."
+
+    SCENARIOS = {
+        "queue-join": benchmarks.bench_queue_join,
+        "pairing": benchmarks.bench_pairing,
+        "tick": benchmarks.bench_tick,
+        "redis-pool": benchmarks.bench_redis_pool,
+        "scoring": benchmarks.bench_scoring,
+        "push-load": benchmarks.bench_push_load,
+        "groups": benchmarks.bench_groups,
+        "matchmaker": benchmarks.bench_matchmaker,
+        "ratings": benchmarks.bench_ratings,
+        "rating-rebuild": benchmarks.bench_rating_rebuild,
+        "rating-engines": benchmarks.bench_rating_engines,
+        "leaderboard": benchmarks.bench_leaderboard,
+        "score-writes": benchmarks.bench_score_writes,
+        "score-history": benchmarks.bench_score_history,
+        "serializers": api_benchmarks.bench_serializers,
+        "game-stats": api_benchmarks.bench_game_stats,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenario", choices=sorted(self.SCENARIOS))
+        parser.add_argument("--json", action="store_true", help="Print raw JSON results.")
+
+    def handle(self, *args, **options):
+        try:
+            results = self.SCENARIOS[options["scenario"]]()
+        except Exception as e:
+            raise CommandError(str(e)) from e
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results))
+            return
+        for row in results:
+            self.stdout.write("  ".join(f"{key}={value}" for key, value in row.items()))
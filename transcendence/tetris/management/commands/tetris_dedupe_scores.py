@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max
+from tetris.models import TetrisScore
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes duplicate Tetris scores, keeping the latest row per player and game. "
+        "Run it on databases created before the (gameid, user) unique constraint, before migrating; "
+        "entrypoint.sh does. Does nothing on a database without the scores table yet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Count the duplicates without deleting them.")
+
+    def handle(self, *args, **options):
+        try:
+            if TetrisScore._meta.db_table not in connection.introspection.table_names():
+                self.stdout.write("No scores table yet, nothing to deduplicate.")
+                return
+            latest = TetrisScore.objects.values('gameid', 'user_id').annotate(latest=Max('id')).values('latest')
+            duplicates = TetrisScore.objects.exclude(id__in=latest)
+            if options["dry_run"]:
+                self.stdout.write(f"Would delete {duplicates.count()} duplicate scores.")
+                return
+            deleted, _ = duplicates.delete()
+        except Exception as e:
+            raise CommandError(str(e)) from e
+        self.stdout.write(f"Deleted {deleted} duplicate scores.")
@@ -0,0 +1,67 @@
+import os
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+from tetris.active_player_manager_data_request import MatchmakingServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the standalone matchmaking service that owns the Tetris queue and pairing loop. "
+        "Django workers reach it through RemoteActivePlayerManager."
+    )
+
+    def add_arguments(self, parser):
+        url = urlsplit(getattr(settings, "TETRIS_MATCHMAKER_URL", "http://127.0.0.1:8765"))
+        parser.add_argument("--host", default=url.hostname, help="Address to listen on.")
+        parser.add_argument("--port", type=int, default=url.port,
+                            help="Port to listen on; 0 picks a free one.")
+        parser.add_argument(
+            "--backend", default=getattr(
+                settings, "TETRIS_MATCHMAKER_BACKEND", "tetris.active_player_manager.ActivePlayerManager"
+            ),
+            help="Dotted path of the pool the service keeps the queue in."
+        )
+        parser.add_argument(
+            "--sweep-interval", type=float, default=getattr(settings, "TETRIS_SWEEP_INTERVAL", 5),
+            help="Seconds between expiry sweeps, which also run due ticks."
+        )
+        parser.add_argument(
+            "--state-dir", default=getattr(settings, "GAME_STATE_DIR", ""),
+            help="Directory to restore the pool from and journal it to; empty disables persistence."
+        )
+
+    def handle(self, *args, **options):
+        tick_interval = getattr(settings, "TETRIS_MATCHMAKING_TICK", 0)
+        try:
+            manager = import_string(options["backend"])(
+                tick_interval=tick_interval,
+                group_size=getattr(settings, "TETRIS_MATCHMAKING_GROUP_SIZE", 2)
+            )
+            if options["state_dir"]:
+                os.makedirs(options["state_dir"], exist_ok=True)
+                restored = manager.attach_journal(
+                    os.path.join(options["state_dir"], "tetris_matchmaker"),
+                    snapshot_interval=getattr(settings, "TETRIS_SNAPSHOT_INTERVAL", 30)
+                )
+                self.stdout.write(f"Restored {restored} queued players")
+            server = MatchmakingServer(manager, options["host"], options["port"])
+        except Exception as e:
+            raise CommandError(str(e)) from e
+
+        # Sweeps drive the pairing loop, so they must run at least once per tick.
+        interval = options["sweep_interval"]
+        if tick_interval:
+            interval = min(interval, tick_interval) if interval else tick_interval
+        if interval:
+            manager.start_sweeper(interval)
+
+        self.stdout.write(f"Matchmaker listening on {server.url}")
+        self.stdout.flush()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
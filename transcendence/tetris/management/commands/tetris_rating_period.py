@@ -0,0 +1,37 @@
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from tetris.rating_periods import run_rating_period
+
+
+class Command(BaseCommand):
+    help = (
+        "Rates the Tetris games finished since the last rating period in one batch, "
+        "with the engine TETRIS_RATING_ENGINES selects per game type. The server processes run one every "
+        "TETRIS_RATING_PERIOD_INTERVAL seconds; with it at 0, run this periodically, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--settle", type=float, default=getattr(settings, "TETRIS_RATING_SETTLE", 60),
+            help="Seconds after a game's last score before it is rated."
+        )
+        parser.add_argument("--json", action="store_true", help="Print the raw JSON result.")
+
+    def handle(self, *args, **options):
+        try:
+            result = run_rating_period(settle=options["settle"])
+        except Exception as e:
+            raise CommandError(str(e)) from e
+
+        if options["json"]:
+            self.stdout.write(json.dumps(result))
+            return
+        if result["period"] is None:
+            self.stdout.write("No finished games to rate.")
+            return
+        games = ", ".join(f"{count} {kind}" for kind, count in result["games"].items())
+        self.stdout.write(
+            f"Rating period {result['period']}: rated {games} games for {result['players']} players, "
+            f"skipped {result['skipped_games']}."
+        )
@@ -0,0 +1,69 @@
+import json
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from tetris.calculate_mmr import INITIAL_RATING
+from tetris.rating_rebuild import CHUNK_SIZE, rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes every Tetris player's rating by replaying the rating periods that have run "
+        "with the rating engines TETRIS_RATING_ENGINES selects now."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report the changes without writing them.")
+        parser.add_argument("--initial-rating", type=int, default=INITIAL_RATING,
+                            help="Rating every player starts the replay with.")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                            help="Rows per round trip when reading scores and writing ratings.")
+        parser.add_argument("--top", type=int, default=10, help="Largest changes to list.")
+        parser.add_argument("--json", action="store_true", help="Print the raw JSON report.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            result = rebuild_ratings(
+                dry_run=options["dry_run"],
+                initial_rating=options["initial_rating"],
+                chunk_size=options["chunk_size"]
+            )
+        except Exception as e:
+            raise CommandError(str(e)) from e
+        elapsed = time.perf_counter() - start
+
+        changes = result["changes"]
+        deltas = [new - old for _, old, new in changes]
+        largest = sorted(changes, key=lambda change: abs(change[2] - change[1]), reverse=True)[:options["top"]]
+        usernames = dict(
+            get_user_model().objects.filter(id__in=[user_id for user_id, _, _ in largest])
+            .values_list("id", "username")
+        )
+        report = {
+            "dry_run": options["dry_run"],
+            "periods": result["periods"],
+            "games": result["games"],
+            "skipped_games": result["skipped_games"],
+            "changed_players": len(changes),
+            "mean_abs_change": round(sum(map(abs, deltas)) / len(deltas), 2) if deltas else 0,
+            "max_abs_change": max(map(abs, deltas), default=0),
+            "seconds": round(elapsed, 3),
+            "largest_changes": [
+                {"user": usernames.get(user_id, user_id), "old": old, "new": new}
+                for user_id, old, new in largest
+            ],
+        }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report))
+            return
+        verb = "Would change" if options["dry_run"] else "Changed"
+        self.stdout.write(
+            f"Replayed {report['periods']} rating periods, {report['games']} games "
+            f"({report['skipped_games']} skipped) in {report['seconds']}s. "
+            f"{verb} {report['changed_players']} ratings, mean |change| {report['mean_abs_change']}, "
+            f"max {report['max_abs_change']}."
+        )
+        for change in report["largest_changes"]:
+            self.stdout.write(f"  {change['user']}: {change['old']} -> {change['new']}")
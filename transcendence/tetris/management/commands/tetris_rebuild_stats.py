@@ -0,0 +1,23 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from tetris.stats import rebuild_tetris_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the per-player Tetris stats from recorded scores, e.g. to backfill them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--json", action="store_true", help="Print the raw JSON result.")
+
+    def handle(self, *args, **options):
+        try:
+            players = rebuild_tetris_stats()
+        except Exception as e:
+            raise CommandError(str(e)) from e
+
+        if options["json"]:
+            self.stdout.write(json.dumps({"players": players}))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Tetris stats rebuilt for {players} players."))
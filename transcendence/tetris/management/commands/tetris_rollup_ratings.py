@@ -0,0 +1,28 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from tetris.rating_history import rollup_rating_history
+
+
+class Command(BaseCommand):
+    help = (
+        "Rolls the Tetris rating history up into daily low/high/close points for the profile charts. "
+        "Run it periodically, e.g. hourly from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Recompute every day instead of the recent ones.")
+        parser.add_argument("--json", action="store_true", help="Print the raw JSON result.")
+
+    def handle(self, *args, **options):
+        try:
+            result = rollup_rating_history(full=options["full"])
+        except Exception as e:
+            raise CommandError(str(e)) from e
+
+        if options["json"]:
+            self.stdout.write(json.dumps(result))
+            return
+        self.stdout.write(
+            f"Rolled up {result['history_rows']} rating changes since {result['since'] or 'the start'} "
+            f"into {result['daily_rows']} daily points."
+        )
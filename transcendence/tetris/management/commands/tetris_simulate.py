@@ -0,0 +1,49 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from tetris.entrypoint import MMR_DISTRIBUTIONS, simulate
+
+
+class Command(BaseCommand):
+    help = "Simulates a synthetic player population against the Tetris matchmaker, offline."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--population", type=int, default=2000)
+        parser.add_argument("--duration", type=float, default=600.0, help="Simulated seconds.")
+        parser.add_argument("--step", type=float, default=1.0, help="Simulated seconds per step.")
+        parser.add_argument("--join-rate", type=float, default=10.0, help="Players joining per second.")
+        parser.add_argument("--leave-rate", type=float, default=0.005,
+                            help="Per-second probability that a queued player gives up.")
+        parser.add_argument("--distribution", choices=sorted(MMR_DISTRIBUTIONS), default="normal")
+        parser.add_argument("--mode", choices=["request", "tick"], default="request")
+        parser.add_argument("--poll-interval", type=float, default=2.0)
+        parser.add_argument("--tick-interval", type=float, default=5.0)
+        parser.add_argument("--group-size", type=int, choices=[2, 3], default=2,
+                            help="Players per match; 3 needs --mode tick.")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--json", action="store_true", help="Print raw JSON results.")
+
+    def handle(self, *args, **options):
+        try:
+            results = simulate(
+                population=options["population"],
+                duration=options["duration"],
+                step=options["step"],
+                join_rate=options["join_rate"],
+                leave_rate=options["leave_rate"],
+                distribution=options["distribution"],
+                mode=options["mode"],
+                poll_interval=options["poll_interval"],
+                tick_interval=options["tick_interval"],
+                group_size=options["group_size"],
+                seed=options["seed"],
+            )
+        except Exception as e:
+            raise CommandError(str(e)) from e
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results))
+            return
+        for key, value in results.items():
+            if isinstance(value, dict):
+                value = "  ".join(f"{k}={v}" for k, v in value.items())
+            self.stdout.write(f"{key}: {value}")
@@ -1,16 +1,33 @@
 from django.db import models
+from django.db.models import Q
 from django.conf import settings
+from django.utils import timezone
 
 class TetrisScore(models.Model):
     """
     Model to store Tetris game results.
     """
+    # Both lookups are served by the composite indexes below, which lead with them.
     gameid = models.CharField(max_length=100)
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False)
     score = models.IntegerField()
     lines_cleared = models.IntegerField()
     level = models.IntegerField()
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Id of the TetrisRatingPeriod that closed the score; None until one has.
+    rating_period = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # One score per player and game; scores.upsert_scores relies on it.
+            models.UniqueConstraint(fields=['gameid', 'user'], name='unique_tetris_score'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='tetris_score_user_idx'),
+            models.Index(fields=['timestamp'], name='tetris_score_timestamp_idx'),
+            # The scores rating periods still have to close.
+            models.Index(fields=['timestamp'], condition=Q(rating_period__isnull=True), name='tetris_score_unrated_idx'),
+        ]
 
     def __str__(self):
         return f"Game {self.gameid} - {self.user}: {self.score}"
@@ -22,6 +39,17 @@ class TetrisPlayer(models.Model):
     """
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, default=1)
     matchmaking_rating = models.IntegerField()
+    # Glicko-2 parameters, see rating_engines.py; Elo leaves them as they are.
+    rating_deviation = models.FloatField(default=350.0)
+    rating_volatility = models.FloatField(default=0.06)
+    # Id of the last TetrisRatingPeriod the player had games in; 0 if none.
+    rating_period = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Serves the leaderboard ordering, see leaderboard.py.
+            models.Index(fields=['-matchmaking_rating', 'user'], name='tetris_player_rating_idx'),
+        ]
 
     def __str__(self):
         return f"Player {self.matchmaking_rating}"
@@ -29,3 +57,98 @@ class TetrisPlayer(models.Model):
 
     def __str__(self):
         return f"SystemMessage for {self.recipient} at {self.timestamp}"
+
+
+class TetrisHeadToHead(models.Model):
+    """
+    Model to store how often two players have met. Each pair is stored once,
+    with user_a always holding the lower user id.
+    """
+    user_a = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    user_b = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    games = models.IntegerField(default=0)
+    last_played = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_a', 'user_b'], name='unique_tetris_head_to_head'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_a} vs {self.user_b}: {self.games} games"
+
+
+class TetrisRatingPeriod(models.Model):
+    """
+    Model to store the rating periods that have been rated. A period covers
+    the games whose last score came in after the previous period's end and
+    at or before its own, and is stored on their scores.
+    """
+    end = models.DateTimeField()
+    games = models.IntegerField(default=0)
+    rated_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Rating period {self.id}: {self.games} games up to {self.end}"
+
+
+class TetrisRatingHistory(models.Model):
+    """
+    Model to store every rating a player has had, one row per change. Rows
+    are only ever appended, in the transaction that changes the rating.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    rating = models.IntegerField()
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='tetris_rating_history_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} at {self.timestamp}: {self.rating}"
+
+
+class TetrisRatingDaily(models.Model):
+    """
+    Model to store TetrisRatingHistory rolled up per player and day: the
+    lowest, highest and closing rating and the number of changes. Written
+    by rating_history.rollup_rating_history.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    day = models.DateField()
+    low = models.IntegerField()
+    high = models.IntegerField()
+    close = models.IntegerField()
+    changes = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_tetris_rating_daily'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} on {self.day}: {self.low}-{self.high}, closed at {self.close}"
+
+
+class TetrisStats(models.Model):
+    """
+    Model to store each player's Tetris totals, so their stats are one row
+    instead of their whole score history, updated as scores are saved
+    (scores.save_scores). A game's result is counted once it has two
+    scores and revised as later ones come in (stats.record_results). A
+    tied top score is neither a win nor a loss, but ends the streak.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    games = models.IntegerField(default=0)
+    best_score = models.IntegerField(default=0)
+    total_lines = models.IntegerField(default=0)
+    total_level = models.IntegerField(default=0)
+    wins = models.IntegerField(default=0)
+    losses = models.IntegerField(default=0)
+    win_streak = models.IntegerField(default=0)
+    best_win_streak = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user}: {self.games} games, {self.wins} wins, {self.losses} losses"
@@ -0,0 +1,68 @@
+import logging
+from contextlib import contextmanager
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.dispatch import Signal, receiver
+
+# Sent with user_id and ticket ({"player1", "player2"[, "player3"], ...}) for each player a tick
+# matches, and for the opponent a next-match request pairs the requester with.
+match_found = Signal()
+# Sent with size and players (the first usernames in the queue) when the queue size changes.
+queue_changed = Signal()
+
+QUEUE_GROUP = "tetris_queue"
+
+logger = logging.getLogger(__name__)
+
+
+def user_group(user_id: int) -> str:
+    return f"tetris_user_{user_id}"
+
+
+def _group_send(group: str, message: dict) -> None:
+    """
+    Sends a message through the channel layer from synchronous code: a
+    view, the sweeper thread or the rating scheduler. A push that fails,
+    e.g. while Redis is down, is logged and dropped, as clients fall back
+    to polling the REST endpoints.
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(group, message)
+    except Exception:
+        logger.warning("Matchmaking push to %s failed", group, exc_info=True)
+
+
+@receiver(match_found)
+def push_match_found(sender, user_id, ticket, **kwargs):
+    """Pushes a new match ticket to the player's matchmaking socket."""
+    players = {key: value for key, value in ticket.items() if key.startswith("player")}
+    _group_send(user_group(user_id), {"type": "match.found", **players})
+
+
+@receiver(queue_changed)
+def push_queue_changed(sender, size, players, **kwargs):
+    """Pushes the new queue size to every open matchmaking socket."""
+    _group_send(QUEUE_GROUP, {
+        "type": "queue.update",
+        "size": size,
+        "players": players,
+    })
+
+
+@contextmanager
+def sockets_muted():
+    """
+    Disconnects the socket receivers for the duration of the block, so
+    offline runs (benchmarks, simulations) can emit match_found and
+    queue_changed without going through the channel layer.
+    """
+    match_found.disconnect(push_match_found)
+    queue_changed.disconnect(push_queue_changed)
+    try:
+        yield
+    finally:
+        match_found.connect(push_match_found)
+        queue_changed.connect(push_queue_changed)
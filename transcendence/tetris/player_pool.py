@@ -0,0 +1,325 @@
+import bisect
+import itertools
+import json
+import numpy as np
+
+class QueuedPlayer:
+    """
+    A player waiting in the matchmaking pool. Holds only what pairing needs,
+    instead of a full TetrisPlayer instance.
+    """
+    __slots__ = (
+        "user_id", "username", "mmr", "last_seen", "joined_at",
+        "times_matched_with", "excluded", "_faced_source", "_faced_ids", "_faced_games",
+    )
+
+    def __init__(self, user_id: int, username: str, mmr: int, last_seen: float, times_matched_with: dict,
+                 joined_at: float = None, excluded: set = None):
+        self.user_id = user_id
+        self.username = username
+        self.mmr = mmr
+        self.last_seen = last_seen
+        # Enqueue time; unlike last_seen, heartbeats do not move it.
+        self.joined_at = last_seen if joined_at is None else joined_at
+        # A plain attribute, so a tick can read it for the whole pool cheaply.
+        # times_faced rebuilds its arrays whenever a new dict is assigned.
+        self.times_matched_with = times_matched_with
+        # User ids this player must never be matched with (block lists, both ways).
+        self.excluded = set() if excluded is None else excluded
+        self._faced_source = None
+
+    def times_faced(self, user_ids: np.ndarray) -> np.ndarray:
+        """Returns how often this player has met each of user_ids, as one vectorised lookup."""
+        if self._faced_source is not self.times_matched_with:
+            self._faced_source = self.times_matched_with
+            opponents = sorted(self.times_matched_with.items())
+            self._faced_ids = np.array([uid for uid, _ in opponents], dtype=np.int64)
+            self._faced_games = np.array([games for _, games in opponents], dtype=np.int64)
+        if not len(self._faced_ids):
+            return np.zeros(len(user_ids), dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self._faced_ids, user_ids), len(self._faced_ids) - 1)
+        return np.where(self._faced_ids[pos] == user_ids, self._faced_games[pos], 0)
+
+    def __repr__(self):
+        return f"<QueuedPlayer {self.username} (MMR: {self.mmr})>"
+
+
+class MMRIndex:
+    """
+    The queue sorted by (mmr, user id), split into blocks of BLOCK_SIZE to
+    2 * BLOCK_SIZE entries, each holding parallel arrays of MMR, user id,
+    enqueue time and ties. Adding or removing a player is a binary search
+    over the blocks' first keys and a copy of one block, O(log n +
+    BLOCK_SIZE) rather than a copy of the whole queue. A rating window is
+    found with binary searches and its candidates are read as contiguous
+    arrays in O(log n + k), so they can be scored in one NumPy pass.
+    Enqueue times ride along so a tick can compute every window without
+    touching the entries, and so does whether a player has ties, i.e. a
+    match history or a block list, so a tick only reads the histories and
+    block lists of the players who have one. Ties are only ever set, never
+    cleared, while a player is indexed: a player marked without any costs
+    one needless lookup.
+
+    A tick scores the whole pool at once, so mmrs, ids, joined and ties are
+    also available as whole arrays in index order. They are concatenated
+    from the blocks, O(n), the first time they are read after the queue
+    changed, and kept until it changes again.
+    """
+    BLOCK_SIZE = 512
+    DTYPES = (np.int64, np.int64, float, bool)  # mmrs, ids, joined, ties.
+
+    def __init__(self):
+        self.blocks = []  # [mmrs, ids, joined, ties] per block.
+        self.firsts = []  # (mmr, user_id) of each block's first entry.
+        self.size = 0
+        self._arrays = None
+
+    @classmethod
+    def from_entries(cls, entries) -> "MMRIndex":
+        """Builds an index in one pass from entries already sorted by (mmr, user id)."""
+        return cls.from_arrays(
+            np.array([entry.mmr for entry in entries], dtype=np.int64),
+            np.array([entry.user_id for entry in entries], dtype=np.int64),
+            np.array([entry.joined_at for entry in entries], dtype=float),
+            np.array([bool(entry.times_matched_with or entry.excluded) for entry in entries], dtype=bool),
+        )
+
+    @classmethod
+    def from_arrays(cls, mmrs, ids, joined, ties) -> "MMRIndex":
+        """Builds an index from parallel arrays already sorted by (mmr, user id)."""
+        index = cls()
+        index._load([mmrs, ids, joined, ties])
+        return index
+
+    def _load(self, arrays: list):
+        size = len(arrays[0])
+        self.blocks = [
+            [array[start:start + self.BLOCK_SIZE].copy() for array in arrays]
+            for start in range(0, size, self.BLOCK_SIZE)
+        ]
+        self.firsts = [self._first(block) for block in self.blocks]
+        self.size = size
+        self._arrays = None
+
+    @staticmethod
+    def _first(block: list) -> tuple:
+        return int(block[0][0]), int(block[1][0])
+
+    def __len__(self):
+        return self.size
+
+    def _array(self, field: int) -> np.ndarray:
+        if self._arrays is None:
+            self._arrays = [
+                np.concatenate([block[i] for block in self.blocks]) if self.blocks else np.empty(0, dtype=dtype)
+                for i, dtype in enumerate(self.DTYPES)
+            ]
+        return self._arrays[field]
+
+    @property
+    def mmrs(self) -> np.ndarray:
+        return self._array(0)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._array(1)
+
+    @property
+    def joined(self) -> np.ndarray:
+        return self._array(2)
+
+    @property
+    def ties(self) -> np.ndarray:
+        return self._array(3)
+
+    def _locate(self, user_id: int, mmr: int) -> tuple:
+        """Returns the block an entry belongs in and its position there."""
+        number = max(bisect.bisect_right(self.firsts, (mmr, user_id)) - 1, 0)
+        mmrs, ids = self.blocks[number][:2]
+        lo = mmrs.searchsorted(mmr, side="left")
+        hi = mmrs.searchsorted(mmr, side="right")
+        return number, int(lo + ids[lo:hi].searchsorted(user_id))
+
+    def _store(self, number: int, block: list):
+        """Puts a changed block back, splitting it in two once it is full."""
+        if not len(block[0]):
+            del self.blocks[number], self.firsts[number]
+        elif len(block[0]) > 2 * self.BLOCK_SIZE:
+            half = len(block[0]) // 2
+            halves = [array[:half] for array in block], [array[half:] for array in block]
+            self.blocks[number:number + 1] = halves
+            self.firsts[number:number + 1] = [self._first(halves[0]), self._first(halves[1])]
+        else:
+            self.blocks[number] = block
+            self.firsts[number] = self._first(block)
+        self._arrays = None
+
+    def insert(self, user_id: int, mmr: int, joined_at: float = 0.0, ties: bool = False):
+        values = (mmr, user_id, joined_at, ties)
+        self.size += 1
+        if not self.blocks:
+            self.blocks.append([np.array([value], dtype=dtype) for value, dtype in zip(values, self.DTYPES)])
+            self.firsts.append((mmr, user_id))
+            self._arrays = None
+            return
+        number, pos = self._locate(user_id, mmr)
+        grown = []
+        for array, value in zip(self.blocks[number], values):
+            new = np.empty(len(array) + 1, dtype=array.dtype)
+            new[:pos] = array[:pos]
+            new[pos] = value
+            new[pos + 1:] = array[pos:]
+            grown.append(new)
+        self._store(number, grown)
+
+    def _find(self, user_id: int, mmr: int):
+        """The (block number, position) of an indexed entry, or None."""
+        if not self.blocks:
+            return None
+        number, pos = self._locate(user_id, mmr)
+        ids = self.blocks[number][1]
+        return (number, pos) if pos < len(ids) and ids[pos] == user_id else None
+
+    def remove(self, user_id: int, mmr: int):
+        found = self._find(user_id, mmr)
+        if found is None:
+            return
+        number, pos = found
+        shrunk = []
+        for array in self.blocks[number]:
+            new = np.empty(len(array) - 1, dtype=array.dtype)
+            new[:pos] = array[:pos]
+            new[pos:] = array[pos + 1:]
+            shrunk.append(new)
+        self.size -= 1
+        self._store(number, shrunk)
+
+    def mark(self, user_id: int, mmr: int):
+        """Records that a player gained a match history or a block list."""
+        found = self._find(user_id, mmr)
+        if found is not None:
+            number, pos = found
+            self.blocks[number][3][pos] = True
+            self._arrays = None
+
+    def keep(self, mask: np.ndarray):
+        """Keeps only the entries where mask is True, in one pass."""
+        self._load([self.mmrs[mask], self.ids[mask], self.joined[mask], self.ties[mask]])
+
+    def candidates(self, mmr: int, width: int) -> tuple:
+        """
+        Returns the user ids and MMRs, as arrays in index order, of the
+        entries within width of mmr.
+        """
+        lo, hi = mmr - width, mmr + width
+        ids, mmrs = [], []
+        for number in range(max(bisect.bisect_left(self.firsts, (lo,)) - 1, 0), len(self.blocks)):
+            block_mmrs, block_ids = self.blocks[number][:2]
+            if block_mmrs[0] > hi:
+                break
+            start, stop = block_mmrs.searchsorted(lo, side="left"), block_mmrs.searchsorted(hi, side="right")
+            ids.append(block_ids[start:stop])
+            mmrs.append(block_mmrs[start:stop])
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(ids), np.concatenate(mmrs)
+
+    def clear(self):
+        self.blocks = []
+        self.firsts = []
+        self.size = 0
+        self._arrays = None
+
+
+def pack_pool(entries, tickets: dict) -> dict:
+    """
+    Flattens pool entries and match tickets into NumPy arrays for a
+    StateJournal snapshot. Histories and exclusion sets are stored as one
+    concatenated array each plus per-player sizes.
+    """
+    histories = [entry.times_matched_with for entry in entries]
+    exclusions = [entry.excluded for entry in entries]
+    return {
+        "ids": np.array([entry.user_id for entry in entries], dtype=np.int64),
+        "usernames": np.array([entry.username for entry in entries], dtype=str),
+        "mmrs": np.array([entry.mmr for entry in entries], dtype=np.int64),
+        "joined": np.array([entry.joined_at for entry in entries], dtype=float),
+        "history_sizes": np.array([len(history) for history in histories], dtype=np.int64),
+        "history_ids": np.fromiter(itertools.chain.from_iterable(histories), dtype=np.int64),
+        "history_games": np.fromiter(
+            itertools.chain.from_iterable(history.values() for history in histories), dtype=np.int64
+        ),
+        "excluded_sizes": np.array([len(excluded) for excluded in exclusions], dtype=np.int64),
+        "excluded_ids": np.fromiter(itertools.chain.from_iterable(exclusions), dtype=np.int64),
+        "tickets": np.array(json.dumps(list(tickets.items()))),
+    }
+
+
+def unpack_pool(arrays: dict, now: float) -> tuple:
+    """
+    Inverse of pack_pool. Restored players count as seen at `now`, so
+    players who left while the server was down expire normally.
+
+    Returns:
+        tuple: ({user_id: QueuedPlayer}, {user_id: ticket}).
+    """
+    history_ids = arrays["history_ids"].tolist()
+    history_games = arrays["history_games"].tolist()
+    excluded_ids = arrays["excluded_ids"].tolist()
+    history_ends = np.cumsum(arrays["history_sizes"]).tolist()
+    excluded_ends = np.cumsum(arrays["excluded_sizes"]).tolist()
+
+    players = {}
+    history_start = excluded_start = 0
+    rows = zip(
+        arrays["ids"].tolist(), arrays["usernames"].tolist(), arrays["mmrs"].tolist(),
+        arrays["joined"].tolist(), history_ends, excluded_ends
+    )
+    for user_id, username, mmr, joined_at, history_end, excluded_end in rows:
+        players[user_id] = QueuedPlayer(
+            user_id=user_id,
+            username=username,
+            mmr=mmr,
+            last_seen=now,
+            times_matched_with=dict(zip(
+                history_ids[history_start:history_end], history_games[history_start:history_end]
+            )),
+            joined_at=joined_at,
+            excluded=set(excluded_ids[excluded_start:excluded_end])
+        )
+        history_start, excluded_start = history_end, excluded_end
+    tickets = {user_id: ticket for user_id, ticket in json.loads(str(arrays["tickets"]))}
+    return players, tickets
+
+
+def replay_pool_event(players: dict, tickets: dict, event: dict, now: float):
+    """Applies one logged pool event (see ActivePlayerManager._log) to unpacked state."""
+    kind = event["kind"]
+    if kind == "join":
+        players[event["id"]] = QueuedPlayer(
+            user_id=event["id"],
+            username=event["username"],
+            mmr=event["mmr"],
+            last_seen=now,
+            times_matched_with=dict(event["history"]),
+            joined_at=event["joined_at"],
+            excluded=set(event["excluded"])
+        )
+    elif kind == "leave":
+        players.pop(event["id"], None)
+    elif kind == "matched":
+        for user_id, ticket in event["tickets"]:
+            players.pop(user_id, None)
+            tickets[user_id] = ticket
+    elif kind == "ticket":
+        tickets.pop(event["id"], None)
+    elif kind == "exclusion":
+        data = players.get(event["id"])
+        if data is not None:
+            if event["blocked"]:
+                data.excluded.add(event["other"])
+            else:
+                data.excluded.discard(event["other"])
+    elif kind == "clear":
+        players.clear()
+        tickets.clear()
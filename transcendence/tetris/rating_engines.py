@@ -0,0 +1,172 @@
+import math
+from abc import ABC, abstractmethod
+import numpy as np
+from django.conf import settings
+from .calculate_mmr import INITIAL_RATING, K_FACTOR, RATING_SCALE
+
+GLICKO2_SCALE = 173.7178  # Rating points per unit on the Glicko-2 internal scale.
+INITIAL_DEVIATION = 350.0  # Rating deviation of a new player; also the cap for idle players.
+INITIAL_VOLATILITY = 0.06  # Volatility of a new player.
+TAU = 0.5  # Constrains how fast volatility can change; Glickman suggests 0.3 to 1.2.
+CONVERGENCE = 1e-6  # Tolerance of the volatility iteration.
+MAX_ITERATIONS = 100  # Bound on the volatility iteration.
+
+class RatingEngineError(Exception):
+    """Custom exception for rating engine errors."""
+    pass
+
+def game_type(player_count: int) -> str:
+    """Returns the game type a game with player_count players is rated as."""
+    return "duel" if player_count == 2 else "multiplayer"
+
+def pairwise_outcomes(players: np.ndarray, scores: np.ndarray) -> tuple:
+    """
+    Splits games of n players into the results of each player against each
+    of the others: a win against everyone who scored less, a draw against
+    everyone who scored the same. Each result is weighted 1 / (n - 1), so a
+    game counts as much for a player as a single duel, however many
+    players were in it.
+
+    Args:
+        players (np.ndarray): (games, n) indexes of the players in each game.
+        scores (np.ndarray): (games, n) their scores.
+
+    Returns:
+        tuple: (player, opponent, score, weight) arrays with one entry per
+        ordered pair of players in a game; score is 1, 0.5 or 0 for player.
+    """
+    count = players.shape[1]
+    first, second = np.nonzero(~np.eye(count, dtype=bool))
+    player, opponent = players[:, first].ravel(), players[:, second].ravel()
+    difference = np.sign(scores[:, first] - scores[:, second]).ravel()
+    outcome = (difference + 1) / 2
+    weight = np.full(len(player), 1 / (count - 1))
+    return player, opponent, outcome, weight
+
+class RatingEngine(ABC):
+    """
+    Rates a rating period: a batch of games treated as played at the same
+    time, so every game is rated from the ratings players had when the
+    period began. Engines work on whole arrays of players and results and
+    must leave players without results in the period unchanged.
+    """
+    name = ""
+
+    @abstractmethod
+    def rate(self, ratings: np.ndarray, deviations: np.ndarray, volatilities: np.ndarray,
+             idle_periods: np.ndarray, players: np.ndarray, scores: np.ndarray) -> tuple:
+        """
+        Args:
+            ratings (np.ndarray): Rating of every player in the period.
+            deviations (np.ndarray): Their rating deviations.
+            volatilities (np.ndarray): Their volatilities.
+            idle_periods (np.ndarray): Rating periods each sat out since their last game.
+            players (np.ndarray): (games, n) indexes into the arrays above.
+            scores (np.ndarray): (games, n) the scores of those players.
+
+        Returns:
+            tuple: New (ratings, deviations, volatilities) arrays.
+        """
+
+class EloEngine(RatingEngine):
+    """
+    The Elo of calculate_new_ratings, with every result in the period
+    scored against the pre-period ratings. A player with a single duel in
+    the period gets exactly calculate_new_ratings' change. Deviation and
+    volatility are left as they are.
+    """
+    name = "elo"
+
+    def rate(self, ratings, deviations, volatilities, idle_periods, players, scores):
+        player, opponent, outcome, weight = pairwise_outcomes(players, scores)
+        expected = 1 / (1 + np.power(10.0, (ratings[opponent] - ratings[player]) / RATING_SCALE))
+        change = np.bincount(player, weight * (outcome - expected), minlength=len(ratings))
+        return ratings + K_FACTOR * change, deviations, volatilities
+
+class Glicko2Engine(RatingEngine):
+    """
+    Glicko-2 (Glickman, "Example of the Glicko-2 system"), vectorised over
+    every player in the period: the variance and improvement sums are
+    np.bincount reductions over the pairwise results, and the volatility
+    iteration runs for all players at once until each has converged.
+
+    A player's deviation grows for every period they sat out, up to
+    INITIAL_DEVIATION. That growth is applied when they next play, so idle
+    players are never written.
+    """
+    name = "glicko2"
+
+    def rate(self, ratings, deviations, volatilities, idle_periods, players, scores):
+        player, opponent, outcome, weight = pairwise_outcomes(players, scores)
+        active = np.zeros(len(ratings), dtype=bool)
+        active[player] = True
+
+        mu = (ratings - INITIAL_RATING) / GLICKO2_SCALE
+        phi = np.minimum(
+            np.sqrt((deviations / GLICKO2_SCALE) ** 2 + idle_periods * volatilities ** 2),
+            INITIAL_DEVIATION / GLICKO2_SCALE
+        )
+        g = 1 / np.sqrt(1 + 3 * phi[opponent] ** 2 / math.pi ** 2)
+        expected = 1 / (1 + np.exp(-g * (mu[player] - mu[opponent])))
+        variance_inverse = np.bincount(player, weight * g ** 2 * expected * (1 - expected), minlength=len(ratings))
+        improvement = np.bincount(player, weight * g * (outcome - expected), minlength=len(ratings))
+
+        # Only players with results from here on.
+        mu, phi, sigma = mu[active], phi[active], volatilities[active]
+        v = 1 / variance_inverse[active]
+        delta = v * improvement[active]
+        sigma = self._volatility(phi, sigma, v, delta)
+
+        phi_star = np.sqrt(phi ** 2 + sigma ** 2)
+        new_phi = 1 / np.sqrt(1 / phi_star ** 2 + 1 / v)
+        new_mu = mu + new_phi ** 2 * improvement[active]
+
+        ratings, deviations, volatilities = ratings.copy(), deviations.copy(), volatilities.copy()
+        ratings[active] = INITIAL_RATING + GLICKO2_SCALE * new_mu
+        deviations[active] = GLICKO2_SCALE * new_phi
+        volatilities[active] = sigma
+        return ratings, deviations, volatilities
+
+    @staticmethod
+    def _volatility(phi: np.ndarray, sigma: np.ndarray, v: np.ndarray, delta: np.ndarray) -> np.ndarray:
+        """Step 5 of Glicko-2: the Illinois iteration for the new volatility, per player."""
+        a = np.log(sigma ** 2)
+
+        def f(x):
+            ex = np.exp(x)
+            return ex * (delta ** 2 - phi ** 2 - v - ex) / (2 * (phi ** 2 + v + ex) ** 2) - (x - a) / TAU ** 2
+
+        big = delta ** 2 > phi ** 2 + v
+        upper = np.where(big, np.log(np.where(big, delta ** 2 - phi ** 2 - v, 1)), a - TAU)
+        for _ in range(MAX_ITERATIONS):
+            low = ~big & (f(upper) < 0)
+            if not low.any():
+                break
+            upper = np.where(low, upper - TAU, upper)
+
+        lower, f_lower, f_upper = a, f(a), f(upper)
+        for _ in range(MAX_ITERATIONS):
+            pending = np.abs(upper - lower) > CONVERGENCE
+            if not pending.any():
+                break
+            c = lower + (lower - upper) * f_lower / np.where(pending, f_upper - f_lower, 1)
+            f_c = f(c)
+            crossed = f_c * f_upper <= 0
+            lower, f_lower = (
+                np.where(pending & crossed, upper, lower),
+                np.where(pending & crossed, f_upper, np.where(pending, f_lower / 2, f_lower)),
+            )
+            upper, f_upper = np.where(pending, c, upper), np.where(pending, f_c, f_upper)
+        return np.exp(lower / 2)
+
+ENGINES = {engine.name: engine for engine in (EloEngine, Glicko2Engine)}
+
+def get_engine(kind: str) -> RatingEngine:
+    """
+    Returns the engine TETRIS_RATING_ENGINES selects for a game type
+    ("duel" or "multiplayer").
+    """
+    name = getattr(settings, "TETRIS_RATING_ENGINES", {}).get(kind, "elo")
+    if name not in ENGINES:
+        raise RatingEngineError(f"Unknown rating engine '{name}' for {kind} games.")
+    return ENGINES[name]()
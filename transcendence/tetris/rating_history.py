@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+from typing import Optional
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from .models import TetrisRatingDaily, TetrisRatingHistory
+
+def record_ratings(changes: dict, at: Optional[datetime] = None) -> None:
+    """
+    Appends the new rating of each player to TetrisRatingHistory in a single
+    INSERT. Call it in the transaction that writes the ratings, so the
+    history holds exactly the ratings that were committed.
+
+    Args:
+        changes (dict): {user_id: new rating}.
+        at (datetime, optional): When the ratings changed; defaults to now.
+    """
+    at = at or timezone.now()
+    TetrisRatingHistory.objects.bulk_create([
+        TetrisRatingHistory(user_id=user_id, rating=rating, timestamp=at)
+        for user_id, rating in changes.items()
+    ])
+
+def _daily_points(rows) -> dict:
+    """
+    Rolls up (user_id, rating, timestamp) rows, ordered by user and time,
+    into {(user_id, day): [low, high, close, changes]}.
+    """
+    points = {}
+    for user_id, rating, timestamp in rows:
+        key = (user_id, timezone.localdate(timestamp))
+        point = points.get(key)
+        if point is None:
+            points[key] = [rating, rating, rating, 1]
+        else:
+            point[0] = min(point[0], rating)
+            point[1] = max(point[1], rating)
+            point[2] = rating
+            point[3] += 1
+    return points
+
+def rollup_rating_history(full: bool = False, chunk_size: int = 10000) -> dict:
+    """
+    Rolls TetrisRatingHistory up into TetrisRatingDaily. Only the days from
+    the last rolled up one on are recomputed, as that day may have been
+    incomplete when it was rolled up; `full` recomputes every day. Rows
+    are upserted, so running it again, or concurrently with rating
+    changes, is safe.
+
+    Returns:
+        dict: The first day recomputed (None for all) and the number of
+        raw rows read and daily rows written.
+    """
+    since = None if full else TetrisRatingDaily.objects.aggregate(day=Max('day'))['day']
+    rows = TetrisRatingHistory.objects.order_by('user_id', 'timestamp', 'id')
+    if since is not None:
+        start = timezone.make_aware(datetime.combine(since, datetime.min.time()))
+        rows = rows.filter(timestamp__gte=start)
+
+    read = written = 0
+    with transaction.atomic():
+        batch = {}
+        user_id = None
+        for row in rows.values_list('user_id', 'rating', 'timestamp').iterator(chunk_size=chunk_size):
+            read += 1
+            # Flush between users, so a player's day is never split across batches.
+            if row[0] != user_id and len(batch) >= chunk_size:
+                written += _upsert_daily(batch)
+                batch = {}
+            user_id = row[0]
+            batch.setdefault(user_id, []).append(row)
+        written += _upsert_daily(batch)
+    return {"since": since.isoformat() if since else None, "history_rows": read, "daily_rows": written}
+
+def _upsert_daily(batch: dict) -> int:
+    points = _daily_points(row for rows in batch.values() for row in rows)
+    TetrisRatingDaily.objects.bulk_create(
+        [
+            TetrisRatingDaily(user_id=user_id, day=day, low=low, high=high, close=close, changes=changes)
+            for (user_id, day), (low, high, close, changes) in points.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['user', 'day'],
+        update_fields=['low', 'high', 'close', 'changes'],
+    )
+    return len(points)
+
+def get_rating_chart(user_id: int, days: int = 365) -> list:
+    """
+    Returns one point per day on which the player's rating changed, over
+    the last `days` days: the rolled up days, with the days the rollup has
+    not fully covered yet computed from the player's raw history.
+
+    Returns:
+        list: Dicts with day, low, high and close, oldest first.
+    """
+    first_day = timezone.localdate() - timedelta(days=days - 1)
+    points = {
+        day: [low, high, close]
+        for day, low, high, close in TetrisRatingDaily.objects.filter(user_id=user_id, day__gte=first_day)
+        .order_by('day').values_list('day', 'low', 'high', 'close')
+    }
+    # The last rolled up day may have changed since, and later days are not rolled up at all.
+    live_from = max(max(points, default=first_day), first_day)
+    raw = (
+        TetrisRatingHistory.objects
+        .filter(user_id=user_id, timestamp__gte=timezone.make_aware(datetime.combine(live_from, datetime.min.time())))
+        .order_by('timestamp', 'id').values_list('user_id', 'rating', 'timestamp')
+    )
+    for (_, day), (low, high, close, _) in _daily_points(raw).items():
+        points[day] = [low, high, close]
+    return [
+        {"day": day.isoformat(), "low": low, "high": high, "close": close}
+        for day, (low, high, close) in sorted(points.items())
+    ]
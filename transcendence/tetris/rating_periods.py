@@ -0,0 +1,204 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from .leaderboard import ratings_changed
+from .models import TetrisPlayer, TetrisRatingPeriod, TetrisScore
+from .rating_engines import game_type, get_engine
+from .rating_history import record_ratings
+
+logger = logging.getLogger(__name__)
+
+GAME_TYPES = ("duel", "multiplayer")  # Rated in this order within a period.
+
+def _lock_periods() -> None:
+    """
+    Takes a lock held until the transaction ends, so rating periods started
+    by several processes at once run one after the other. Locking the
+    previous period's row is not enough: the first period has none, and a
+    run waiting on the row would still read the period it replaced.
+    SQLite serialises writers anyway.
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", ["tetris_rating_period"])
+
+def run_rating_period(now: Optional[datetime] = None, settle: Optional[float] = None) -> dict:
+    """
+    Rates every game finished since the last rating period as one batch,
+    through rate_period. A game counts as finished once its last score is
+    `settle` seconds old, so a slower player's score is not left out. The
+    period's id is stored on the scores it closes; a score that comes in
+    after its game was closed closes with the next period without the game
+    being rated again.
+
+    The whole period is one transaction: it takes a lock so two runs
+    cannot rate the same games, and every player's row is locked in
+    primary key order and written back with a single UPDATE.
+
+    Args:
+        now: The time the period ends at, before subtracting settle; defaults to now.
+        settle: Seconds to wait after a game's last score; defaults to TETRIS_RATING_SETTLE.
+
+    Returns:
+        dict: The period id (None if no game had finished) and the
+        number of games rated per type, players rated and games skipped
+        because they had fewer than two players, a player without a
+        TetrisPlayer row or had been rated already.
+    """
+    if settle is None:
+        settle = getattr(settings, "TETRIS_RATING_SETTLE", 60)
+    end = (now or timezone.now()) - timedelta(seconds=settle)
+
+    with transaction.atomic():
+        _lock_periods()
+        previous = TetrisRatingPeriod.objects.select_for_update().order_by('-id').first()
+        finished = (
+            TetrisScore.objects.filter(rating_period__isnull=True)
+            .values('gameid').annotate(last=Max('timestamp')).filter(last__lte=end)
+        )
+        if previous is not None:
+            # Scores from before periods were stored on them are covered by the end.
+            finished = finished.filter(last__gt=previous.end)
+
+        games, closed, score_ids = defaultdict(dict), set(), []
+        rows = TetrisScore.objects.filter(gameid__in=finished.values('gameid')).order_by('id')
+        for score_id, gameid, user_id, score, period_id in rows.values_list(
+            'id', 'gameid', 'user_id', 'score', 'rating_period'
+        ):
+            games[gameid][user_id] = score
+            if period_id is None:
+                score_ids.append(score_id)
+            else:
+                closed.add(gameid)
+        # A late score's game was rated without it; rating it again would count the others twice.
+        for gameid in closed:
+            del games[gameid]
+
+        user_ids = {user_id for game in games.values() for user_id in game}
+        players = {
+            player.user_id: player
+            for player in TetrisPlayer.objects.select_for_update().filter(user_id__in=user_ids).order_by('pk')
+        }
+        rated = [game for game in games.values() if len(game) >= 2 and all(uid in players for uid in game)]
+        result = {"period": None, "games": {kind: 0 for kind in GAME_TYPES},
+                  "players": 0, "skipped_games": len(games) - len(rated) + len(closed)}
+        if not score_ids:
+            return result
+
+        # Skipped games are closed with the period too, so they are not looked at again.
+        period = TetrisRatingPeriod.objects.create(end=end, games=len(rated))
+        TetrisScore.objects.filter(id__in=score_ids).update(rating_period=period.id)
+        result["period"] = period.id
+        if not rated:
+            return result
+
+        rated_players, result["games"] = rate_period(period.id, players, rated)
+        TetrisPlayer.objects.bulk_update(
+            rated_players, ['matchmaking_rating', 'rating_deviation', 'rating_volatility', 'rating_period']
+        )
+        changes = {player.user_id: player.matchmaking_rating for player in rated_players}
+        record_ratings(changes)
+        ratings_changed(changes)
+
+    result["players"] = len(rated_players)
+    return result
+
+def rate_period(period_id: int, players: dict, games: list) -> tuple:
+    """
+    Rates one rating period's games on TetrisPlayer instances, in memory:
+    games are grouped by game type and rated with the engine
+    TETRIS_RATING_ENGINES selects for it, one array operation per group,
+    and each player's rating is rounded as it is stored. The caller saves
+    the players; run_rating_period does for each new period and
+    rating_rebuild.rebuild_ratings once after replaying them all.
+
+    Args:
+        period_id (int): The period's id, which rated players' rating_period is set to.
+        players (dict): {user_id: TetrisPlayer} holding every player of the games.
+        games (list): {user_id: score} dicts of at least two players each.
+
+    Returns:
+        tuple: The TetrisPlayer instances rated, in user id order, and the
+        number of games rated per type.
+    """
+    counts = {kind: 0 for kind in GAME_TYPES}
+    rated_players = [players[user_id] for user_id in sorted({uid for game in games for uid in game})]
+    if not rated_players:
+        return rated_players, counts
+    index = {player.user_id: i for i, player in enumerate(rated_players)}
+    ratings = np.array([player.matchmaking_rating for player in rated_players], dtype=float)
+    deviations = np.array([player.rating_deviation for player in rated_players])
+    volatilities = np.array([player.rating_volatility for player in rated_players])
+    idle_periods = np.array([
+        period_id - player.rating_period - 1 if player.rating_period else 0 for player in rated_players
+    ])
+
+    by_size = defaultdict(list)
+    for game in games:
+        by_size[len(game)].append(game)
+    for kind in GAME_TYPES:
+        engine = None
+        for size, sized_games in sorted(by_size.items()):
+            if game_type(size) != kind:
+                continue
+            engine = engine or get_engine(kind)
+            game_players = np.array([[index[uid] for uid in game] for game in sized_games])
+            game_scores = np.array([list(game.values()) for game in sized_games], dtype=float)
+            ratings, deviations, volatilities = engine.rate(
+                ratings, deviations, volatilities, idle_periods, game_players, game_scores
+            )
+            # Idle growth applies once, even to a player rated by both engines.
+            idle_periods[game_players.ravel()] = 0
+            counts[kind] += len(sized_games)
+
+    for player, rating, deviation, volatility in zip(
+        rated_players, np.round(ratings).astype(int).tolist(), deviations.tolist(), volatilities.tolist()
+    ):
+        player.matchmaking_rating = rating
+        player.rating_deviation = deviation
+        player.rating_volatility = volatility
+        player.rating_period = period_id
+    return rated_players, counts
+
+_scheduler = None
+_scheduler_stopped = threading.Event()
+
+def start_rating_periods():
+    """
+    Starts a daemon thread running a rating period every
+    TETRIS_RATING_PERIOD_INTERVAL seconds, so ratings follow finished
+    games without a cron job. Called from the
+    server entry points, like the matchmaking sweeper; every server
+    process runs one, and the periods' lock keeps them from rating a game
+    twice. Calling it again while the thread is running has no effect.
+    """
+    global _scheduler
+    interval = getattr(settings, "TETRIS_RATING_PERIOD_INTERVAL", 0)
+    if not interval or (_scheduler is not None and _scheduler.is_alive()):
+        return
+    _scheduler_stopped.clear()
+
+    def run():
+        while not _scheduler_stopped.wait(interval):
+            try:
+                run_rating_period()
+            except Exception:
+                logger.exception("Tetris rating period failed")
+            finally:
+                close_old_connections()
+
+    _scheduler = threading.Thread(target=run, name="tetris-rating-periods", daemon=True)
+    _scheduler.start()
+
+def stop_rating_periods():
+    """Stops the thread start_rating_periods started, after the period it is running."""
+    _scheduler_stopped.set()
+    if _scheduler is not None:
+        _scheduler.join()
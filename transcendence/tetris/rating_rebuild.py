@@ -0,0 +1,134 @@
+import bisect
+from collections import defaultdict
+from django.db import transaction
+from .calculate_mmr import INITIAL_RATING
+from .leaderboard import ratings_changed
+from .models import TetrisPlayer, TetrisRatingPeriod, TetrisScore
+from .rating_engines import INITIAL_DEVIATION, INITIAL_VOLATILITY
+from .rating_history import record_ratings
+from .rating_periods import rate_period
+
+CHUNK_SIZE = 10000  # Rows fetched per round trip while streaming scores and players.
+
+
+def load_periods(chunk_size: int = CHUNK_SIZE) -> list:
+    """
+    Streams every score row and hands each game to the rating period that
+    closed it, with the scores it was closed with: those carrying the
+    period's id, and for scores from before periods were stored on them,
+    the period whose end first covers the game's last score. Scores that
+    came in after their game was closed, and games no period has closed
+    yet, are left out, as run_rating_period leaves them. Rows are read
+    with .iterator(), so memory holds the games rather than a model
+    instance per row.
+
+    Returns:
+        list: (period_id, games) per rating period in the order they ran,
+        games being {user_id: score} dicts.
+    """
+    periods = list(TetrisRatingPeriod.objects.order_by('id').values_list('id', 'end'))
+    period_ids, ends = [period_id for period_id, _ in periods], [end for _, end in periods]
+    games = defaultdict(list)
+
+    def close_game(rows):
+        closed_by = [period_id for _, _, _, period_id in rows if period_id is not None]
+        if closed_by:
+            period_id = min(closed_by)
+            game = {user_id: score for user_id, score, _, closed in rows if closed == period_id}
+        else:
+            position = bisect.bisect_left(ends, max(timestamp for _, _, timestamp, _ in rows))
+            if position == len(ends):
+                return
+            period_id = period_ids[position]
+            game = {user_id: score for user_id, score, _, _ in rows}
+        games[period_id].append(game)
+
+    rows = TetrisScore.objects.order_by('gameid', 'id').values_list(
+        'gameid', 'user_id', 'score', 'timestamp', 'rating_period'
+    )
+    current, game_rows = None, []
+    for gameid, user_id, score, timestamp, period_id in rows.iterator(chunk_size=chunk_size):
+        if gameid != current:
+            if game_rows:
+                close_game(game_rows)
+            current, game_rows = gameid, []
+        game_rows.append((user_id, score, timestamp, period_id))
+    if game_rows:
+        close_game(game_rows)
+    return [(period_id, games[period_id]) for period_id in period_ids]
+
+
+def replay_periods(players: dict, periods: list) -> tuple:
+    """
+    Rates rating periods one after the other through rate_period, as
+    run_rating_period rated them, on TetrisPlayer instances in memory.
+    Games of a single player or of a player without a TetrisPlayer row are
+    skipped, as they were live.
+
+    Args:
+        players (dict): {user_id: TetrisPlayer}, updated in place.
+        periods (list): (period_id, games) as load_periods returns them.
+
+    Returns:
+        tuple: {period_id: games rated} and the number of games skipped.
+    """
+    rated_counts, skipped = {}, 0
+    for period_id, games in periods:
+        rated = [game for game in games if len(game) >= 2 and all(uid in players for uid in game)]
+        skipped += len(games) - len(rated)
+        rate_period(period_id, players, rated)
+        rated_counts[period_id] = len(rated)
+    return rated_counts, skipped
+
+
+def rebuild_ratings(dry_run: bool = False, initial_rating: int = INITIAL_RATING,
+                    chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    Recomputes every TetrisPlayer's rating, deviation and volatility by
+    replaying the rating periods that have run with the engines
+    TETRIS_RATING_ENGINES selects now, e.g. after changing an engine or
+    its constants. Every player starts from initial_rating and a new
+    player's deviation and volatility, so a player without a rated game
+    ends there. Games no period has closed yet are left to the next one.
+    The periods' counts of rated games are updated to match.
+
+    Args:
+        dry_run (bool): Report the changes without writing them.
+        initial_rating (int): Rating every player starts the replay with.
+        chunk_size (int): Rows per round trip when reading and writing.
+
+    Returns:
+        dict: The number of periods replayed, games rated and skipped, and
+        for each player whose rating changed a (user_id, old rating, new
+        rating) tuple under "changes".
+    """
+    fields = ['matchmaking_rating', 'rating_deviation', 'rating_volatility', 'rating_period']
+    with transaction.atomic():
+        periods = load_periods(chunk_size)
+        players = TetrisPlayer.objects.only('id', 'user_id', *fields)
+        if not dry_run:
+            players = players.select_for_update()
+        players = {player.user_id: player for player in players.order_by('pk').iterator(chunk_size=chunk_size)}
+        old = {user_id: player.matchmaking_rating for user_id, player in players.items()}
+        for player in players.values():
+            player.matchmaking_rating = initial_rating
+            player.rating_deviation = INITIAL_DEVIATION
+            player.rating_volatility = INITIAL_VOLATILITY
+            player.rating_period = 0
+        rated_counts, skipped = replay_periods(players, periods)
+
+        changed = [player for user_id, player in players.items() if player.matchmaking_rating != old[user_id]]
+        if not dry_run:
+            TetrisPlayer.objects.bulk_update(players.values(), fields, batch_size=chunk_size)
+            counts = [TetrisRatingPeriod(id=period_id, games=games) for period_id, games in rated_counts.items()]
+            TetrisRatingPeriod.objects.bulk_update(counts, ['games'], batch_size=chunk_size)
+            changes = {player.user_id: player.matchmaking_rating for player in changed}
+            record_ratings(changes)
+            ratings_changed(changes)
+
+    return {
+        "periods": len(periods),
+        "games": sum(rated_counts.values()),
+        "skipped_games": skipped,
+        "changes": [(player.user_id, old[player.user_id], player.matchmaking_rating) for player in changed],
+    }
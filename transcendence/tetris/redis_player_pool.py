@@ -0,0 +1,331 @@
+import json
+import time
+from typing import Optional, Tuple
+import redis
+from django.conf import settings
+from .active_player_manager import ActivePlayerManager, ActivePlayerManagerError
+from .notifications import match_found
+from .player_pool import QueuedPlayer
+
+class RedisActivePlayerManager(ActivePlayerManager):
+    """
+    ActivePlayerManager that keeps the pool in Redis, so every worker process
+    shares the same queue. Select it with
+    TETRIS_PLAYER_POOL_BACKEND = "tetris.redis_player_pool.RedisActivePlayerManager".
+
+    Keys, all under `prefix`:
+        queue         sorted set of user ids, scored by MMR.
+        seen          sorted set of user ids, scored by last_seen, so expired
+                      players are found with one range query.
+        player:<id>   hash with username, mmr, last_seen and joined_at. Its TTL is the
+                      heartbeat: a player that stops polling simply expires.
+        history:<id>  hash of opponent id -> games played, expiring with the player.
+        blocked:<id>  set of user ids the player must not be matched with, expiring
+                      with the player.
+        ticket:<id>   JSON match ticket written by a tick.
+        tick          lock that lets only one worker run a tick per interval. A
+                      worker outliving it may still tick alongside another; each
+                      claims its matches atomically (see _claim), so a player is
+                      matched only once.
+        waits, spreads  capped lists of recent queue waits and MMR spreads.
+
+    Queue members whose player hash has expired are pruned lazily whenever
+    they are read.
+    """
+
+    def __init__(self, tick_interval: float = 0, group_size: int = 2, url: str = None, client=None,
+                 prefix: str = "tetris"):
+        super().__init__(tick_interval=tick_interval, group_size=group_size)
+        # A client can be passed in directly, e.g. an in-process fake for tests.
+        if client is None:
+            client = redis.Redis.from_url(
+                url or getattr(settings, "TETRIS_REDIS_URL", "redis://localhost:6379/0"),
+                decode_responses=True
+            )
+        self.redis = client
+        self.prefix = prefix
+
+    def _key(self, *parts) -> str:
+        return ":".join([self.prefix, *map(str, parts)])
+
+    def _load_entries(self, user_ids) -> dict:
+        """
+        Loads the entries for user_ids in one round trip, pruning queue members
+        whose heartbeat has expired.
+
+        Returns:
+            dict: {user_id: entry}, with the same entry layout as the in-process pool.
+        """
+        user_ids = [int(uid) for uid in user_ids]
+        if not user_ids:
+            return {}
+        pipe = self.redis.pipeline(transaction=False)
+        for uid in user_ids:
+            pipe.hgetall(self._key("player", uid))
+            pipe.hgetall(self._key("history", uid))
+            pipe.smembers(self._key("blocked", uid))
+        replies = pipe.execute()
+
+        entries = {}
+        expired = []
+        for i, uid in enumerate(user_ids):
+            player, history, blocked = replies[3 * i:3 * i + 3]
+            if not player:
+                expired.append(uid)
+                continue
+            entries[uid] = QueuedPlayer(
+                user_id=uid,
+                username=player["username"],
+                mmr=int(player["mmr"]),
+                last_seen=float(player["last_seen"]),
+                times_matched_with={int(k): int(v) for k, v in history.items()},
+                joined_at=float(player.get("joined_at", player["last_seen"])),
+                excluded={int(b) for b in blocked}
+            )
+        if expired:
+            self.redis.zrem(self._key("queue"), *expired)
+        return entries
+
+    def _queue_entries(self) -> list:
+        """Returns every live entry in the queue, sorted by MMR."""
+        user_ids = self.redis.zrange(self._key("queue"), 0, -1)
+        entries = self._load_entries(user_ids)
+        return [entries[int(uid)] for uid in user_ids if int(uid) in entries]
+
+    def _cleanup_inactive_players(self):
+        """Removes the players whose last_seen is past the inactivity threshold."""
+        cutoff = self.clock() - self.INACTIVITY_THRESHOLD
+        expired = self.redis.zrangebyscore(self._key("seen"), "-inf", cutoff)
+        if not expired:
+            return
+        pipe = self.redis.pipeline()
+        pipe.zrem(self._key("queue"), *expired)
+        pipe.zrem(self._key("seen"), *expired)
+        for uid in expired:
+            pipe.delete(self._key("player", uid), self._key("history", uid), self._key("blocked", uid))
+        pipe.execute()
+
+    def add_player(self, player):
+        if player is None:
+            raise ActivePlayerManagerError("Cannot add a None player.")
+
+        key = player.user.id
+        current_time = self.clock()
+        player_key = self._key("player", key)
+        history_key = self._key("history", key)
+        blocked_key = self._key("blocked", key)
+        while True:
+            with self.redis.pipeline() as pipe:
+                try:
+                    # Heartbeat: update last seen and push the expiry back. The
+                    # player hash is WATCHed, as in _claim: if a tick claims the
+                    # player or the hash expires in between, the MULTI fails
+                    # instead of leaving a hash holding only last_seen, and the
+                    # player is added again below.
+                    pipe.watch(player_key)
+                    if not pipe.exists(player_key):
+                        break
+                    pipe.multi()
+                    pipe.hset(player_key, "last_seen", current_time)
+                    pipe.zadd(self._key("seen"), {key: current_time})
+                    pipe.expire(player_key, self.INACTIVITY_THRESHOLD)
+                    pipe.expire(history_key, self.INACTIVITY_THRESHOLD)
+                    pipe.expire(blocked_key, self.INACTIVITY_THRESHOLD)
+                    pipe.execute()
+                    return "already active"
+                except redis.WatchError:
+                    continue
+
+        match_history, excluded = self._load_player_data(key)
+
+        mmr = player.matchmaking_rating
+        pipe = self.redis.pipeline()
+        pipe.hset(player_key, mapping={
+            "username": player.user.username,
+            "mmr": mmr,
+            "last_seen": current_time,
+            "joined_at": current_time,
+        })
+        pipe.expire(player_key, self.INACTIVITY_THRESHOLD)
+        pipe.delete(history_key)
+        if match_history:
+            pipe.hset(history_key, mapping=match_history)
+            pipe.expire(history_key, self.INACTIVITY_THRESHOLD)
+        pipe.delete(blocked_key)
+        if excluded:
+            pipe.sadd(blocked_key, *excluded)
+            pipe.expire(blocked_key, self.INACTIVITY_THRESHOLD)
+        pipe.zadd(self._key("queue"), {key: mmr})
+        pipe.zadd(self._key("seen"), {key: current_time})
+        pipe.execute()
+        return "player added"
+
+    def remove_player(self, user):
+        key = user.id
+        pipe = self.redis.pipeline()
+        pipe.delete(self._key("player", key))
+        pipe.delete(self._key("history", key))
+        pipe.delete(self._key("blocked", key))
+        pipe.zrem(self._key("queue"), key)
+        pipe.zrem(self._key("seen"), key)
+        removed = pipe.execute()[0]
+        if not removed:
+            raise ActivePlayerManagerError(f"Player with user ID '{key}' is not an active player.")
+
+    def clear_all_players(self):
+        keys = list(self.redis.scan_iter(match=self._key("*")))
+        if keys:
+            self.redis.delete(*keys)
+
+    def update_exclusions(self, user_id: int, other_ids, blocked: bool = True):
+        # Sets of players who are not queued are written too; they expire on
+        # their own and are replaced from the database when the player joins.
+        pipe = self.redis.pipeline(transaction=False)
+        for a, b in self._exclusion_pairs(user_id, other_ids):
+            blocked_key = self._key("blocked", a)
+            if blocked:
+                pipe.sadd(blocked_key, b)
+                pipe.expire(blocked_key, self.INACTIVITY_THRESHOLD)
+            else:
+                pipe.srem(blocked_key, b)
+        pipe.execute()
+
+    def refresh_all_players_match_histories(self):
+        user_ids = [int(uid) for uid in self.redis.zrange(self._key("queue"), 0, -1)]
+        try:
+            histories = self.fetch_match_histories_from_db(user_ids)
+        except Exception as e:
+            raise ActivePlayerManagerError(
+                f"Failed to refresh match histories: {str(e)}"
+            ) from e
+        pipe = self.redis.pipeline()
+        for user_id, history in histories.items():
+            history_key = self._key("history", user_id)
+            pipe.delete(history_key)
+            if history:
+                pipe.hset(history_key, mapping=history)
+                pipe.expire(history_key, self.INACTIVITY_THRESHOLD)
+        pipe.execute()
+
+    def find_next_match(self, user=None) -> Tuple[str, str]:
+        queue_key = self._key("queue")
+        if user is None:
+            entries = self._queue_entries()
+            if len(entries) < 2:
+                return "", ""
+            return self._best_neighbour_pair(entries)
+
+        user_id = user.id
+        specific_player_data = self._load_entries([user_id]).get(user_id)
+        if specific_player_data is None:
+            raise ActivePlayerManagerError(f"Player with user ID '{user_id}' is not an active player.")
+
+        # Only players inside the window, which widens with waiting time, are candidates.
+        now = self.clock()
+        mmr = specific_player_data.mmr
+        window = self._allowed_window(specific_player_data, now)
+        user_ids = self.redis.zrangebyscore(queue_key, mmr - window, mmr + window)
+        candidates = [
+            entry for uid, entry in self._load_entries(user_ids).items()
+            if uid != user_id and uid not in specific_player_data.excluded
+        ]
+        if not candidates:
+            return "", ""
+        return self._best_pair_for(specific_player_data, candidates)
+
+    def _claim(self, groups, current_time: float) -> bool:
+        """
+        Takes every player of `groups` out of the queue and writes their
+        tickets in one MULTI, only if none of them changed since it checked
+        they are all still queued. The player hashes are WATCHed, so a
+        player another worker claimed first, or who left, heartbeated or
+        expired meanwhile, makes the whole claim fail.
+
+        Returns:
+            bool: Whether the groups were claimed.
+        """
+        player_keys = [self._key("player", me.user_id) for group in groups for me in group]
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(*player_keys)
+                if pipe.exists(*player_keys) != len(player_keys):
+                    return False
+                pipe.multi()
+                for group in groups:
+                    for me in group:
+                        ticket = self._ticket_for(me, group, current_time)
+                        pipe.set(self._key("ticket", me.user_id), json.dumps(ticket), ex=self.INACTIVITY_THRESHOLD)
+                        pipe.delete(self._key("player", me.user_id))
+                        pipe.delete(self._key("history", me.user_id))
+                        pipe.delete(self._key("blocked", me.user_id))
+                        pipe.zrem(self._key("queue"), me.user_id)
+                        pipe.zrem(self._key("seen"), me.user_id)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    def run_matchmaking_tick(self) -> list:
+        current_time = self.clock()
+        self.last_tick = current_time
+        self._cleanup_inactive_players()
+        groups = self._optimal_groups(self._queue_entries(), self.group_size)
+        if not groups:
+            return []
+
+        # Usually every group is claimed at once. If a player changed, claim
+        # group by group, so only the groups with a changed player wait for
+        # the next tick.
+        if not self._claim(groups, current_time):
+            groups = [group for group in groups if self._claim([group], current_time)]
+        for group in groups:
+            self._record_match(group, current_time)
+            for me in group:
+                match_found.send(sender=self.__class__, user_id=me.user_id,
+                                 ticket=self._ticket_for(me, group, current_time))
+        return [tuple(data.user_id for data in group) for group in groups]
+
+    def _record_match(self, group, now: float):
+        mmrs = [data.mmr for data in group]
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.lpush(self._key("waits"), *(now - data.joined_at for data in group))
+        pipe.ltrim(self._key("waits"), 0, 2 * self.MATCH_METRICS_SIZE - 1)
+        pipe.lpush(self._key("spreads"), max(mmrs) - min(mmrs))
+        pipe.ltrim(self._key("spreads"), 0, self.MATCH_METRICS_SIZE - 1)
+        pipe.execute()
+
+    def _recent_match_stats(self) -> Tuple[list, list]:
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.lrange(self._key("waits"), 0, -1)
+        pipe.lrange(self._key("spreads"), 0, -1)
+        waits, spreads = pipe.execute()
+        return [float(w) for w in waits], [float(s) for s in spreads]
+
+    def attach_journal(self, path: str, snapshot_interval: float = 30) -> int:
+        raise ActivePlayerManagerError("The Redis pool already outlives restarts; it has no journal.")
+
+    def tick_if_due(self):
+        """Runs a tick if no worker has run one within the interval."""
+        if not self.tick_interval:
+            return
+        interval_ms = max(1, int(self.tick_interval * 1000))
+        if self.redis.set(self._key("tick"), 1, nx=True, px=interval_ms):
+            self.run_matchmaking_tick()
+
+    def take_match_ticket(self, user) -> Optional[dict]:
+        ticket_key = self._key("ticket", user.id)
+        pipe = self.redis.pipeline()
+        pipe.get(ticket_key)
+        pipe.delete(ticket_key)
+        ticket, _ = pipe.execute()
+        return json.loads(ticket) if ticket else None
+
+    def get_active_usernames(self) -> list:
+        return [entry.username for entry in self._queue_entries()]
+
+    def get_queue_snapshot(self) -> Tuple[int, list]:
+        queue_key = self._key("queue")
+        user_ids = self.redis.zrange(queue_key, 0, self.QUEUE_BROADCAST_LIMIT - 1)
+        entries = self._load_entries(user_ids)
+        players = [entries[int(uid)].username for uid in user_ids if int(uid) in entries]
+        return self.redis.zcard(queue_key), players
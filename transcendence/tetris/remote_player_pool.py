@@ -0,0 +1,96 @@
+from typing import Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from .active_player_manager import ActivePlayerManager, ActivePlayerManagerError
+
+class RemoteActivePlayerManager(ActivePlayerManager):
+    """
+    ActivePlayerManager that forwards every call to the standalone
+    matchmaking service (see active_player_manager_data_request.py and the
+    tetris_matchmaker command), so pairing CPU work runs outside the request
+    workers and the service can be scaled on its own. Select it with
+    TETRIS_PLAYER_POOL_BACKEND = "tetris.remote_player_pool.RemoteActivePlayerManager".
+
+    Calls go over one requests.Session whose connection pool keeps up to
+    POOL_SIZE keep-alive connections open, one per concurrent caller. The
+    service runs expiry and ticks itself, so sweep, start_sweeper and
+    tick_if_due are no-ops here. match_found and queue_changed fire in the
+    service process; pushing them to sockets needs a channel layer both
+    processes share.
+    """
+    POOL_SIZE = 32  # Keep-alive connections kept open to the service.
+    TIMEOUT = 5  # Seconds per call.
+
+    def __init__(self, tick_interval: float = 0, group_size: int = 2, url: str = None, session=None):
+        super().__init__(tick_interval=tick_interval, group_size=group_size)
+        self.url = (url or getattr(settings, "TETRIS_MATCHMAKER_URL", "http://127.0.0.1:8765")).rstrip("/")
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=self.POOL_SIZE))
+        self.session = session
+
+    def _call(self, method: str, path: str, payload: dict = None) -> dict:
+        try:
+            response = self.session.request(method, self.url + path, json=payload, timeout=self.TIMEOUT)
+            body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise ActivePlayerManagerError(f"Matchmaking service unavailable: {str(e)}") from e
+        if not response.ok:
+            raise ActivePlayerManagerError(
+                body.get("error", f"Matchmaking service returned HTTP {response.status_code}.")
+            )
+        return body
+
+    def sweep(self):
+        pass
+
+    def start_sweeper(self, interval: float):
+        pass
+
+    def attach_journal(self, path: str, snapshot_interval: float = 30) -> int:
+        raise ActivePlayerManagerError("The matchmaking service journals its own pool (tetris_matchmaker --state-dir).")
+
+    def add_player(self, player):
+        if player is None:
+            raise ActivePlayerManagerError("Cannot add a None player.")
+        return self._call("POST", "/players", {
+            "user_id": player.user.id,
+            "username": player.user.username,
+            "mmr": player.matchmaking_rating,
+        })["status"]
+
+    def remove_player(self, user):
+        self._call("DELETE", f"/players/{user.id}")
+
+    def update_exclusions(self, user_id: int, other_ids, blocked: bool = True):
+        self._call("POST", f"/players/{user_id}/exclusions", {"user_ids": list(other_ids), "blocked": blocked})
+
+    def clear_all_players(self):
+        self._call("DELETE", "/players")
+
+    def refresh_all_players_match_histories(self):
+        self._call("POST", "/histories/refresh")
+
+    def find_next_match(self, user=None) -> Tuple[str, str]:
+        match = self._call("GET", f"/players/{user.id}/match" if user is not None else "/match")
+        return match["player1"], match["player2"]
+
+    def run_matchmaking_tick(self) -> list:
+        return [tuple(group) for group in self._call("POST", "/tick")["groups"]]
+
+    def tick_if_due(self):
+        pass
+
+    def take_match_ticket(self, user) -> Optional[dict]:
+        return self._call("POST", f"/players/{user.id}/ticket")["ticket"]
+
+    def get_active_usernames(self) -> list:
+        return self._call("GET", "/players")["active_players"]
+
+    def get_queue_snapshot(self) -> Tuple[int, list]:
+        queue = self._call("GET", "/queue")
+        return queue["size"], queue["players"]
+
+    def get_match_metrics(self) -> dict:
+        return self._call("GET", "/metrics")
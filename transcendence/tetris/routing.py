@@ -0,0 +1,6 @@
+from django.urls import path
+from .consumers import MatchmakingConsumer
+
+websocket_urlpatterns = [
+    path("ws/tetris/matchmaking/", MatchmakingConsumer.as_asgi()),
+]
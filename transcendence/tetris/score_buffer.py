@@ -0,0 +1,167 @@
+import atexit
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections
+from .scores import save_scores
+
+logger = logging.getLogger(__name__)
+
+class ScoreBufferFullError(Exception):
+    """Custom exception for submissions the full score buffer could not take in time."""
+    pass
+
+class ScoreWriteBuffer:
+    """
+    Write-behind buffer for score submissions: requests hand their scores
+    over and return, and a background thread saves everything collected
+    every flush_interval seconds with one save_scores call, i.e. one
+    upsert statement per UPSERT_BATCH_SIZE scores instead of one per
+    request. A later score for the same player and game replaces one that
+    has not been flushed yet.
+
+    The buffer holds at most max_size scores. A submission that does not
+    fit wakes the flusher and waits up to `wait` seconds for room, then
+    fails with ScoreBufferFullError, so a database that cannot keep up
+    pushes back on clients instead of growing the buffer without bound.
+
+    Buffered scores are flushed when the interpreter exits normally, e.g.
+    on a graceful server shutdown, but are lost if the process is killed.
+    When a flush fails, its scores are saved one at a time, so one bad
+    score cannot hold back the others: a score the database rejects
+    (IntegrityError, DataError, e.g. a player deleted meanwhile) is logged
+    and dropped, and on any other error, e.g. a lost connection, the
+    scores not saved yet are put back to be retried on the next flush.
+    """
+
+    def __init__(self, flush_interval: float, max_size: int = 5000, wait: float = 2.0):
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.wait = wait
+        self.pending = {}  # (gameid, user_id) -> score row.
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()  # One flush at a time.
+        self._flusher = None
+        self._stopping = False
+
+    def __len__(self):
+        return len(self.pending)
+
+    def submit(self, scores):
+        """
+        Queues scores for the next flush.
+
+        Args:
+            scores: List of (user_id, gameid, score, lines_cleared, level).
+
+        Raises:
+            ScoreBufferFullError: No room freed up within `wait` seconds.
+        """
+        rows = {(row[1], row[0]): row for row in scores}
+        if len(rows) > self.max_size:
+            raise ScoreBufferFullError(f"Cannot buffer more than {self.max_size} scores at once.")
+        deadline = time.monotonic() + self.wait
+        with self.condition:
+            if self._stopping:
+                raise ScoreBufferFullError("The score buffer is shutting down.")
+            while len(self.pending) + sum(key not in self.pending for key in rows) > self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ScoreBufferFullError("The score buffer is full. Try again later.")
+                self.condition.notify_all()  # Wakes the flusher early.
+                self.condition.wait(remaining)
+            self.pending.update(rows)
+            self._start()
+
+    def _start(self):
+        """Starts the flusher thread on first use. The caller holds the condition."""
+        if self._flusher is not None:
+            return
+
+        def run():
+            while True:
+                with self.condition:
+                    if not self._stopping:
+                        self.condition.wait(self.flush_interval)
+                    if self._stopping:
+                        return
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Tetris score buffer flush failed")
+                finally:
+                    close_old_connections()
+
+        self._flusher = threading.Thread(target=run, name="tetris-score-buffer", daemon=True)
+        self._flusher.start()
+        atexit.register(self.stop)
+
+    def flush(self) -> int:
+        """
+        Saves every buffered score.
+
+        Returns:
+            int: The number of scores saved.
+        """
+        with self.flush_lock:
+            with self.condition:
+                rows, self.pending = self.pending, {}
+            if not rows:
+                return 0
+            try:
+                try:
+                    save_scores(rows.values())
+                    return len(rows)
+                except Exception:
+                    logger.warning("Saving %d buffered Tetris scores failed; saving them one by one", len(rows),
+                                   exc_info=True)
+                return self._flush_one_by_one(rows)
+            finally:
+                with self.condition:
+                    self.condition.notify_all()  # Wakes submissions waiting for room.
+
+    def _flush_one_by_one(self, rows: dict) -> int:
+        """
+        Saves rows one score at a time after a failed flush, dropping the
+        ones the database rejects. The caller holds flush_lock.
+
+        Returns:
+            int: The number of scores saved.
+        """
+        saved = 0
+        keys = list(rows)
+        for position, key in enumerate(keys):
+            try:
+                save_scores([rows[key]])
+                saved += 1
+            except (IntegrityError, DataError):
+                logger.exception("Dropping buffered Tetris score %r", rows[key])
+            except Exception:
+                with self.condition:
+                    # Newer submissions for the same player and game win.
+                    for unsaved in keys[position:]:
+                        self.pending.setdefault(unsaved, rows[unsaved])
+                raise
+        return saved
+
+    def stop(self):
+        """Stops the flusher and saves whatever is still buffered."""
+        with self.condition:
+            self._stopping = True
+            self.condition.notify_all()
+        if self._flusher is not None:
+            self._flusher.join()
+        try:
+            self.flush()
+        finally:
+            close_old_connections()
+
+# None when TETRIS_SCORE_BUFFER_INTERVAL is 0: every request writes its own scores.
+score_buffer = None
+if getattr(settings, "TETRIS_SCORE_BUFFER_INTERVAL", 0):
+    score_buffer = ScoreWriteBuffer(
+        flush_interval=settings.TETRIS_SCORE_BUFFER_INTERVAL,
+        max_size=getattr(settings, "TETRIS_SCORE_BUFFER_SIZE", 5000),
+        wait=getattr(settings, "TETRIS_SCORE_BUFFER_WAIT", 2)
+    )
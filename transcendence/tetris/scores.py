@@ -0,0 +1,233 @@
+import base64
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional
+from django.db import connection, transaction
+from django.db.backends.base.operations import BaseDatabaseOperations
+from django.db.models import Q
+from django.utils import timezone
+from .head_to_head import lock_game, record_game
+from .models import TetrisScore
+from .stats import add_scores, record_results
+
+UPSERT_BATCH_SIZE = 500  # Rows per INSERT statement.
+SCORE_PAGE_SIZE = 20  # Games per page of a player's score history.
+
+class ScoreError(Exception):
+    """Custom exception for invalid score submissions."""
+    pass
+
+def parse_score(data: dict, user_id: int) -> tuple:
+    """
+    Validates one submitted score. upsert_scores is raw SQL, so the values
+    are converted here rather than by the ORM.
+
+    Args:
+        data (dict): The submitted gameid, score, lines_cleared and level.
+        user_id (int): The player the score belongs to.
+
+    Returns:
+        tuple: (user_id, gameid, score, lines_cleared, level), as upsert_scores takes it.
+    """
+    for key in ('gameid', 'score', 'lines_cleared', 'level'):
+        if data.get(key) is None:
+            raise ScoreError(f"Missing key '{key}' in player data.")
+    try:
+        score, lines_cleared, level = (int(data[key]) for key in ('score', 'lines_cleared', 'level'))
+    except (TypeError, ValueError):
+        raise ScoreError("score, lines_cleared and level must be integers.")
+    # Out of range values would fail the whole upsert batch they are in.
+    # SQLite has no limits, so the range is the one Django gives other
+    # databases for the field type.
+    for key, value in (('score', score), ('lines_cleared', lines_cleared), ('level', level)):
+        low, high = BaseDatabaseOperations.integer_field_ranges[TetrisScore._meta.get_field(key).get_internal_type()]
+        if not low <= value <= high:
+            raise ScoreError(f"{key} is out of range.")
+    gameid = str(data['gameid'])
+    if len(gameid) > TetrisScore._meta.get_field('gameid').max_length:
+        raise ScoreError("gameid is too long.")
+    return user_id, gameid, score, lines_cleared, level
+
+def save_scores(scores) -> int:
+    """
+    Upserts scores and counts each new one in the head-to-head table, in
+    one transaction. Every score saved is added to its player's
+    TetrisStats; one replacing an earlier score for the same game replaces
+    it there too. The games' results are counted as they change, each
+    game's under its lock, so wins and losses are up to date as soon as
+    the last score of a game is in.
+
+    Args:
+        scores: Iterable of (user_id, gameid, score, lines_cleared, level).
+
+    Returns:
+        int: The number of scores that were new.
+    """
+    # The last score for a player and game is the one saved, as in upsert_scores.
+    latest = {(user_id, gameid): (score, lines_cleared, level)
+              for user_id, gameid, score, lines_cleared, level in scores}
+    if not latest:
+        return 0
+    gameids = sorted({gameid for _, gameid in latest})
+    with transaction.atomic():
+        # The scores being replaced, so the stats can take the difference.
+        previous = {
+            (user_id, gameid): (score, lines_cleared, level)
+            for user_id, gameid, score, lines_cleared, level in TetrisScore.objects.filter(
+                gameid__in=gameids, user_id__in={user_id for user_id, _ in latest}
+            ).values_list('user_id', 'gameid', 'score', 'lines_cleared', 'level')
+            if (user_id, gameid) in latest
+        }
+        created = upsert_scores((user_id, gameid, *row) for (user_id, gameid), row in latest.items())
+        for gameid in gameids:
+            lock_game(gameid)
+        games = defaultdict(list)
+        for user_id, gameid in created:
+            games[gameid].append(user_id)
+        for gameid in sorted(games):
+            record_game(gameid, games[gameid])
+        new = set(created)
+        stats = []
+        for (user_id, gameid), (score, lines_cleared, level) in latest.items():
+            if (user_id, gameid) in new:
+                stats.append((user_id, 1, score, lines_cleared, level))
+            elif (user_id, gameid) in previous:
+                _, old_lines, old_level = previous[(user_id, gameid)]
+                stats.append((user_id, 0, score, lines_cleared - old_lines, level - old_level))
+        add_scores(stats)
+
+        # Each game as it is now, with the other players' committed scores,
+        # and as it was before these scores were saved.
+        after = defaultdict(dict)
+        for gameid, user_id, score in TetrisScore.objects.filter(gameid__in=gameids).values_list(
+            'gameid', 'user_id', 'score'
+        ):
+            after[gameid][user_id] = score
+        before = {gameid: dict(game) for gameid, game in after.items()}
+        for user_id, gameid in latest:
+            if (user_id, gameid) in new:
+                before[gameid].pop(user_id, None)
+            elif (user_id, gameid) in previous:
+                before[gameid][user_id] = previous[(user_id, gameid)][0]
+        record_results((before[gameid], after[gameid]) for gameid in gameids if gameid in after)
+    return len(created)
+
+def upsert_scores(scores) -> list:
+    """
+    Saves scores with a single INSERT ... ON CONFLICT (gameid, user_id) DO
+    UPDATE statement per UPSERT_BATCH_SIZE rows, instead of the SELECT
+    followed by an INSERT or UPDATE of update_or_create. A score already
+    saved for the player and game is overwritten but keeps its timestamp.
+    The unique constraint makes concurrent submissions of the same score
+    safe: one inserts, the others update.
+
+    Args:
+        scores: Iterable of (user_id, gameid, score, lines_cleared, level).
+            Of several scores for the same player and game, the last wins.
+
+    Returns:
+        list: (user_id, gameid) of the scores that were inserted rather
+        than updated, e.g. to count the game in the head-to-head table.
+    """
+    rows = {(gameid, user_id): (score, lines_cleared, level)
+            for user_id, gameid, score, lines_cleared, level in scores}
+    if not rows:
+        return []
+
+    quote = connection.ops.quote_name
+    table = quote(TetrisScore._meta.db_table)
+    columns = ", ".join(quote(column) for column in ("gameid", "user_id", "score", "lines_cleared", "level", "timestamp"))
+    updates = ", ".join(f"{quote(column)} = EXCLUDED.{quote(column)}" for column in ("score", "lines_cleared", "level"))
+    # Each call stamps its rows with one timestamp, which an update leaves
+    # alone: a returned row carrying it was inserted by this statement.
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+    created = []
+    items = list(rows.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), UPSERT_BATCH_SIZE):
+            batch = items[start:start + UPSERT_BATCH_SIZE]
+            values = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(batch))
+            params = [
+                value
+                for (gameid, user_id), (score, lines_cleared, level) in batch
+                for value in (gameid, user_id, score, lines_cleared, level, now)
+            ]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {values} "
+                f"ON CONFLICT ({quote('gameid')}, {quote('user_id')}) DO UPDATE SET {updates} "
+                f"RETURNING {quote('user_id')}, {quote('gameid')}, {quote('timestamp')} = %s",
+                params + [now]
+            )
+            created.extend((user_id, gameid) for user_id, gameid, inserted in cursor.fetchall() if inserted)
+    return created
+
+def _encode_cursor(timestamp: datetime, score_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{score_id}".encode()).decode()
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        timestamp, score_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(score_id)
+    except ValueError:
+        raise ScoreError("Invalid cursor.")
+
+def get_score_page(user_id: int, cursor: Optional[str] = None, limit: int = SCORE_PAGE_SIZE) -> dict:
+    """
+    Returns one page of the games a player took part in, newest first, with
+    every player's score in each. It is a single query whatever the length
+    of the history: the page of the player's own score rows, found by
+    keyset on (timestamp, id) through the (user, timestamp) index, is a
+    subquery selecting the games, joined to the users table only for the
+    usernames.
+
+    Args:
+        user_id (int): The player whose games to list.
+        cursor (str, optional): The "next" value of the previous page.
+        limit (int): Games per page.
+
+    Returns:
+        dict: "scores", each with gameid, user (the username), score,
+        lines_cleared, level and timestamp, grouped by game with the
+        highest score first; and "next", the cursor of the following page,
+        or None on the last one.
+    """
+    own = TetrisScore.objects.filter(user_id=user_id)
+    if cursor:
+        timestamp, score_id = _decode_cursor(cursor)
+        own = own.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=score_id))
+    # One game more than the page, to tell whether there is a next page.
+    games = own.order_by('-timestamp', '-id').values('gameid')[:limit + 1]
+    rows = list(
+        TetrisScore.objects.filter(gameid__in=games)
+        .values('id', 'gameid', 'user_id', 'user__username', 'score', 'lines_cleared', 'level', 'timestamp')
+    )
+
+    own_rows = sorted(
+        (row for row in rows if row['user_id'] == user_id),
+        key=lambda row: (row['timestamp'], row['id']), reverse=True
+    )
+    next_cursor = None
+    if len(own_rows) > limit:
+        last = own_rows[limit - 1]
+        next_cursor = _encode_cursor(last['timestamp'], last['id'])
+        own_rows = own_rows[:limit]
+    order = {row['gameid']: position for position, row in enumerate(own_rows)}
+    rows = sorted(
+        (row for row in rows if row['gameid'] in order),
+        key=lambda row: (order[row['gameid']], -row['score'])
+    )
+    return {
+        "scores": [
+            {
+                "gameid": row['gameid'],
+                "user": row['user__username'],
+                "score": row['score'],
+                "lines_cleared": row['lines_cleared'],
+                "level": row['level'],
+                "timestamp": row['timestamp'],
+            }
+            for row in rows
+        ],
+        "next": next_cursor,
+    }
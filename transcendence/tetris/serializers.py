@@ -5,18 +5,27 @@ from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+class TetrisUserSerializer(serializers.ModelSerializer):
+    """
+    The user a score or player belongs to, by id and username only.
+    """
+    class Meta:
+        model = User
+        fields = ('id', 'username')
+
 class TetrisScoreSerializer(serializers.ModelSerializer):
     """
     Serializer to handle the TetrisScore model fields.
     """
+    user = TetrisUserSerializer(read_only=True)
+
     class Meta:
         model = TetrisScore
-        depth = 10
-        fields = ('gameid', 'user', 'score', 'lines_cleared', 'level')
-        fields = '__all__'
+        fields = ('id', 'gameid', 'user', 'score', 'lines_cleared', 'level', 'timestamp')
 
 class TetrisPlayerSerializer(serializers.ModelSerializer):
+    user = TetrisUserSerializer(read_only=True)
+
     class Meta:
         model = TetrisPlayer
-        depth = 10
         fields = ('user', 'matchmaking_rating')
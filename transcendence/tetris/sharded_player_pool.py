@@ -0,0 +1,271 @@
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Tuple
+import numpy as np
+from .active_player_manager import ActivePlayerManager, ActivePlayerManagerError, locked
+from .player_pool import MMRIndex
+
+class ShardedActivePlayerManager(ActivePlayerManager):
+    """
+    In-process pool split into MMR bands ("shards"), each with its own lock,
+    dict and MMR index, so joins, leaves and searches in unrelated rating
+    ranges do not wait on each other. Select it with
+    TETRIS_PLAYER_POOL_BACKEND = "tetris.sharded_player_pool.ShardedActivePlayerManager".
+
+    A player lives in the shard of the MMR captured when they joined.
+    shard_of maps user ids to shards for lookups; it is guarded by striped
+    locks keyed on the user id and is only trusted once the shard confirms
+    it still holds the player, because ticks and expiry drop players from
+    their shard first and from shard_of only once the shard is unlocked.
+
+    Locks are always taken in this order, and never in reverse:
+        self.lock (tickets and ticks) -> directory stripe -> shards, lowest first.
+    """
+    SHARD_WIDTH = 200  # MMR points per shard; ratings past the last band share the last shard.
+    SHARD_COUNT = 16
+    DIRECTORY_STRIPES = 64
+
+    def __init__(self, tick_interval: float = 0, group_size: int = 2, shard_width: int = None,
+                 shard_count: int = None):
+        super().__init__(tick_interval=tick_interval, group_size=group_size)
+        self.shard_width = shard_width or self.SHARD_WIDTH
+        self.shards = [ActivePlayerManager() for _ in range(shard_count or self.SHARD_COUNT)]
+        for shard in self.shards:
+            shard.clock = lambda: self.clock()
+        self.shard_of = {}
+        self.directory_locks = [threading.Lock() for _ in range(self.DIRECTORY_STRIPES)]
+
+    def _shard_index(self, mmr: int) -> int:
+        return min(max(int(mmr), 0) // self.shard_width, len(self.shards) - 1)
+
+    def _directory_lock(self, key) -> threading.Lock:
+        return self.directory_locks[hash(key) % len(self.directory_locks)]
+
+    @contextmanager
+    def _shards_locked(self, first: int, last: int):
+        """Holds the locks of shards first..last, acquired in ascending order."""
+        with ExitStack() as stack:
+            for shard in self.shards[first:last + 1]:
+                stack.enter_context(shard.lock)
+            yield self.shards[first:last + 1]
+
+    def _all_entries(self) -> list:
+        """Every entry sorted by MMR. The caller must hold all shard locks."""
+        return [
+            shard.active_players[uid] for shard in self.shards for uid in shard.mmr_index.ids.tolist()
+        ]
+
+    def _heartbeat(self, key) -> bool:
+        index = self.shard_of.get(key)
+        if index is None:
+            return False
+        shard = self.shards[index]
+        with shard.lock:
+            return shard._heartbeat(key)
+
+    def _forget(self, index: int, user_ids):
+        """
+        Drops the shard_of entries of players shard `index` no longer holds.
+        The caller must not hold any shard lock.
+        """
+        shard = self.shards[index]
+        for user_id in user_ids:
+            with self._directory_lock(user_id):
+                # The player may have joined again, possibly in another shard.
+                if self.shard_of.get(user_id) != index:
+                    continue
+                with shard.lock:
+                    if user_id not in shard.active_players:
+                        del self.shard_of[user_id]
+
+    def _cleanup_inactive_players(self):
+        for index, shard in enumerate(self.shards):
+            with shard.lock:
+                expired = shard._cleanup_inactive_players()
+            self._forget(index, expired)
+
+    def add_player(self, player):
+        if player is None:
+            raise ActivePlayerManagerError("Cannot add a None player.")
+
+        key = player.user.id
+        with self._directory_lock(key):
+            if self._heartbeat(key):
+                return "already active"
+
+        match_history, excluded = self._load_player_data(key)
+
+        mmr = player.matchmaking_rating
+        index = self._shard_index(mmr)
+        with self._directory_lock(key):
+            # Another request may have added the player while history was loading.
+            if self._heartbeat(key):
+                return "already active"
+            shard = self.shards[index]
+            with shard.lock:
+                shard._insert_player(key, player.user.username, mmr, match_history, excluded)
+            self.shard_of[key] = index
+        return "player added"
+
+    def remove_player(self, user):
+        key = user.id
+        with self._directory_lock(key):
+            index = self.shard_of.pop(key, None)
+            if index is not None:
+                shard = self.shards[index]
+                with shard.lock:
+                    if key in shard.active_players:
+                        shard._drop_player(key)
+                        return
+        raise ActivePlayerManagerError(f"Player with user ID '{key}' is not an active player.")
+
+    @locked
+    def clear_all_players(self):
+        super().clear_all_players()
+        with self._shards_locked(0, len(self.shards) - 1):
+            for shard in self.shards:
+                shard.clear_all_players()
+            self.shard_of.clear()
+
+    def update_exclusions(self, user_id: int, other_ids, blocked: bool = True):
+        for a, b in self._exclusion_pairs(user_id, other_ids):
+            index = self.shard_of.get(a)
+            if index is None:
+                continue
+            shard = self.shards[index]
+            with shard.lock:
+                shard._apply_exclusion(a, b, blocked)
+
+    def refresh_all_players_match_histories(self):
+        self._cleanup_inactive_players()
+        user_ids = []
+        for shard in self.shards:
+            with shard.lock:
+                user_ids.extend(shard.active_players.keys())
+        try:
+            histories = self.fetch_match_histories_from_db(user_ids)
+        except Exception as e:
+            raise ActivePlayerManagerError(
+                f"Failed to refresh match histories: {str(e)}"
+            ) from e
+        for shard in self.shards:
+            with shard.lock:
+                for user_id, data in shard.active_players.items():
+                    if user_id in histories:
+                        data.times_matched_with = histories[user_id]
+                        if data.times_matched_with:
+                            shard.mmr_index.mark(user_id, data.mmr)
+
+    def find_next_match(self, user=None) -> Tuple[str, str]:
+        self._cleanup_inactive_players()
+
+        if user is None:
+            with self._shards_locked(0, len(self.shards) - 1):
+                entries = self._all_entries()
+                if len(entries) < 2:
+                    return "", ""
+                return self._best_neighbour_pair(entries)
+
+        user_id = user.id
+        index = self.shard_of.get(user_id)
+        player_data = self.shards[index].active_players.get(user_id) if index is not None else None
+        if player_data is None:
+            raise ActivePlayerManagerError(f"Player with user ID '{user_id}' is not an active player.")
+
+        # Lock only the shards the player's MMR window overlaps.
+        now = self.clock()
+        mmr = player_data.mmr
+        window = self._allowed_window(player_data, now)
+        first, last = self._shard_index(mmr - window), self._shard_index(mmr + window)
+        with self._shards_locked(first, last) as shards:
+            # The player may have left or been paired while we were unlocked.
+            if user_id not in self.shards[index].active_players:
+                raise ActivePlayerManagerError(f"Player with user ID '{user_id}' is not an active player.")
+
+            ids, mmrs, owners = [], [], []
+            for offset, shard in enumerate(shards):
+                shard_ids, shard_mmrs = shard.mmr_index.candidates(mmr, window)
+                ids.append(shard_ids)
+                mmrs.append(shard_mmrs)
+                owners.append(np.full(len(shard_ids), first + offset))
+            user_ids, mmrs, owners = np.concatenate(ids), np.concatenate(mmrs), np.concatenate(owners)
+            others = self._allowed_candidates(player_data, user_ids)
+            if not others.any():
+                return "", ""
+            user_ids, mmrs, owners = user_ids[others], mmrs[others], owners[others]
+            best = int(np.argmax(self._score_candidates(player_data, user_ids, mmrs)))
+            opponent = self.shards[int(owners[best])].active_players[int(user_ids[best])]
+        return player_data.username, opponent.username
+
+    @locked
+    def run_matchmaking_tick(self) -> list:
+        current_time = self.clock()
+        self.last_tick = current_time
+        self._cleanup_inactive_players()
+        self._cleanup_expired_tickets()
+
+        with self._shards_locked(0, len(self.shards) - 1):
+            # The bands are in MMR order, so their indexes concatenate into one.
+            index = MMRIndex.from_arrays(*(
+                np.concatenate([getattr(shard.mmr_index, name) for shard in self.shards])
+                for name in ("mmrs", "ids", "joined", "ties")
+            ))
+            groups = self._optimal_groups(self._all_entries(), self.group_size, index=index)
+            matched = {}
+            for group in groups:
+                for data in group:
+                    matched.setdefault(self._shard_index(data.mmr), []).append(data.user_id)
+            for index, user_ids in matched.items():
+                shard = self.shards[index]
+                for user_id in user_ids:
+                    del shard.active_players[user_id]
+                shard.mmr_index.keep(~np.isin(shard.mmr_index.ids, np.array(user_ids, dtype=np.int64)))
+        for index, user_ids in matched.items():
+            self._forget(index, user_ids)
+        self._issue_tickets(groups, current_time)
+        return [tuple(data.user_id for data in group) for group in groups]
+
+    def _set_journal(self, journal):
+        # Shards log their own joins, leaves and exclusions; ticks and tickets are logged here.
+        super()._set_journal(journal)
+        for shard in self.shards:
+            shard.journal = journal
+
+    def _restore(self, players: dict, tickets: dict):
+        super()._restore({}, tickets)
+        bands = [{} for _ in self.shards]
+        for key, data in players.items():
+            index = self._shard_index(data.mmr)
+            bands[index][key] = data
+            self.shard_of[key] = index
+        for shard, band in zip(self.shards, bands):
+            with shard.lock:
+                shard._restore(band, {})
+
+    @locked
+    def save_snapshot(self):
+        with self._shards_locked(0, len(self.shards) - 1):
+            super().save_snapshot()
+
+    def _snapshot_entries(self) -> list:
+        return self._all_entries()
+
+    def get_active_usernames(self) -> list:
+        usernames = []
+        for shard in self.shards:
+            with shard.lock:
+                usernames.extend(data.username for data in shard.active_players.values())
+        return usernames
+
+    def get_queue_snapshot(self) -> Tuple[int, list]:
+        size = 0
+        players = []
+        for shard in self.shards:
+            with shard.lock:
+                size += len(shard.active_players)
+                if len(players) < self.QUEUE_BROADCAST_LIMIT:
+                    players.extend(
+                        data.username for data in shard.active_players.values()
+                    )
+        return size, players[:self.QUEUE_BROADCAST_LIMIT]
@@ -1,10 +1,18 @@
+import logging
 import random
 from typing import Optional, Tuple
 from collections import defaultdict
+from django.contrib.auth import get_user_model
 from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 from .models import TetrisScore, TetrisPlayer
-from .active_player_manager import active_player_manager  # Ensure correct import path
+from .active_player_manager import active_player_manager, ActivePlayerManagerError  # Ensure correct import path
+from .leaderboard import ratings_changed
+from .rating_history import record_ratings
+
+logger = logging.getLogger(__name__)
 
 @receiver(user_logged_in)
 def on_player_login(sender, request, user, **kwargs):
@@ -27,3 +35,51 @@ def on_player_logout(sender, request, user, **kwargs):
         active_player_manager.remove_player(player.name)
     except TetrisPlayer.DoesNotExist:
         pass  # Optionally, handle the case where TetrisPlayer does not exist
+
+@receiver(m2m_changed, sender=get_user_model().blocked.through)
+def on_block_list_changed(sender, instance, action, pk_set, **kwargs):
+    """
+    Signal handler for CustomUser.blocked changes. Updates the exclusion sets
+    of queued players once the change is committed, so a block takes effect
+    without reloading anyone's list from the database.
+    """
+    if action == "pre_clear":
+        # clear() does not report which users it removes, so note them first.
+        instance._cleared_block_ids = set(instance.blocked.values_list("id", flat=True))
+        return
+    if action == "post_clear":
+        pk_set = instance.__dict__.pop("_cleared_block_ids", set())
+    elif action not in ("post_add", "post_remove"):
+        return
+    if not pk_set:
+        return
+
+    user_id, other_ids, blocked = instance.pk, set(pk_set), action == "post_add"
+
+    def apply():
+        try:
+            active_player_manager.update_exclusions(user_id, other_ids, blocked)
+        except ActivePlayerManagerError:
+            # Sets are reloaded from the database when the players next queue.
+            logger.exception("Failed to update matchmaking exclusions for user ID '%s'", user_id)
+
+    transaction.on_commit(apply)
+
+@receiver(post_save, sender=TetrisPlayer)
+def on_player_saved(sender, instance, created, **kwargs):
+    """
+    Signal handler for TetrisPlayer saves, e.g. a new player. Moves the
+    player on the leaderboard once the save is committed, and starts a new
+    player's rating history.
+    """
+    if created:
+        record_ratings({instance.user_id: instance.matchmaking_rating})
+    ratings_changed({instance.user_id: instance.matchmaking_rating})
+
+@receiver(post_delete, sender=TetrisPlayer)
+def on_player_deleted(sender, instance, **kwargs):
+    """
+    Signal handler for TetrisPlayer deletions. Drops the player from the
+    leaderboard once the deletion is committed.
+    """
+    ratings_changed({instance.user_id: None})
@@ -1,3 +1,20 @@
+function renderActivePlayers(activePlayers) {
+	const activePlayersList = document.getElementById('infoList');
+	if (!activePlayersList) {
+		console.error("Element with id 'infoList' not found on the page.");
+		return;
+	}
+
+	activePlayersList.innerHTML = '';
+	activePlayers.forEach(username => {
+		const li = document.createElement('li');
+		li.id = 'listItemTetris';
+		li.className = 'list-group-item';
+		li.textContent = username;
+		activePlayersList.appendChild(li);
+	});
+}
+
 async function updateActivePlayers() {
 	try {
 		if (tetrisPageLoaded == false) return;
@@ -9,28 +26,60 @@ async function updateActivePlayers() {
 			console.error("No active_players key found in the API response.");
 			return;
 		}
-
-		const activePlayersList = document.getElementById('infoList');
-		if (!activePlayersList) {
-			console.error("Element with id 'infoList' not found on the page.");
-			return;
-		}
-
-		activePlayersList.innerHTML = '';
-		activePlayers.forEach(username => {
-			const li = document.createElement('li');
-			li.id = 'listItemTetris';
-			li.className = 'list-group-item';
-			li.textContent = username;
-			activePlayersList.appendChild(li);
-		});
+		renderActivePlayers(activePlayers);
 	} catch (error) {
 		console.error('Error fetching active players:', error);
 	}
 }
 
+// -----------------------------------------------------------------------------
+// Matchmaking socket: the server pushes queue updates and match tickets.
+// Polling is only used while the socket is unavailable.
+// -----------------------------------------------------------------------------
+let matchmakingSocket = null;
+let activePlayersPollTimer = null;
+
+function startActivePlayersPolling() {
+	if (activePlayersPollTimer === null)
+		activePlayersPollTimer = setInterval(updateActivePlayers, 5000);
+}
+
+function stopActivePlayersPolling() {
+	if (activePlayersPollTimer !== null) {
+		clearInterval(activePlayersPollTimer);
+		activePlayersPollTimer = null;
+	}
+}
+
+function connectMatchmakingSocket() {
+	if (!JWTs || !JWTs.access) {
+		// Not logged in yet: poll until a token exists, then retry the socket.
+		startActivePlayersPolling();
+		setTimeout(connectMatchmakingSocket, 5000);
+		return;
+	}
+	const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+	const url = `${scheme}://${window.location.host}/ws/tetris/matchmaking/?token=${encodeURIComponent(JWTs.access)}`;
+	matchmakingSocket = new WebSocket(url);
+
+	matchmakingSocket.onopen = () => stopActivePlayersPolling();
+	matchmakingSocket.onmessage = async (message) => {
+		const event = JSON.parse(message.data);
+		if (event.type === 'queue') {
+			if (tetrisPageLoaded) renderActivePlayers(event.players);
+		} else if (event.type === 'match') {
+			await startMatchedGame("tetris", event);
+		}
+	};
+	matchmakingSocket.onclose = () => {
+		matchmakingSocket = null;
+		startActivePlayersPolling();
+		setTimeout(connectMatchmakingSocket, 5000);
+	};
+}
+
 window.addEventListener('DOMContentLoaded', () => {
-	setInterval(updateActivePlayers, 5000);
+	connectMatchmakingSocket();
 });
 
 async function launchCustomTetrisGameTreePlayer(jwtTokens) {
@@ -140,8 +189,18 @@ async function searching_for_game_match(gameName) {
 		console.log(response.player2);
 		console.log(response.player1);
 	}
+	await startMatchedGame(gameName, response);
+}
+
+// Starts the game for a match, whether it was polled or pushed over the matchmaking socket.
+async function startMatchedGame(gameName, response) {
 	if (!response || !response.player1?.trim() || !response.player2?.trim()) return;
 
+	if (response.player3?.trim()) {
+		await startMatchedThreePlayerGame(gameName, response);
+		return;
+	}
+
 	const puppetToken = await awaitingPupperResponse(response.player2);
 	console.log("PRINTING PUPPET TOKEN", puppetToken);
 	if (puppetToken && puppetToken.status == 401) return;
@@ -156,6 +215,19 @@ async function searching_for_game_match(gameName) {
 	console.log(puppetToken);
 }
 
+// Three-player matches are formed by the matchmaking tick when it runs in group mode.
+async function startMatchedThreePlayerGame(gameName, response) {
+	const tokens = [JWTs];
+	for (const username of [response.player2, response.player3]) {
+		const puppetToken = await awaitingPupperResponse(username);
+		if (!puppetToken || puppetToken.status == 401) return;
+		tokens.push(puppetToken.value);
+	}
+	if (gameName == "tetris") {
+		await launchCustomTetrisGameTreePlayer(tokens);
+	}
+}
+
 async function startTetrisGame() {
 	const matchConfig = { tournament: false, ranked: false };
 	const playerConfigs = [
@@ -286,6 +358,7 @@ async function launchTetrisGame(playerConfigs, matchConfig, g_id = 0) {
 		console.log(data);
 		playerNameEl.classList.add('player-name');
 		playerNameEl.textContent = data.username;
+		const username = data.username;
 		container.appendChild(playerNameEl);
 
 		mainContainer.appendChild(container);
@@ -293,6 +366,7 @@ async function launchTetrisGame(playerConfigs, matchConfig, g_id = 0) {
 		// Pass the onGameOver callback to the TetrisGame instance.
 		const gameInstance = new TetrisGame(`player${index + 1}`, config.controls, config.name, playerLost);
 		gameInstance.user = config.user;  // attach the JWT token as a property
+		gameInstance.username = username;
 		games[index] = gameInstance;
 		console.log(`Initialized game for ${config.name}`);
 	}
@@ -343,17 +417,39 @@ async function launchTetrisGame(playerConfigs, matchConfig, g_id = 0) {
 
 		document.body.appendChild(scoreboardContainer);
 
-		// Optionally, send each player's score to the backend.
-		for (const player of sortedPlayers) {
-			const payload = {
-				ranked: GlobalMatchConfig.ranked,
-				is_tournament: GlobalMatchConfig.tournament,
-				gameid: game_id,
-				score: player.score,
-				lines_cleared: player.linesCleared,
-				level: player.getLevel(),
-			};
-			await sendGameDataToBackend(payload, player.user);
+		// Send every player's score to the backend in one request, with the
+		// first player's token; it holds a puppet grant from the others.
+		const payloads = sortedPlayers.map(player => ({
+			ranked: GlobalMatchConfig.ranked,
+			is_tournament: GlobalMatchConfig.tournament,
+			gameid: game_id,
+			score: player.score,
+			lines_cleared: player.linesCleared,
+			level: player.getLevel(),
+		}));
+		const batch = await sendGameBatchToBackend(
+			payloads.map((payload, i) => ({ ...payload, username: sortedPlayers[i].username })),
+			games[0].user
+		);
+		if (batch) return;
+		// Fall back to one request per player, each with their own token.
+		for (let i = 0; i < sortedPlayers.length; i++) {
+			await sendGameDataToBackend(payloads[i], sortedPlayers[i].user);
+		}
+	}
+
+	async function sendGameBatchToBackend(scores, hostJWT) {
+		try {
+			const data = await apiRequest("/tetris/save_tetris_scores/batch", "POST", hostJWT, { scores: scores });
+			if (!data || data.error) {
+				console.warn("Batch score submission failed:", data && data.error);
+				return false;
+			}
+			console.log("Scores processed successfully:", data);
+			return true;
+		} catch (error) {
+			console.warn("Batch score submission failed:", error);
+			return false;
 		}
 	}
 
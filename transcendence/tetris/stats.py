@@ -0,0 +1,147 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import Greatest
+from .models import TetrisScore, TetrisStats
+
+def _ensure_rows(user_ids) -> None:
+    TetrisStats.objects.bulk_create([TetrisStats(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+
+def add_scores(scores) -> None:
+    """
+    Adds saved scores to their players' TetrisStats, with one UPDATE per
+    player. Call it in the transaction that saves the scores.
+
+    Args:
+        scores: Iterable of (user_id, games, score, lines_cleared, level),
+            games being 1 for a new score and 0 for one replacing the
+            player's earlier score for the game, whose lines_cleared and
+            level are then the differences to the earlier score. The best
+            score only ever goes up.
+    """
+    totals = defaultdict(lambda: [0, 0, 0, 0])  # user_id -> [games, best score, lines, levels]
+    for user_id, games, score, lines_cleared, level in scores:
+        total = totals[user_id]
+        total[0] += games
+        total[1] = max(total[1], score)
+        total[2] += lines_cleared
+        total[3] += level
+    if not totals:
+        return
+    _ensure_rows(totals)
+    for user_id, (games, best_score, lines, levels) in sorted(totals.items()):
+        TetrisStats.objects.filter(user_id=user_id).update(
+            games=F('games') + games,
+            best_score=Greatest('best_score', best_score),
+            total_lines=F('total_lines') + lines,
+            total_level=F('total_level') + levels,
+        )
+
+_NO_RESULT = object()  # What a player had in a game before it had a result.
+
+def _results(game: dict) -> dict:
+    """
+    Returns {user_id: outcome} for a game of at least two players: True for
+    the single top score, None for a tied top score and False for the
+    rest. A game of a single player has no result.
+    """
+    if len(game) < 2:
+        return {}
+    top = max(game.values())
+    tied = sum(score == top for score in game.values()) > 1
+    return {user_id: None if score == top and tied else score == top for user_id, score in game.items()}
+
+def _advance(stats: TetrisStats, won, was=_NO_RESULT) -> None:
+    """Counts a player's outcome in a game, replacing the outcome `was` counted for it before."""
+    if was is not _NO_RESULT:
+        stats.wins -= was is True
+        stats.losses -= was is False
+    if won:
+        stats.wins += 1
+        if was is not True:
+            stats.win_streak += 1
+            stats.best_win_streak = max(stats.best_win_streak, stats.win_streak)
+    else:
+        stats.losses += won is False
+        if was is _NO_RESULT or was is True:
+            stats.win_streak = 0
+
+def record_results(games) -> int:
+    """
+    Counts the wins and losses of games and advances or ends the players'
+    win streaks. A game's result changes as its scores come in, so each
+    game is given as it was before and after a save, and only players
+    whose outcome changed are touched: a win that became a loss is taken
+    back and ends the streak. save_scores calls it in the transaction that
+    saves the scores, holding the games' locks; the players' rows are
+    locked in primary key order.
+
+    Args:
+        games: Iterable of (before, after) pairs of {user_id: score} dicts,
+            one per game, in the order they finished. Games of a single
+            player have no result.
+
+    Returns:
+        int: The number of players whose stats changed.
+    """
+    changes = defaultdict(list)
+    for before, after in games:
+        was = _results(before)
+        for user_id, won in _results(after).items():
+            if user_id not in was or was[user_id] is not won:
+                changes[user_id].append((won, was.get(user_id, _NO_RESULT)))
+    if not changes:
+        return 0
+    _ensure_rows(changes)
+    rows = list(TetrisStats.objects.select_for_update().filter(user_id__in=list(changes)).order_by('pk'))
+    for stats in rows:
+        for won, was in changes[stats.user_id]:
+            _advance(stats, won, was)
+    TetrisStats.objects.bulk_update(rows, ['wins', 'losses', 'win_streak', 'best_win_streak'])
+    return len(rows)
+
+def rebuild_tetris_stats(chunk_size: int = 10000) -> int:
+    """
+    Recomputes TetrisStats from every TetrisScore: the score counters over
+    all scores, the results over every game, replayed in the order they
+    finished. Used to backfill existing data.
+
+    Returns:
+        int: The number of players written.
+    """
+    with transaction.atomic():
+        stats = {
+            row['user_id']: TetrisStats(user_id=row['user_id'], games=row['games'], best_score=row['best_score'],
+                                        total_lines=row['total_lines'], total_level=row['total_level'])
+            for row in TetrisScore.objects.values('user_id').order_by().annotate(
+                games=Count('id'), best_score=Max('score'), total_lines=Sum('lines_cleared'), total_level=Sum('level')
+            )
+        }
+        games, finished_at = defaultdict(dict), {}
+        rows = TetrisScore.objects.order_by('gameid', 'id').values_list('gameid', 'user_id', 'score', 'timestamp')
+        for gameid, user_id, score, timestamp in rows.iterator(chunk_size=chunk_size):
+            games[gameid][user_id] = score
+            finished_at[gameid] = max(finished_at.get(gameid, timestamp), timestamp)
+        for gameid in sorted(games, key=lambda gameid: (finished_at[gameid], gameid)):
+            for user_id, won in _results(games[gameid]).items():
+                _advance(stats[user_id], won)
+        TetrisStats.objects.all().delete()
+        TetrisStats.objects.bulk_create(stats.values(), batch_size=1000)
+    return len(stats)
+
+def get_tetris_stats(user_id: int) -> dict:
+    """
+    Returns a player's Tetris stats, all zero if they never played, with
+    the lines cleared and level reached per game averaged.
+    """
+    stats = TetrisStats.objects.filter(user_id=user_id).first() or TetrisStats(user_id=user_id)
+    return {
+        "games": stats.games,
+        "wins": stats.wins,
+        "losses": stats.losses,
+        "best_score": stats.best_score,
+        "average_lines": round(stats.total_lines / stats.games, 1) if stats.games else 0,
+        "average_level": round(stats.total_level / stats.games, 1) if stats.games else 0,
+        "win_streak": stats.win_streak,
+        "best_win_streak": stats.best_win_streak,
+    }
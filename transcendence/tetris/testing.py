@@ -0,0 +1,53 @@
+import subprocess
+import sys
+from types import SimpleNamespace
+from django.conf import settings
+from .active_player_manager import ActivePlayerManager, ActivePlayerManagerError
+from .redis_player_pool import RedisActivePlayerManager
+from .sharded_player_pool import ShardedActivePlayerManager
+
+
+class OfflineHistoryMixin:
+    """Replaces the database history and block list lookups; both start empty."""
+
+    def fetch_match_histories_from_db(self, user_ids) -> dict:
+        return {uid: {} for uid in user_ids}
+
+    def fetch_exclusions_from_db(self, user_ids) -> dict:
+        return {uid: set() for uid in user_ids}
+
+
+class OfflineActivePlayerManager(OfflineHistoryMixin, ActivePlayerManager):
+    """ActivePlayerManager that never touches the database."""
+    pass
+
+
+class OfflineRedisActivePlayerManager(OfflineHistoryMixin, RedisActivePlayerManager):
+    """RedisActivePlayerManager that never touches the database."""
+    pass
+
+
+class OfflineShardedActivePlayerManager(OfflineHistoryMixin, ShardedActivePlayerManager):
+    """ShardedActivePlayerManager that never touches the database."""
+    pass
+
+
+def make_fake_player(user_id: int, mmr: int):
+    """Builds a stand-in with the attributes ActivePlayerManager reads from a TetrisPlayer."""
+    user = SimpleNamespace(id=user_id, username=f"player_{user_id}")
+    return SimpleNamespace(user=user, matchmaking_rating=mmr)
+
+
+def start_matchmaker() -> tuple:
+    """Starts tetris_matchmaker on a free local port with an offline pool; returns (process, url)."""
+    process = subprocess.Popen(
+        [sys.executable, str(settings.BASE_DIR / "manage.py"), "tetris_matchmaker",
+         "--port", "0", "--sweep-interval", "0", "--state-dir", "",
+         "--backend", "tetris.testing.OfflineActivePlayerManager"],
+        stdout=subprocess.PIPE, text=True
+    )
+    line = process.stdout.readline()
+    if not line.startswith("Matchmaker listening on "):
+        process.kill()
+        raise ActivePlayerManagerError(f"Matchmaking service failed to start: {line!r}")
+    return process, line.split()[-1]
@@ -1,3 +1,852 @@
-from django.test import TestCase
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest import skipUnless
+from unittest.mock import patch
+import numpy as np
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from .active_player_manager import ActivePlayerManagerError, active_player_manager
+from .calculate_mmr import INITIAL_RATING, apply_match_results, calculate_new_ratings
+from .head_to_head import get_pair
+from .leaderboard import Leaderboard
+from .models import TetrisPlayer, TetrisRatingDaily, TetrisRatingHistory, TetrisRatingPeriod, TetrisScore
+from .player_pool import MMRIndex
+from .rating_history import get_rating_chart, record_ratings, rollup_rating_history
+from .rating_engines import EloEngine, Glicko2Engine, RatingEngine
+from .rating_periods import run_rating_period, start_rating_periods, stop_rating_periods
+from .rating_rebuild import rebuild_ratings
+from .redis_player_pool import RedisActivePlayerManager
+from .remote_player_pool import RemoteActivePlayerManager
+from .routing import websocket_urlpatterns
+from .score_buffer import ScoreWriteBuffer
+from .scores import ScoreError, get_score_page, parse_score, save_scores
+from .stats import get_tetris_stats, rebuild_tetris_stats, record_results
+from .testing import OfflineActivePlayerManager, OfflineShardedActivePlayerManager, make_fake_player, start_matchmaker
 
-# Create your tests here.
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+User = get_user_model()
+
+
+class HeadToHeadTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+
+    def test_scores_saved_together_count_the_pair_once(self):
+        save_scores([(self.alice.id, 'g1', 100, 1, 1), (self.bob.id, 'g1', 50, 1, 1)])
+        self.assertEqual(get_pair(self.alice.id, self.bob.id).games, 1)
+
+    def test_scores_saved_apart_count_the_pair_once(self):
+        save_scores([(self.alice.id, 'g1', 100, 1, 1)])
+        save_scores([(self.bob.id, 'g1', 50, 1, 1)])
+        save_scores([(self.bob.id, 'g1', 60, 1, 1)])  # A resubmission is not a new game.
+        self.assertEqual(get_pair(self.alice.id, self.bob.id).games, 1)
+
+
+@skipUnless(fakeredis, "fakeredis is not installed, see requirements-dev.txt")
+class RedisPoolTests(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.client = fakeredis.FakeRedis(decode_responses=True)
+        self.manager = self._manager()
+        self.players = [
+            TetrisPlayer.objects.create(user=User.objects.create_user(name, password='x'), matchmaking_rating=mmr)
+            for name, mmr in [('alice', 1000), ('bob', 1010), ('carol', 2000), ('dave', 2020)]
+        ]
+
+    def _manager(self):
+        manager = RedisActivePlayerManager(client=self.client)
+        manager.clock = lambda: self.now
+        return manager
+
+    def _add_all(self):
+        for player in self.players:
+            self.manager.add_player(player)
+
+    def test_add_and_heartbeat(self):
+        alice = self.players[0]
+        self.assertEqual(self.manager.add_player(alice), "player added")
+        self.assertEqual(self.manager.add_player(alice), "already active")
+        self.assertEqual(self.manager.get_active_usernames(), ['alice'])
+
+    def test_a_heartbeat_racing_a_claim_adds_the_player_again(self):
+        alice = self.players[0]
+        self.manager.add_player(alice)
+        player_key = self.manager._key("player", alice.user_id)
+        pipeline = self.client.pipeline
+
+        def claimed_after_the_check():
+            # The first pipeline sees the player queued, then a tick on
+            # another worker claims them before the heartbeat is written.
+            pipe = pipeline()
+            multi = pipe.multi
+
+            def claim_then_multi():
+                self.client.delete(player_key)
+                multi()
+
+            pipe.multi = claim_then_multi
+            self.client.pipeline = pipeline
+            return pipe
+
+        self.client.pipeline = claimed_after_the_check
+        self.assertEqual(self.manager.add_player(alice), "player added")
+        self.assertEqual(self.client.hget(player_key, "username"), 'alice')
+        self.assertEqual(self.manager.get_active_usernames(), ['alice'])
+
+    def test_players_without_heartbeat_expire(self):
+        alice, bob = self.players[:2]
+        self.manager.add_player(alice)
+        self.manager.add_player(bob)
+        self.now += self.manager.INACTIVITY_THRESHOLD / 2
+        self.manager.add_player(bob)
+        self.now += self.manager.INACTIVITY_THRESHOLD / 2 + 1
+        self.manager._cleanup_inactive_players()
+        self.assertEqual(self.manager.get_active_usernames(), ['bob'])
+
+    def test_find_next_match_pairs_the_closest_mmr(self):
+        self._add_all()
+        self.assertEqual(self.manager.find_next_match(self.players[0].user), ('alice', 'bob'))
+        self.assertEqual(self.manager.find_next_match(self.players[3].user), ('dave', 'carol'))
+
+    def test_tick_issues_tickets_once(self):
+        self._add_all()
+        self.now += self.manager.MAX_WAIT  # Every window is unbounded by now.
+        alice, bob, carol, dave = (player.user_id for player in self.players)
+        self.assertEqual(sorted(self.manager.run_matchmaking_tick()), [(alice, bob), (carol, dave)])
+        self.assertEqual(self.manager.take_match_ticket(self.players[1].user)["player2"], 'alice')
+        self.assertIsNone(self.manager.take_match_ticket(self.players[1].user))
+        self.assertEqual(self.manager.get_active_usernames(), [])
+
+    def test_two_workers_cannot_claim_the_same_players(self):
+        self._add_all()
+        self.now += self.manager.MAX_WAIT
+        other = self._manager()
+        groups = other._optimal_groups(other._queue_entries(), other.group_size)
+        self.assertEqual(len(self.manager.run_matchmaking_tick()), 2)
+        self.assertFalse(other._claim(groups, self.now))
+        self.assertEqual(self.manager.get_match_metrics()["matches"], 2)
+
+
+class MMRIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = MMRIndex()
+        self.index.BLOCK_SIZE = 4  # Split blocks early.
+        self.entries = []
+
+    def _insert(self, user_id, mmr):
+        self.index.insert(user_id, mmr, joined_at=float(user_id))
+        self.entries.append((mmr, user_id))
+
+    def _assert_matches(self):
+        self.entries.sort()
+        self.assertEqual(len(self.index), len(self.entries))
+        self.assertEqual(self.index.mmrs.tolist(), [mmr for mmr, _ in self.entries])
+        self.assertEqual(self.index.ids.tolist(), [user_id for _, user_id in self.entries])
+        self.assertEqual(self.index.joined.tolist(), [float(user_id) for _, user_id in self.entries])
+
+    def test_stays_sorted_through_inserts_and_removals(self):
+        rng = random.Random(3)
+        for user_id in range(200):
+            self._insert(user_id, rng.randint(900, 1100))
+        self._assert_matches()
+        self.assertGreater(len(self.index.blocks), 1)
+        for mmr, user_id in rng.sample(self.entries, 150):
+            self.index.remove(user_id, mmr)
+            self.entries.remove((mmr, user_id))
+        self.index.remove(999, 1000)  # Not indexed.
+        self._assert_matches()
+
+    def test_candidates_are_the_window(self):
+        rng = random.Random(4)
+        for user_id in range(100):
+            self._insert(user_id, rng.randint(0, 200))
+        for mmr, width in [(100, 10), (0, 0), (-50, 20), (100, 1000)]:
+            ids, mmrs = self.index.candidates(mmr, width)
+            expected = sorted((m, u) for m, u in self.entries if mmr - width <= m <= mmr + width)
+            self.assertEqual(list(zip(mmrs.tolist(), ids.tolist())), expected)
+
+    def test_mark_and_keep(self):
+        for user_id, mmr in [(1, 1000), (2, 1000), (3, 990), (4, 1010), (5, 1020)]:
+            self._insert(user_id, mmr)
+        self.index.ties  # Marks must reach arrays already built.
+        self.index.mark(2, 1000)
+        self.assertEqual(self.index.ties.tolist(), [False, False, True, False, False])
+        self.index.keep(self.index.ids != 1)
+        self.entries.remove((1000, 1))
+        self._assert_matches()
+        self.assertEqual(self.index.ties.tolist(), [False, True, False, False])
+
+
+class ShardedPoolTests(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.manager = OfflineShardedActivePlayerManager()
+        self.manager.clock = lambda: self.now
+        self.players = [make_fake_player(user_id, mmr) for user_id, mmr in [(1, 1000), (2, 1010), (3, 2000)]]
+        for player in self.players:
+            self.manager.add_player(player)
+
+    def test_tick_forgets_matched_players(self):
+        self.now += self.manager.MAX_WAIT
+        self.assertEqual(self.manager.run_matchmaking_tick(), [(1, 2)])
+        self.assertEqual(list(self.manager.shard_of), [3])
+
+    def test_expiry_forgets_expired_players(self):
+        self.now += self.manager.INACTIVITY_THRESHOLD / 2
+        self.manager.add_player(self.players[2])
+        self.now += self.manager.INACTIVITY_THRESHOLD / 2 + 1
+        self.manager.sweep()
+        self.assertEqual(list(self.manager.shard_of), [3])
+        self.manager.add_player(self.players[0])
+        self.assertEqual(self.manager.shard_of[1], self.manager._shard_index(1000))
+
+
+class MatchMetricsTests(SimpleTestCase):
+    def test_only_ticks_record_matches(self):
+        for backend in (OfflineActivePlayerManager, OfflineShardedActivePlayerManager):
+            with self.subTest(backend=backend.__name__):
+                manager = backend()
+                alice, bob = make_fake_player(1, 1000), make_fake_player(2, 1010)
+                manager.add_player(alice)
+                manager.add_player(bob)
+                for _ in range(3):
+                    self.assertEqual(manager.find_next_match(alice.user), ('player_1', 'player_2'))
+                self.assertEqual(manager.get_match_metrics()["matches"], 0)
+                manager.run_matchmaking_tick()
+                self.assertEqual(manager.get_match_metrics()["matches"], 1)
+
+class GroupingTests(SimpleTestCase):
+    def setUp(self):
+        self.manager = OfflineActivePlayerManager()
+        self.manager.clock = lambda: 1000.0
+        for user_id, mmr in [(1, 1000), (2, 1001), (3, 1002), (4, 1003)]:
+            self.manager.add_player(make_fake_player(user_id, mmr))
+
+    def _pairs(self, index=True):
+        entries = self.manager._snapshot_entries()
+        groups = self.manager._optimal_groups(entries, 2, index=self.manager.mmr_index if index else None)
+        return sorted(tuple(data.user_id for data in group) for group in groups)
+
+    def test_neighbours_are_paired(self):
+        self.assertEqual(self._pairs(), [(1, 2), (3, 4)])
+
+    def test_blocks_and_repeats_reach_the_index(self):
+        self.manager.update_exclusions(1, [2])
+        self.assertEqual(self._pairs(), [(2, 3)])
+        self.manager.update_exclusions(1, [2], blocked=False)
+        self.manager.fetch_match_histories_from_db = lambda user_ids: {1: {2: 3}, 2: {1: 3}, 3: {}, 4: {}}
+        self.manager.refresh_all_players_match_histories()
+        self.assertEqual(self._pairs(), [(2, 3)])
+        self.assertEqual(self._pairs(index=False), [(2, 3)])
+
+def _pool_is_consistent(manager) -> bool:
+    """Checks that every pool's dict and MMR index agree and that no player is queued twice."""
+    pools = getattr(manager, "shards", [manager])
+    seen = set()
+    for pool in pools:
+        index = pool.mmr_index
+        keys = set(pool.active_players)
+        if set(index.ids.tolist()) != keys or len(index) != len(keys) or keys & seen:
+            return False
+        if any(pool.active_players[uid].mmr != mmr for uid, mmr in zip(index.ids.tolist(), index.mmrs.tolist())):
+            return False
+        if np.any(np.diff(index.mmrs) < 0):
+            return False
+        seen |= keys
+    return True
+
+
+class PoolStressTests(SimpleTestCase):
+    """
+    Hammers the single-lock and the sharded pool with random joins, leaves
+    and pair searches from several threads, and from several asyncio tasks
+    through the a* API. "Not active" errors are expected under contention;
+    anything else is a bug, and the pool must be consistent afterwards.
+    """
+    BACKENDS = (OfflineActivePlayerManager, OfflineShardedActivePlayerManager)
+    WORKERS = 8
+    OPS = 500
+
+    def setUp(self):
+        rng = random.Random(0)
+        self.players = [make_fake_player(user_id, int(rng.gauss(1200, 300))) for user_id in range(1, 1001)]
+
+    def _manager(self, backend):
+        manager = backend()
+        for player in self.players[:len(self.players) // 2]:
+            manager.add_player(player)
+        return manager
+
+    def _step(self, manager, rng: random.Random, unexpected: list):
+        player = rng.choice(self.players)
+        operation = rng.random()
+        try:
+            if operation < 0.4:
+                manager.add_player(player)
+            elif operation < 0.6:
+                manager.remove_player(player.user)
+            else:
+                manager.find_next_match(player.user)
+        except ActivePlayerManagerError:
+            pass
+        except Exception as e:
+            unexpected.append(e)
+
+    async def _astep(self, manager, rng: random.Random, unexpected: list):
+        player = rng.choice(self.players)
+        operation = rng.random()
+        try:
+            if operation < 0.4:
+                await manager.aadd_player(player)
+            elif operation < 0.6:
+                await manager.aremove_player(player.user)
+            else:
+                await manager.afind_next_match(player.user)
+        except ActivePlayerManagerError:
+            pass
+        except Exception as e:
+            unexpected.append(e)
+
+    def test_threads(self):
+        for backend in self.BACKENDS:
+            with self.subTest(backend=backend.__name__):
+                manager, unexpected = self._manager(backend), []
+
+                def hammer(seed):
+                    rng = random.Random(seed)
+                    for _ in range(self.OPS):
+                        self._step(manager, rng, unexpected)
+
+                threads = [threading.Thread(target=hammer, args=(i,)) for i in range(self.WORKERS)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(unexpected, [])
+                self.assertTrue(_pool_is_consistent(manager))
+
+    def test_asyncio(self):
+        for backend in self.BACKENDS:
+            with self.subTest(backend=backend.__name__):
+                manager, unexpected = self._manager(backend), []
+
+                async def hammer(seed):
+                    rng = random.Random(seed)
+                    for _ in range(self.OPS):
+                        await self._astep(manager, rng, unexpected)
+
+                async def run_all():
+                    await asyncio.gather(*(hammer(i) for i in range(self.WORKERS)))
+
+                asyncio.run(run_all())
+                self.assertEqual(unexpected, [])
+                self.assertTrue(_pool_is_consistent(manager))
+
+
+class MatchmakerServiceTests(SimpleTestCase):
+    """Runs tetris_matchmaker in a child process on a free port and drives it through RemoteActivePlayerManager."""
+
+    def setUp(self):
+        process, url = start_matchmaker()
+        self.addCleanup(process.wait, timeout=10)
+        self.addCleanup(process.terminate)
+        self.manager = RemoteActivePlayerManager(url=url)
+        self.addCleanup(self.manager.session.close)
+
+    def test_round_trip(self):
+        alice, bob = make_fake_player(1, 1000), make_fake_player(2, 1010)
+        self.assertEqual(self.manager.add_player(alice), "player added")
+        self.assertEqual(self.manager.add_player(alice), "already active")
+        self.manager.add_player(bob)
+        self.assertEqual(self.manager.get_queue_snapshot(), (2, ['player_1', 'player_2']))
+        self.assertEqual(self.manager.find_next_match(alice.user), ('player_1', 'player_2'))
+
+        self.assertEqual(self.manager.run_matchmaking_tick(), [(1, 2)])
+        self.assertEqual(self.manager.take_match_ticket(bob.user)["player2"], 'player_1')
+        self.assertIsNone(self.manager.take_match_ticket(bob.user))
+        self.assertEqual(self.manager.get_match_metrics()["matches"], 1)
+
+    def test_errors_come_back_as_manager_errors(self):
+        with self.assertRaises(ActivePlayerManagerError):
+            self.manager.remove_player(make_fake_player(3, 1000).user)
+
+
+class ScoreIngestionTests(TransactionTestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+
+    def test_out_of_range_values_are_rejected(self):
+        for key in ('score', 'lines_cleared', 'level'):
+            data = {'gameid': 'g1', 'score': 100, 'lines_cleared': 1, 'level': 1, key: 2 ** 31}
+            with self.subTest(key=key), self.assertRaises(ScoreError):
+                parse_score(data, self.alice.id)
+
+    def test_flush_drops_only_the_rejected_score(self):
+        buffer = ScoreWriteBuffer(flush_interval=60)
+        self.addCleanup(buffer.stop)
+        missing_user = self.alice.id + 1000
+        buffer.submit([(self.alice.id, 'g1', 100, 1, 1), (missing_user, 'g1', 50, 1, 1), (self.alice.id, 'g2', 70, 1, 1)])
+        with self.assertLogs('tetris.score_buffer', 'ERROR'):
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(sorted(TetrisScore.objects.values_list('gameid', flat=True)), ['g1', 'g2'])
+
+
+class ScorePageTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.others = [User.objects.create_user(f'player{i}', password='x') for i in range(3)]
+
+    def _play(self, games: int) -> list:
+        gameids = [f'g{i}' for i in range(games)]
+        save_scores(
+            (user.id, gameid, random.randint(0, 2000), random.randint(0, 40), random.randint(1, 10))
+            for gameid in gameids for user in [self.alice] + random.sample(self.others, random.randint(0, 2))
+        )
+        # Three games a second, so the cursor has ties on the timestamp to break by id.
+        start = timezone.now()
+        for i, gameid in enumerate(gameids):
+            TetrisScore.objects.filter(gameid=gameid).update(timestamp=start + timedelta(seconds=i // 3))
+        return gameids
+
+    def _walk(self, limit: int) -> list:
+        gameids, cursor = [], None
+        while True:
+            page = get_score_page(self.alice.id, cursor, limit)
+            own = [row['gameid'] for row in page['scores'] if row['user'] == 'alice']
+            self.assertLessEqual(len(own), limit)
+            gameids.extend(own)
+            cursor = page['next']
+            if cursor is None:
+                return gameids
+
+    def test_a_page_is_a_single_query(self):
+        for games in (3, 60):
+            with self.subTest(games=games):
+                TetrisScore.objects.all().delete()
+                self._play(games)
+                with self.assertNumQueries(1):
+                    first = get_score_page(self.alice.id, limit=20)
+                if first['next']:
+                    with self.assertNumQueries(1):
+                        get_score_page(self.alice.id, first['next'], 20)
+
+    def test_walking_the_cursor_returns_every_game_once(self):
+        gameids = self._play(47)
+        for limit in (1, 7, 20, 100):
+            with self.subTest(limit=limit):
+                walked = self._walk(limit)
+                self.assertEqual(len(walked), len(set(walked)))
+                self.assertEqual(set(walked), set(gameids))
+                # Newest first; the games were saved in order, so within a second too.
+                self.assertEqual(walked, gameids[::-1])
+
+    def test_an_invalid_cursor_is_a_bad_request(self):
+        self._play(3)
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(self.alice)
+        response = client.get(reverse('tetris_get_scores'), {'cursor': 'not a cursor'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid cursor.'})
+        self.assertEqual(client.get(reverse('tetris_get_scores')).status_code, 200)
+
+
+class TetrisStatsTests(TestCase):
+    def setUp(self):
+        self.alice, self.bob, self.carol = (User.objects.create_user(name, password='x') for name in ('alice', 'bob', 'carol'))
+
+    def _results(self, user) -> tuple:
+        stats = get_tetris_stats(user.id)
+        return stats['wins'], stats['losses'], stats['win_streak'], stats['best_win_streak']
+
+    def test_record_results_counts_changed_outcomes_only(self):
+        a, b, c = self.alice.id, self.bob.id, self.carol.id
+        self.assertEqual(record_results([({}, {a: 300, b: 100}), ({}, {a: 200, b: 150})]), 2)
+        self.assertEqual(self._results(self.alice), (2, 0, 2, 2))
+        self.assertEqual(self._results(self.bob), (0, 2, 0, 0))
+        # Carol's late score takes Alice's second win back; Bob's loss stands.
+        self.assertEqual(record_results([({a: 200, b: 150}, {a: 200, b: 150, c: 400})]), 2)
+        self.assertEqual(self._results(self.alice), (1, 1, 0, 2))
+        self.assertEqual(self._results(self.bob), (0, 2, 0, 0))
+        self.assertEqual(self._results(self.carol), (1, 0, 1, 1))
+        # A tie is neither, and a single player's game has no result.
+        record_results([({}, {a: 100, b: 100}), ({}, {c: 50})])
+        self.assertEqual(self._results(self.alice), (1, 1, 0, 2))
+        self.assertEqual(self._results(self.bob), (0, 2, 0, 0))
+        self.assertEqual(self._results(self.carol), (1, 0, 1, 1))
+
+    def test_results_follow_scores_as_they_are_saved(self):
+        save_scores([(self.alice.id, 'g1', 300, 3, 2)])
+        self.assertEqual(self._results(self.alice), (0, 0, 0, 0))
+        save_scores([(self.bob.id, 'g1', 100, 1, 1)])
+        self.assertEqual(self._results(self.alice), (1, 0, 1, 1))
+        self.assertEqual(self._results(self.bob), (0, 1, 0, 0))
+        # A resubmitted score replaces the result it had.
+        save_scores([(self.bob.id, 'g1', 500, 1, 1)])
+        self.assertEqual(self._results(self.alice), (0, 1, 0, 1))
+        self.assertEqual(self._results(self.bob), (1, 0, 1, 1))
+        self.assertEqual(get_tetris_stats(self.bob.id)['games'], 1)
+
+    def test_incremental_stats_match_a_rebuild(self):
+        players = [self.alice, self.bob, self.carol]
+        for game in range(40):
+            save_scores(
+                (user.id, f'g{game}', random.randint(0, 5), random.randint(0, 40), random.randint(1, 10))
+                for user in random.sample(players, random.randint(1, 3))
+            )
+        incremental = [get_tetris_stats(user.id) for user in players]
+        rebuild_tetris_stats()
+        self.assertEqual([get_tetris_stats(user.id) for user in players], incremental)
+
+
+class RatingPeriodTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(name, password='x') for name in ('alice', 'bob', 'carol')]
+        for user in self.users:
+            TetrisPlayer.objects.create(user=user, matchmaking_rating=INITIAL_RATING)
+
+    def _ratings(self) -> list:
+        return list(TetrisPlayer.objects.order_by('user_id').values_list(
+            'matchmaking_rating', 'rating_deviation', 'rating_volatility', 'rating_period'
+        ))
+
+    def test_a_late_score_does_not_rate_its_game_again(self):
+        alice, bob, carol = self.users
+        save_scores([(alice.id, 'g1', 300, 3, 2), (bob.id, 'g1', 100, 1, 1)])
+        first = run_rating_period(now=timezone.now(), settle=0)
+        self.assertEqual(first["games"], {"duel": 1, "multiplayer": 0})
+        rated = self._ratings()
+        self.assertEqual(rated[2], (INITIAL_RATING, 350.0, 0.06, 0))
+
+        # Carol's score comes in after the game was rated as a duel.
+        save_scores([(carol.id, 'g1', 500, 5, 3)])
+        second = run_rating_period(now=timezone.now(), settle=0)
+        self.assertEqual(second["games"], {"duel": 0, "multiplayer": 0})
+        self.assertEqual(second["skipped_games"], 1)
+        self.assertEqual(self._ratings(), rated)
+        self.assertFalse(TetrisScore.objects.filter(rating_period__isnull=True).exists())
+        self.assertIsNone(run_rating_period(now=timezone.now(), settle=0)["period"])
+
+    def test_games_still_settling_wait_for_the_next_period(self):
+        alice, bob, carol = self.users
+        save_scores([(alice.id, 'g1', 300, 3, 2), (bob.id, 'g1', 100, 1, 1), (carol.id, 'g1', 200, 2, 2)])
+        self.assertIsNone(run_rating_period(settle=60)["period"])
+        result = run_rating_period(now=timezone.now() + timedelta(seconds=61), settle=60)
+        self.assertEqual(result["games"], {"duel": 0, "multiplayer": 1})
+        self.assertEqual(TetrisScore.objects.filter(rating_period=result["period"]).count(), 3)
+
+    def test_a_rebuild_ends_where_the_periods_did(self):
+        alice, bob, carol = self.users
+        save_scores([(alice.id, 'g1', 300, 3, 2), (bob.id, 'g1', 100, 1, 1)])
+        save_scores([(alice.id, 'g2', 100, 3, 2), (carol.id, 'g2', 200, 1, 1)])
+        run_rating_period(now=timezone.now(), settle=0)
+        save_scores([(carol.id, 'g1', 500, 5, 3)])
+        save_scores([(alice.id, 'g3', 100, 1, 1), (bob.id, 'g3', 200, 2, 2), (carol.id, 'g3', 300, 3, 3)])
+        run_rating_period(now=timezone.now(), settle=0)
+        save_scores([(alice.id, 'g4', 100, 1, 1), (bob.id, 'g4', 200, 2, 2)])  # Not closed yet.
+        live = self._ratings()
+
+        TetrisPlayer.objects.update(matchmaking_rating=1500, rating_deviation=50, rating_period=0)
+        result = rebuild_ratings(dry_run=True)
+        self.assertEqual((result["periods"], result["games"]), (2, 3))
+        self.assertEqual(TetrisPlayer.objects.filter(matchmaking_rating=1500).count(), 3)
+        rebuild_ratings()
+        rebuilt = self._ratings()
+        for (rating, deviation, volatility, period), expected in zip(rebuilt, live):
+            self.assertEqual((rating, period), (expected[0], expected[3]))
+            self.assertAlmostEqual(deviation, expected[1])
+            self.assertAlmostEqual(volatility, expected[2])
+
+
+class RatingPeriodSchedulerTests(TransactionTestCase):
+    def test_finished_games_are_rated_without_running_the_command(self):
+        alice = User.objects.create_user('alice', password='x')
+        bob = User.objects.create_user('bob', password='x')
+        for user in (alice, bob):
+            TetrisPlayer.objects.create(user=user, matchmaking_rating=1000)
+        save_scores([(alice.id, 'g1', 300, 3, 2), (bob.id, 'g1', 100, 1, 1)])
+        with override_settings(TETRIS_RATING_PERIOD_INTERVAL=0):
+            start_rating_periods()
+        self.assertFalse(TetrisRatingPeriod.objects.exists())
+        with override_settings(TETRIS_RATING_PERIOD_INTERVAL=0.05, TETRIS_RATING_SETTLE=0):
+            start_rating_periods()
+            self.addCleanup(stop_rating_periods)
+            deadline = time.monotonic() + 10
+            while not TetrisRatingPeriod.objects.exists():
+                self.assertLess(time.monotonic(), deadline, "No rating period ran.")
+                time.sleep(0.05)
+            stop_rating_periods()
+        self.assertGreater(TetrisPlayer.objects.get(user=alice).matchmaking_rating, 1000)
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class MatchmakingConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+        for user in (self.alice, self.bob):
+            TetrisPlayer.objects.create(user=user, matchmaking_rating=1200)
+        active_player_manager.clear_all_players()
+        self.addCleanup(active_player_manager.clear_all_players)
+
+    def _socket(self, token):
+        return WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/tetris/matchmaking/?token={token}"
+        )
+
+    async def _receive(self, socket, kind):
+        while True:
+            message = await socket.receive_json_from(timeout=5)
+            if message["type"] == kind:
+                return message
+
+    async def test_an_invalid_token_is_refused(self):
+        connected, code = await self._socket("nope").connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4001)
+
+    async def test_the_opponent_is_pushed_the_match_a_request_pairs(self):
+        socket = self._socket(AccessToken.for_user(self.alice))
+        connected, _ = await socket.connect()
+        self.assertTrue(connected)
+        self.assertEqual(await socket.receive_json_from(timeout=5), {"type": "queue", "size": 0, "players": []})
+
+        def request_match():
+            for user in (self.alice, self.bob):
+                active_player_manager.add_player(TetrisPlayer.objects.get(user=user))
+            client = APIClient(SERVER_NAME='localhost')
+            client.force_authenticate(user=self.bob)
+            return client.get(reverse('tetris_next_match'))
+
+        response = await sync_to_async(request_match)()
+        self.assertEqual(response.json(), {"player1": "bob", "player2": "alice"})
+        self.assertEqual(await self._receive(socket, "match"), {"type": "match", "player1": "alice", "player2": "bob"})
+        await socket.disconnect()
+
+
+class RatingHistoryTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.today = timezone.localdate()
+
+    def _at(self, days_ago, hour):
+        day = self.today - timedelta(days=days_ago)
+        return timezone.make_aware(datetime.combine(day, datetime.min.time()) + timedelta(hours=hour))
+
+    def _day(self, days_ago):
+        return (self.today - timedelta(days=days_ago)).isoformat()
+
+    def _record(self, days_ago, hour, rating):
+        record_ratings({self.alice.id: rating}, at=self._at(days_ago, hour))
+
+    def _daily(self):
+        return {
+            (self.today - day).days: (low, high, close, changes)
+            for day, low, high, close, changes in TetrisRatingDaily.objects.filter(user=self.alice)
+            .values_list('day', 'low', 'high', 'close', 'changes')
+        }
+
+    def test_an_incremental_rollup_reads_again_from_the_last_day(self):
+        self._record(2, 10, 1200)
+        self._record(2, 20, 1180)
+        self._record(1, 9, 1210)
+        self.assertEqual(rollup_rating_history()["history_rows"], 3)
+        self.assertEqual(self._daily(), {2: (1180, 1200, 1180, 2), 1: (1210, 1210, 1210, 1)})
+
+        # The last rolled up day was incomplete: it is read again, the days before it are not.
+        self._record(1, 21, 1250)
+        self._record(0, 8, 1240)
+        result = rollup_rating_history()
+        self.assertEqual(result["since"], self._day(1))
+        self.assertEqual((result["history_rows"], result["daily_rows"]), (3, 2))
+        self.assertEqual(self._daily(), {
+            2: (1180, 1200, 1180, 2), 1: (1210, 1250, 1250, 2), 0: (1240, 1240, 1240, 1),
+        })
+
+        TetrisRatingDaily.objects.filter(user=self.alice).update(close=0)
+        self.assertEqual(rollup_rating_history(full=True)["history_rows"], 5)
+        self.assertEqual(self._daily()[2], (1180, 1200, 1180, 2))
+
+    def test_the_chart_adds_the_days_not_rolled_up_yet(self):
+        self._record(40, 12, 1100)
+        self._record(2, 10, 1200)
+        self._record(1, 9, 1210)
+        rollup_rating_history()
+        # Changes since the rollup: the rest of its last day, and today.
+        self._record(1, 21, 1190)
+        self._record(0, 8, 1240)
+        self._record(0, 9, 1230)
+        TetrisRatingHistory.objects.filter(timestamp__lt=self._at(1, 0)).delete()  # Only the rollup is left.
+
+        self.assertEqual(get_rating_chart(self.alice.id, days=30), [
+            {"day": self._day(2), "low": 1200, "high": 1200, "close": 1200},
+            {"day": self._day(1), "low": 1190, "high": 1210, "close": 1190},
+            {"day": self._day(0), "low": 1230, "high": 1240, "close": 1230},
+        ])
+        self.assertEqual(get_rating_chart(self.alice.id, days=60)[0],
+                         {"day": self._day(40), "low": 1100, "high": 1100, "close": 1100})
+
+
+class MatchResultTests(TestCase):
+    def setUp(self):
+        # Created in reverse, so primary key order differs from user order.
+        self.players = {
+            name: TetrisPlayer.objects.create(user=User.objects.create_user(name, password='x'), matchmaking_rating=mmr)
+            for name, mmr in [('carol', 1300), ('bob', 1200), ('alice', 1100)]
+        }
+        self.ids = {name: player.user_id for name, player in self.players.items()}
+
+    def _ratings(self):
+        return dict(TetrisPlayer.objects.values_list('user__username', 'matchmaking_rating'))
+
+    def test_results_apply_in_order(self):
+        alice, bob, carol = self.ids['alice'], self.ids['bob'], self.ids['carol']
+        history = TetrisRatingHistory.objects.count()
+        with self.captureOnCommitCallbacks() as callbacks:
+            apply_match_results([(alice, bob, 10, 5), (carol, alice, 7, 3)])
+        alice_rating, bob_rating = calculate_new_ratings(1100, 1200, 1)
+        carol_rating, alice_rating = calculate_new_ratings(1300, alice_rating, 1)
+        self.assertEqual(self._ratings(), {'alice': alice_rating, 'bob': bob_rating, 'carol': carol_rating})
+        self.assertEqual(TetrisRatingHistory.objects.count(), history + 3)
+        self.assertEqual(len(callbacks), 1)  # The leaderboard hears of it once committed.
+
+    def test_players_are_locked_in_primary_key_order(self):
+        with CaptureQueriesContext(connection) as queries:
+            apply_match_results([(self.ids['alice'], self.ids['carol'], 10, 5)])
+        select = next(query['sql'] for query in queries if query['sql'].startswith('SELECT'))
+        self.assertIn('ORDER BY "tetris_tetrisplayer"."id" ASC', select)
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', select)
+
+    def test_a_failed_batch_changes_nothing(self):
+        alice, bob, carol = self.ids['alice'], self.ids['bob'], self.ids['carol']
+        before, history = self._ratings(), TetrisRatingHistory.objects.count()
+        with self.assertRaises(ValueError):
+            apply_match_results([(alice, bob, 10, 5), (bob, carol, 4, 4)])  # A tie is rejected up front.
+        with self.assertRaises(ValueError):
+            apply_match_results([(alice, bob, 10, 5), (carol, 10 ** 6, 4, 2)])  # So is an unknown player.
+        with patch('tetris.calculate_mmr.record_ratings', side_effect=RuntimeError):
+            with self.captureOnCommitCallbacks() as callbacks, self.assertRaises(RuntimeError):
+                apply_match_results([(alice, bob, 10, 5)])
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self._ratings(), before)
+        self.assertEqual(TetrisRatingHistory.objects.count(), history)
+
+
+class RatingEngineTests(SimpleTestCase):
+    def _rate(self, engine, ratings, deviations, games, scores):
+        ratings, deviations = np.array(ratings, dtype=float), np.array(deviations, dtype=float)
+        return engine.rate(
+            ratings, deviations, np.full(len(ratings), 0.06), np.zeros(len(ratings)),
+            np.array(games), np.array(scores),
+        )
+
+    def test_engines_must_rate(self):
+        with self.assertRaises(TypeError):
+            RatingEngine()
+
+    def test_glicko2_matches_glickmans_example(self):
+        # "Example of the Glicko-2 system": a 1500/200 player beats 1400/30,
+        # then loses to 1550/100 and 1700/300 in the same rating period.
+        # Ratings are only ever compared, so the example's 1500 centre
+        # carries over to INITIAL_RATING unchanged. The paper rounds its
+        # intermediate steps and gets 1464.06; unrounded it is 1464.05.
+        ratings, deviations, volatilities = self._rate(
+            Glicko2Engine(), [1500, 1400, 1550, 1700], [200, 30, 100, 300],
+            [[0, 1], [0, 2], [0, 3]], [[1, 0], [0, 1], [0, 1]],
+        )
+        self.assertAlmostEqual(ratings[0], 1464.06, delta=0.02)
+        self.assertAlmostEqual(deviations[0], 151.52, places=2)
+        self.assertAlmostEqual(volatilities[0], 0.05999, delta=1e-5)
+
+    def test_elo_matches_a_single_duel(self):
+        ratings, _, _ = self._rate(EloEngine(), [1300, 1200], [350, 350], [[0, 1]], [[7, 3]])
+        self.assertEqual(tuple(np.round(ratings).astype(int)), calculate_new_ratings(1300, 1200, 1))
+
+    def test_a_multiplayer_game_weighs_as_much_as_a_duel(self):
+        # Each of the n - 1 pairwise results counts 1 / (n - 1): beating two
+        # equal opponents at once moves a player as far as beating one.
+        for engine in (EloEngine(), Glicko2Engine()):
+            with self.subTest(engine=engine.name):
+                three, deviations, _ = self._rate(
+                    engine, [1200, 1200, 1200], [100, 100, 100], [[0, 1, 2]], [[300, 200, 100]]
+                )
+                duel, duel_deviations, _ = self._rate(engine, [1200, 1200], [100, 100], [[0, 1]], [[300, 100]])
+                self.assertAlmostEqual(three[0], duel[0])
+                self.assertAlmostEqual(deviations[0], duel_deviations[0])
+                self.assertAlmostEqual(three[1], 1200)  # One win and one loss.
+                self.assertAlmostEqual(three[2], duel[1])
+
+    def test_players_without_results_are_unchanged(self):
+        for engine in (EloEngine(), Glicko2Engine()):
+            with self.subTest(engine=engine.name):
+                ratings, deviations, volatilities = self._rate(
+                    engine, [1200, 1300, 1400], [100, 100, 100], [[0, 1]], [[2, 1]]
+                )
+                self.assertEqual((ratings[2], deviations[2], volatilities[2]), (1400, 100, 0.06))
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.ids = {}
+        for name, mmr in [('eve', 1200), ('bob', 1400), ('alice', 1500), ('dave', 1300), ('carol', 1400)]:
+            user = User.objects.create_user(name, password='x')
+            TetrisPlayer.objects.create(user=user, matchmaking_rating=mmr)
+            self.ids[name] = user.id
+        self.board = Leaderboard(refresh_interval=float("inf"))
+        self.board.load()
+
+    def _ranks(self):
+        return [(row["rank"], row["user"], row["mmr"]) for row in self.board.top()["players"]]
+
+    def test_players_sharing_a_rating_share_a_rank(self):
+        self.assertEqual(self._ranks(), [
+            (1, 'alice', 1500), (2, 'bob', 1400), (2, 'carol', 1400), (4, 'dave', 1300), (5, 'eve', 1200),
+        ])
+        page = self.board.top(offset=2, limit=2)
+        self.assertEqual((page["size"], [row["user"] for row in page["players"]]), (5, ['carol', 'dave']))
+
+    def test_standing_has_rank_percentile_and_neighbours(self):
+        standing = self.board.standing(self.ids['carol'], radius=1)
+        self.assertEqual((standing["rank"], standing["mmr"], standing["size"]), (2, 1400, 5))
+        self.assertEqual(standing["percentile"], 50.0)  # Above dave and eve, of the four others.
+        self.assertEqual([row["user"] for row in standing["around"]], ['bob', 'carol', 'dave'])
+        self.assertEqual(self.board.standing(self.ids['alice'])["percentile"], 100.0)
+        self.assertEqual([row["user"] for row in self.board.standing(self.ids['alice'], radius=2)["around"]],
+                         ['alice', 'bob', 'carol'])
+        self.assertEqual(self.board.standing(self.ids['eve'])["percentile"], 0.0)
+        self.assertIsNone(self.board.standing(10 ** 6))
+
+    def test_updates_move_add_and_remove_players(self):
+        frank = User.objects.create_user('frank', password='x')
+        self.board.update({self.ids['dave']: 1450, frank.id: 1400, self.ids['alice']: None}, {frank.id: 'frank'})
+        self.assertEqual(self._ranks(), [
+            (1, 'dave', 1450), (2, 'bob', 1400), (2, 'carol', 1400), (2, 'frank', 1400), (5, 'eve', 1200),
+        ])
+        self.assertIsNone(self.board.standing(self.ids['alice']))
+        self.assertEqual(self.board.standing(frank.id, radius=0)["around"], [{"rank": 2, "user": 'frank', "mmr": 1400}])
+
+    def test_a_reload_matches_the_updates(self):
+        self.board.update({self.ids['eve']: 1600, self.ids['bob']: 1250})
+        TetrisPlayer.objects.filter(user_id=self.ids['eve']).update(matchmaking_rating=1600)
+        TetrisPlayer.objects.filter(user_id=self.ids['bob']).update(matchmaking_rating=1250)
+        updated = self._ranks()
+        self.board.load()
+        self.assertEqual(self._ranks(), updated)
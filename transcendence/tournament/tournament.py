@@ -2,7 +2,11 @@ import random
 import functools
 import datetime
 import uuid  # For generating unique game IDs
+import json
+import numpy as np
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User  # assuming Django’s built-in User model
+from transcendence.state_journal import StateJournal
 
 class TournamentError(Exception):
     """Custom exception for Tournament-related errors."""
@@ -19,7 +23,20 @@ def tournament_error_only(func):
             raise TournamentError(f"An unexpected error occurred in {func.__name__}: {str(e)}")
     return wrapper
 
+def journaled(func):
+    """Logs the tournament's state to its journal after every successful change."""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        result = func(self, *args, **kwargs)
+        self._log_state()
+        return result
+    return wrapper
+
 class Tournament:
+    # The state is small, so each log event is the whole state; the log is
+    # folded into a new snapshot once it holds this many events.
+    COMPACT_AFTER = 100
+
     def __init__(self):
         self.init = 0
         self.game = None
@@ -31,8 +48,10 @@ class Tournament:
         self.tournament_type = None  
         self.losers = []             # For double elimination (loser bracket)
         self.champion = None         # Store the winning User if tournament is over
+        self.journal = None          # StateJournal, once attach_journal() is called
 
     @tournament_error_only
+    @journaled
     def declare_game(self, game_name: str):
         if self.started:
             raise TournamentError("alreaddy started")
@@ -42,6 +61,7 @@ class Tournament:
         self.init = 1
 
     @tournament_error_only
+    @journaled
     def add_player(self, user: User) -> None:
         if self.started:
             raise TournamentError("Tournament already started – cannot add new users.")
@@ -50,6 +70,7 @@ class Tournament:
         self.players.append(user)
 
     @tournament_error_only
+    @journaled
     def remove_player(self, user: User) -> None:
         if self.started:
             raise TournamentError("Tournament already started – cannot remove users.")
@@ -60,6 +81,7 @@ class Tournament:
         raise TournamentError(f"User '{user.username}' is not registered.")
 
     @tournament_error_only
+    @journaled
     def start_tournament(self) -> dict:
         if self.init == 0:
             raise TournamentError("Tournament not setup with a game")
@@ -83,6 +105,7 @@ class Tournament:
         return {"players": [user.username for user in self.players], "round": round_info}
 
     @tournament_error_only
+    @journaled
     def generate_round(self, users_list: list) -> dict:
         """Generates the next round of matches for elimination tournaments."""
         if self.init == 0 or not self.started:
@@ -132,6 +155,7 @@ class Tournament:
         return {"matches": self.get_current_round_matches_info()}
 
     @tournament_error_only
+    @journaled
     def start_game(self, user=None) -> dict:
         """
         Starts the next pending match by generating a unique game ID and initializing its ping.
@@ -177,6 +201,7 @@ class Tournament:
 
 
     @tournament_error_only
+    @journaled
     def update_match(self, winner: User, loser: User, gameid: str) -> dict:
         """
         Expects:
@@ -285,6 +310,8 @@ class Tournament:
           - If the last ping was more than 5 minutes ago, marks it inactive.
           - Otherwise, updates the ping timestamp.
         If the game is not found, raises a TournamentError.
+        Only the first two change the bracket and are journaled; a routine
+        ping is liveness, which a restart resets (see restore_state).
         """
         now = datetime.datetime.now()
         # Search for the match with the specified gameid in all rounds.
@@ -293,11 +320,13 @@ class Tournament:
                 if match.get("gameid") == gameid:
                     if match["last_ping"] is None:
                         match["last_ping"] = now
+                        self._log_state()
                         return {"status": "activated", "message": "Game activated with ping."}
                     elif (now - match["last_ping"]).total_seconds() > 300:
                         # Ping is stale, mark game as inactive.
                         match["gameid"] = None
                         match["last_ping"] = None
+                        self._log_state()
                         return {"status": "stale", "message": "Ping timeout. Game marked as inactive."}
                     else:
                         # Update ping timestamp.
@@ -306,6 +335,7 @@ class Tournament:
         raise TournamentError("Game not found in tournament bracket.")
 
     @tournament_error_only
+    @journaled
     def cancel_tournament(self) -> None:
         self.init = 0
         self.game = None
@@ -316,6 +346,109 @@ class Tournament:
         self.tournament_type = None
         self.losers.clear()
 
+    def export_state(self) -> dict:
+        """The tournament as plain data, with users stored as ids."""
+        def user_id(user):
+            return user.id if user is not None else None
+
+        return {
+            "init": self.init,
+            "game": self.game,
+            "players": [user.id for user in self.players],
+            "started": self.started,
+            "rounds": [
+                [
+                    {
+                        **match,
+                        **{key: user_id(match[key]) for key in ("player1", "player2", "winner", "loser")},
+                        "last_ping": match["last_ping"].isoformat() if match["last_ping"] else None,
+                    }
+                    for match in round_matches
+                ]
+                for round_matches in self.rounds
+            ],
+            "current_round_index": self.current_round_index,
+            "tournament_type": self.tournament_type,
+            "losers": [user.id for user in self.losers],
+            "champion": user_id(self.champion),
+            "game_id_number": game_id_number,
+        }
+
+    def restore_state(self, state: dict) -> None:
+        """
+        Inverse of export_state; every user is loaded in one query. Routine
+        pings are not journaled, so a game pinged before the restart counts
+        as pinged now and times out normally if its players are gone.
+        """
+        now = datetime.datetime.now()
+        global game_id_number
+        user_ids = set(state["players"]) | set(state["losers"]) | {state["champion"]}
+        for round_matches in state["rounds"]:
+            for match in round_matches:
+                user_ids.update(match[key] for key in ("player1", "player2", "winner", "loser"))
+        user_ids.discard(None)
+        users = get_user_model().objects.in_bulk(user_ids)
+        missing = user_ids - users.keys()
+        if missing:
+            raise TournamentError(f"Users {sorted(missing)} of the saved tournament no longer exist.")
+
+        def user(user_id):
+            return users[user_id] if user_id is not None else None
+
+        self.init = state["init"]
+        self.game = state["game"]
+        self.players = [users[user_id] for user_id in state["players"]]
+        self.started = state["started"]
+        self.rounds = [
+            [
+                {
+                    **match,
+                    **{key: user(match[key]) for key in ("player1", "player2", "winner", "loser")},
+                    "last_ping": now if match["last_ping"] else None,
+                }
+                for match in round_matches
+            ]
+            for round_matches in state["rounds"]
+        ]
+        self.current_round_index = state["current_round_index"]
+        self.tournament_type = state["tournament_type"]
+        self.losers = [users[user_id] for user_id in state["losers"]]
+        self.champion = user(state["champion"])
+        game_id_number = max(game_id_number, state["game_id_number"])
+
+    @tournament_error_only
+    def attach_journal(self, path: str) -> None:
+        """
+        Restores the tournament from the snapshot and write-ahead log at
+        `path`, then journals every change there.
+        """
+        journal = StateJournal(path)
+        arrays, events = journal.open()
+        state = None
+        if arrays is not None:
+            state = json.loads(str(arrays["state"]))
+        if events:
+            state = events[-1]["state"]
+        try:
+            if state is not None:
+                self.restore_state(state)
+        except Exception:
+            journal.close()
+            raise
+        self.journal = journal
+        self._snapshot()
+
+    def _log_state(self) -> None:
+        if self.journal is None:
+            return
+        if self.journal.pending >= self.COMPACT_AFTER:
+            self._snapshot()
+        else:
+            self.journal.append("state", state=self.export_state())
+
+    def _snapshot(self) -> None:
+        self.journal.snapshot({"state": np.array(json.dumps(self.export_state()))})
+
 game_id_number: int = 0
 
 def get_game_id_number():
@@ -10,18 +10,42 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 import os
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ChatApp.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'transcendence.settings')
+
+# Set up Django before importing consumers, which load models.
+django_asgi_app = get_asgi_application()
+
+from transcendence.state_journal import restore_game_state
+
+# Reload the matchmaking pool and tournament saved before the last restart.
+restore_game_state()
+
+from tetris.active_player_manager import start_sweeper
+
+# Expire inactive players and run due ticks in the background.
+start_sweeper()
+
+from tetris.rating_periods import start_rating_periods
+
+# Rate finished games and count their wins and losses in the background.
+start_rating_periods()
 
 from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter , URLRouter
-from chat import routing
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+from tetris import routing as tetris_routing
+
+# Under daphne nothing else serves /static/ in development.
+if settings.DEBUG:
+    django_asgi_app = ASGIStaticFilesHandler(django_asgi_app)
 
 application = ProtocolTypeRouter(
     {
-        "http" : get_asgi_application() , 
+        "http" : django_asgi_app , 
         "websocket" : AuthMiddlewareStack(
             URLRouter(
-                routing.websocket_urlpatterns
+                tetris_routing.websocket_urlpatterns
             )    
         )
     }
@@ -53,11 +53,24 @@ INSTALLED_APPS = [
     'django_extensions'
 ]
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
+# Channel layer the matchmaking sockets are pushed through. Every server
+# process and the sweeper thread must share it, so it lives in Redis; an
+# empty CHANNEL_REDIS_URL falls back to the in-memory layer, which only
+# reaches sockets of the same process and event loop (e.g. tests).
+CHANNEL_REDIS_URL = os.getenv("CHANNEL_REDIS_URL", "redis://localhost:6379/1")
+if CHANNEL_REDIS_URL:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {"hosts": [CHANNEL_REDIS_URL]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer"
+        }
     }
-}
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -192,3 +205,60 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=24),
 }
+
+# Tetris matchmaking
+# Seconds between global pairing ticks; 0 keeps per-request pairing.
+TETRIS_MATCHMAKING_TICK = float(os.getenv("TETRIS_MATCHMAKING_TICK", 0))
+# Players per match formed by a tick: 2, or 3 for three-player games.
+TETRIS_MATCHMAKING_GROUP_SIZE = int(os.getenv("TETRIS_MATCHMAKING_GROUP_SIZE", 2))
+# Seconds between background sweeps that expire inactive players and run
+# due ticks; 0 disables the sweeper. Only the server processes (asgi.py,
+# wsgi.py) and tetris_matchmaker start one.
+TETRIS_SWEEP_INTERVAL = float(os.getenv("TETRIS_SWEEP_INTERVAL", 5))
+# Queue storage: the in-process pool,
+# "tetris.sharded_player_pool.ShardedActivePlayerManager" to lock it per MMR band, or
+# "tetris.redis_player_pool.RedisActivePlayerManager" to share it between workers, or
+# "tetris.remote_player_pool.RemoteActivePlayerManager" to use the tetris_matchmaker service.
+TETRIS_PLAYER_POOL_BACKEND = os.getenv(
+    "TETRIS_PLAYER_POOL_BACKEND", "tetris.active_player_manager.ActivePlayerManager"
+)
+# Standalone matchmaking service: its address, and the pool it keeps the queue in.
+TETRIS_MATCHMAKER_URL = os.getenv("TETRIS_MATCHMAKER_URL", "http://127.0.0.1:8765")
+TETRIS_MATCHMAKER_BACKEND = os.getenv(
+    "TETRIS_MATCHMAKER_BACKEND", "tetris.active_player_manager.ActivePlayerManager"
+)
+TETRIS_REDIS_URL = os.getenv("TETRIS_REDIS_URL", "redis://localhost:6379/0")
+
+# Tetris ratings
+# Engine rating each game type in a rating period: "elo" or "glicko2".
+TETRIS_RATING_ENGINES = {
+    "duel": os.getenv("TETRIS_DUEL_RATING_ENGINE", "elo"),
+    "multiplayer": os.getenv("TETRIS_MULTIPLAYER_RATING_ENGINE", "glicko2"),
+}
+# Seconds after a game's last score before a rating period rates it.
+TETRIS_RATING_SETTLE = float(os.getenv("TETRIS_RATING_SETTLE", 60))
+# Seconds between the rating periods the server processes (asgi.py,
+# wsgi.py) run in the background; 0, the default, runs none. A rating
+# period rates every finished game, ranked or not, so with it at 0
+# ratings only change when `manage.py tetris_rating_period` is run, e.g.
+# from cron. Wins, losses and streaks are counted as scores are saved.
+TETRIS_RATING_PERIOD_INTERVAL = float(os.getenv("TETRIS_RATING_PERIOD_INTERVAL", 0))
+# Seconds between full reloads of each process's cached leaderboard, which
+# picks up rating changes made by other processes.
+TETRIS_LEADERBOARD_REFRESH = float(os.getenv("TETRIS_LEADERBOARD_REFRESH", 60))
+
+# Tetris score ingestion
+# Seconds between flushes of the write-behind score buffer; 0 saves scores
+# within their request. Keep it well below TETRIS_RATING_SETTLE.
+TETRIS_SCORE_BUFFER_INTERVAL = float(os.getenv("TETRIS_SCORE_BUFFER_INTERVAL", 0))
+# Scores the buffer holds at most, and seconds a submission waits for room
+# when it is full before it is rejected with 503.
+TETRIS_SCORE_BUFFER_SIZE = int(os.getenv("TETRIS_SCORE_BUFFER_SIZE", 5000))
+TETRIS_SCORE_BUFFER_WAIT = float(os.getenv("TETRIS_SCORE_BUFFER_WAIT", 2))
+
+# Game state persistence
+# Directory where the server keeps snapshots and write-ahead logs of the
+# in-memory matchmaking pool and tournament, restored on startup; empty disables it.
+GAME_STATE_DIR = os.getenv("GAME_STATE_DIR", "")
+# Seconds between snapshots of the matchmaking pool, taken by the sweeper.
+TETRIS_SNAPSHOT_INTERVAL = float(os.getenv("TETRIS_SNAPSHOT_INTERVAL", 30))
@@ -0,0 +1,133 @@
+import fcntl
+import json
+import logging
+import os
+from typing import Optional, Tuple
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+class StateJournalError(Exception):
+    """Custom exception for StateJournal errors."""
+    pass
+
+class StateJournal:
+    """
+    Crash-safe storage for an in-memory structure: a compact snapshot
+    (`<path>.npz`, NumPy arrays of ids and numbers, never ORM objects) and a
+    write-ahead log (`<path>.wal`, one JSON event per line) of every change
+    made since. Restoring is loading the snapshot and replaying the log.
+
+    Events are numbered; the snapshot records the last number it includes,
+    so a crash between writing a snapshot and truncating the log cannot
+    replay an event twice. Events are written straight to the file, so they
+    survive a crash of the process, though not of the machine.
+
+    Only one process can own a journal: open() takes an exclusive lock on
+    the log and fails if another process holds it.
+    """
+
+    def __init__(self, path: str):
+        self.snapshot_path = f"{path}.npz"
+        self.log_path = f"{path}.wal"
+        self.seq = 0
+        self.pending = 0  # Events logged since the last snapshot.
+        self._fd = None
+
+    def open(self) -> Tuple[Optional[dict], list]:
+        """
+        Locks the journal and reads it back.
+
+        Returns:
+            tuple: (snapshot arrays, or None if there is no snapshot yet,
+            list of the events logged after the snapshot, oldest first).
+        """
+        fd = os.open(self.log_path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as e:
+            os.close(fd)
+            raise StateJournalError(f"Journal '{self.log_path}' is owned by another process.") from e
+
+        arrays = None
+        try:
+            if os.path.exists(self.snapshot_path):
+                with np.load(self.snapshot_path) as data:
+                    arrays = {name: data[name] for name in data.files}
+                self.seq = int(arrays.pop("_seq"))
+            with os.fdopen(os.dup(fd), "r") as log:
+                events = []
+                for line in log:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-write.
+                        break
+                    if event["seq"] > self.seq:
+                        events.append(event)
+        except Exception as e:
+            os.close(fd)
+            raise StateJournalError(f"Failed to read journal '{self.log_path}': {str(e)}") from e
+
+        if events:
+            self.seq = events[-1]["seq"]
+        self.pending = len(events)
+        self._fd = fd
+        return arrays, events
+
+    def append(self, kind: str, **data):
+        """Logs one event. The caller must hold the lock guarding the change it describes."""
+        self.seq += 1
+        self.pending += 1
+        event = {"seq": self.seq, "kind": kind, **data}
+        os.write(self._fd, (json.dumps(event, separators=(",", ":")) + "\n").encode())
+
+    def snapshot(self, arrays: dict):
+        """
+        Replaces the snapshot with `arrays` and empties the log. The caller
+        must hold every lock guarding the structure, so no event is logged
+        in between.
+        """
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, _seq=self.seq, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        os.ftruncate(self._fd, 0)
+        self.pending = 0
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def restore_game_state():
+    """
+    Restores the matchmaking pool and the tournament from GAME_STATE_DIR and
+    keeps journaling them there. Called from the server entry points, so
+    management commands neither restore nor write game state. A structure
+    whose journal cannot be opened (e.g. another worker owns it) runs
+    without persistence.
+    """
+    state_dir = getattr(settings, "GAME_STATE_DIR", "")
+    if not state_dir:
+        return
+    os.makedirs(state_dir, exist_ok=True)
+
+    from tetris.active_player_manager import ActivePlayerManagerError, active_player_manager
+    from tournament.tournament import TournamentError, g_tournament
+
+    targets = (
+        ("tetris_pool", active_player_manager, {
+            "snapshot_interval": getattr(settings, "TETRIS_SNAPSHOT_INTERVAL", 30)
+        }),
+        ("tournament", g_tournament, {}),
+    )
+    for name, target, options in targets:
+        try:
+            target.attach_journal(os.path.join(state_dir, name), **options)
+        except (StateJournalError, ActivePlayerManagerError, TournamentError) as e:
+            logger.warning("Not persisting %s: %s", name, e)
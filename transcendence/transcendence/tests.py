@@ -0,0 +1,84 @@
+import os
+import tempfile
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from tetris.testing import OfflineActivePlayerManager, make_fake_player
+from tournament.tournament import Tournament
+from .state_journal import StateJournal, StateJournalError, restore_game_state
+
+User = get_user_model()
+
+
+class GameStateRestoreTests(TestCase):
+    def setUp(self):
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        self.state_dir = state_dir.name
+        self.users = [User.objects.create_user(f"player{i}", password='x') for i in range(4)]
+
+    def _restart(self):
+        """Runs restore_game_state as a fresh server process would, on new globals."""
+        tournament, pool = Tournament(), OfflineActivePlayerManager()
+        with override_settings(GAME_STATE_DIR=self.state_dir), \
+                patch('tournament.tournament.g_tournament', tournament), \
+                patch('tetris.active_player_manager.active_player_manager', pool):
+            restore_game_state()
+        for structure in (tournament, pool):
+            if structure.journal is not None:
+                self.addCleanup(structure.journal.close)
+        return tournament, pool
+
+    def _crash(self, *structures):
+        """Drops the journals' locks as the process dying would, and tears the log mid-line."""
+        for structure in structures:
+            structure.journal.close()
+        with open(os.path.join(self.state_dir, "tournament.wal"), "a") as log:
+            log.write('{"seq":9999,"kind":"state","state":{"init":')
+
+    @staticmethod
+    def _comparable(state):
+        # Pings are not journaled: a restored game counts as pinged at restart.
+        for round_matches in state["rounds"]:
+            for match in round_matches:
+                match["last_ping"] = match["last_ping"] is not None
+        return state
+
+    def test_a_restart_resumes_from_the_snapshot_and_the_log(self):
+        tournament, pool = self._restart()
+        tournament.COMPACT_AFTER = 4  # Fold the first changes into a snapshot, log the rest.
+        tournament.declare_game("tetris")
+        for user in self.users:
+            tournament.add_player(user)
+        tournament.start_tournament()
+        game = tournament.start_game()
+        for user_id, mmr in [(1, 1000), (2, 1010), (3, 1500)]:
+            pool.add_player(make_fake_player(user_id, mmr))
+        pool.remove_player(make_fake_player(2, 1010).user)
+        self.assertGreater(tournament.journal.pending, 0)
+        self.assertTrue(os.path.exists(os.path.join(self.state_dir, "tournament.npz")))
+        expected = self._comparable(tournament.export_state())
+        self._crash(tournament, pool)
+
+        tournament, pool = self._restart()
+        self.assertEqual(self._comparable(tournament.export_state()), expected)
+        self.assertEqual(sorted(pool.get_active_usernames()), ["player_1", "player_3"])
+
+        # The restored tournament keeps journaling: the result survives the next restart.
+        winner, loser = (User.objects.get(username=game[key]) for key in ("player1", "player2"))
+        tournament.update_match(winner, loser, game["gameid"])
+        expected = self._comparable(tournament.export_state())
+        self._crash(tournament, pool)
+        tournament, _ = self._restart()
+        self.assertEqual(self._comparable(tournament.export_state()), expected)
+        self.assertEqual(tournament.rounds[0][0]["winner"], winner)
+
+    def test_a_journal_owned_by_another_process_is_not_opened(self):
+        owner = StateJournal(os.path.join(self.state_dir, "tournament"))
+        owner.open()
+        self.addCleanup(owner.close)
+        with self.assertRaises(StateJournalError):
+            StateJournal(os.path.join(self.state_dir, "tournament")).open()
+        with self.assertLogs('transcendence.state_journal', level='WARNING'):
+            tournament, _ = self._restart()
+        self.assertIsNone(tournament.journal)
@@ -14,3 +14,18 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'transcendence.settings')
 
 application = get_wsgi_application()
+
+from transcendence.state_journal import restore_game_state
+
+# Reload the matchmaking pool and tournament saved before the last restart.
+restore_game_state()
+
+from tetris.active_player_manager import start_sweeper
+
+# Expire inactive players and run due ticks in the background.
+start_sweeper()
+
+from tetris.rating_periods import start_rating_periods
+
+# Rate finished games and count their wins and losses in the background.
+start_rating_periods()